@@ -0,0 +1,243 @@
+import asyncio
+import itertools
+import os
+import time
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Execution backend for chord analysis, configurable per deployment:
+#   HARMONIQ_ANALYSIS_BACKEND  "thread" (default) or "process"
+#   HARMONIQ_ANALYSIS_WORKERS  number of worker threads/processes
+#   HARMONIQ_ANALYSIS_QUEUE    max pending audio chunks per session
+ANALYSIS_BACKEND = os.environ.get("HARMONIQ_ANALYSIS_BACKEND", "thread")
+ANALYSIS_WORKERS = int(os.environ.get("HARMONIQ_ANALYSIS_WORKERS", os.cpu_count() or 2))
+ANALYSIS_QUEUE_SIZE = int(os.environ.get("HARMONIQ_ANALYSIS_QUEUE", 32))
+
+# Detectors owned by this worker process (process backend only), keyed by lane id
+_worker_detectors = {}
+
+
+def _worker_process(lane_id, config, samples, sample_rate, channels):
+    """Run one chunk through the lane's detector inside a worker process
+
+    `config` is the parent detector's config(), so setting changes made on the
+    event loop follow the lane. Returns (detections, stage timings) for the
+    parent to replay.
+    """
+    from audio_chord_detector import AudioChordDetector
+    from metrics import StageLog
+
+    detector = _worker_detectors.get(lane_id)
+    if detector is None:
+        detector = AudioChordDetector()
+        _worker_detectors[lane_id] = detector
+    detector.configure(**config)
+
+    detections = []
+    detector.on_chord_detected = lambda chord, confidence, volume: detections.append(
+        (chord, float(confidence), float(volume))
+    )
+    detector.timings = StageLog()
+    detector.process_samples(samples, sample_rate, channels)
+    return detections, list(detector.timings)
+
+
+def _worker_release(lane_id):
+    """Drop a lane's detector state from a worker process"""
+    detector = _worker_detectors.pop(lane_id, None)
+    if detector:
+        detector.stop()
+
+
+class AnalysisPool:
+    """Runs chord analysis off the event loop on a thread or process pool"""
+
+    def __init__(self, backend=ANALYSIS_BACKEND, workers=ANALYSIS_WORKERS, queue_size=ANALYSIS_QUEUE_SIZE):
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown analysis backend: {backend}")
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self._lane_ids = itertools.count(1)
+        self._threads = None
+        # Process backend: one single-worker pool per shard, so a session's
+        # detector state always lives in the same process
+        self._shards = []
+        self._shard_load = []
+        self._warm = None  # warm_up() function, rerun in replacement shards
+        self.lanes = set()  # open lanes, watched by the load-shedding controller
+
+    def open_lane(self, detector):
+        """Create an ordered, bounded analysis lane for one session's detector"""
+        lane_id = next(self._lane_ids)
+        if self.backend == "thread":
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analysis")
+            lane = SessionLane(self, lane_id, detector, self._threads, None)
+            self.lanes.add(lane)
+            return lane
+
+        self._start_shards()
+        shard = min(range(self.workers), key=self._shard_load.__getitem__)
+        self._shard_load[shard] += 1
+        lane = SessionLane(self, lane_id, detector, None, shard)
+        self.lanes.add(lane)
+        return lane
+
+    def _start_shards(self):
+        if not self._shards:
+            self._shards = [ProcessPoolExecutor(max_workers=1) for _ in range(self.workers)]
+            self._shard_load = [0] * self.workers
+
+    def warm_up(self, warm):
+        """Run warm() once in every worker process now, rather than in the first sessions
+
+        Only the process backend needs this: threads share the caller's warmed caches.
+        """
+        if self.backend != "process":
+            return
+        self._warm = warm
+        self._start_shards()
+        for future in [executor.submit(warm) for executor in self._shards]:
+            future.result()
+
+    def shard_executor(self, shard):
+        return self._shards[shard]
+
+    def _restart_shard(self, shard, broken):
+        """Replace a shard whose worker process died; its lanes' detectors start afresh"""
+        if shard >= len(self._shards) or self._shards[shard] is not broken:
+            return  # Shut down, or another lane on the shard already replaced it
+        broken.shutdown(wait=False, cancel_futures=True)
+        executor = self._shards[shard] = ProcessPoolExecutor(max_workers=1)
+        if self._warm is not None:
+            executor.submit(self._warm)  # Queued ahead of the lanes' next chunks
+        print(f"♻️  Analysis shard {shard} restarted after its worker process died")
+
+    def _release_shard(self, shard):
+        if shard is not None:
+            self._shard_load[shard] -= 1
+
+    def shutdown(self):
+        """Stop all workers"""
+        if self._threads:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        for executor in self._shards:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._shards = []
+        self._shard_load = []
+
+
+class SessionLane:
+    """Per-session queue that feeds audio chunks to the pool strictly in order"""
+
+    def __init__(self, pool, lane_id, detector, executor, shard):
+        self.pool = pool
+        self.lane_id = lane_id
+        self.detector = detector
+        self._threads = executor
+        self.shard = shard
+        self.queue = asyncio.Queue(maxsize=pool.queue_size)
+        self.dropped_chunks = 0
+        self.coalesced_chunks = 0  # chunks merged into one analysis call while behind
+        self.latency = 0.0  # smoothed seconds from submit() to analysis done
+        self.last_analysed = 0.0  # perf_counter() when the last chunk finished
+        self._carry = None
+        self._job = None  # executor future of the chunk being analysed
+        self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    @property
+    def executor(self):
+        # Process shards are looked up each time, as a crashed one gets replaced
+        return self._threads if self.shard is None else self.pool.shard_executor(self.shard)
+
+    def submit(self, samples, sample_rate=None, channels=1):
+        """Queue a chunk for analysis; when the lane is full the oldest chunk is dropped"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped_chunks += 1
+        self.queue.put_nowait((samples, sample_rate, channels, time.perf_counter()))
+
+    def _coalesce(self, first):
+        """Merge everything already queued behind `first` into one chunk
+
+        When analysis falls behind, the backlog is handed to the detector in one
+        call, so its hop scheduler matches only the latest window instead of
+        working through stale ones. Chunks in a different format start the next batch.
+        """
+        samples, sample_rate, channels, submitted = first
+        batch = [samples]
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item[1] != sample_rate or item[2] != channels or item[0].dtype != samples.dtype:
+                self._carry = item
+                break
+            batch.append(item[0])
+            submitted = item[3]
+        if len(batch) > 1:
+            self.coalesced_chunks += len(batch) - 1
+            samples = np.concatenate(batch)
+        return samples, sample_rate, channels, submitted
+
+    async def _drain(self):
+        while True:
+            if self._carry is not None:
+                item, self._carry = self._carry, None
+            else:
+                item = await self.queue.get()
+            samples, sample_rate, channels, submitted = self._coalesce(item)
+            executor = self.executor
+            try:
+                if self.shard is None:
+                    # Thread backend: detector callbacks fire on the worker thread and
+                    # hand results back to the loop with call_soon_threadsafe
+                    self._job = executor.submit(self.detector.process_samples, samples, sample_rate, channels)
+                    await asyncio.wrap_future(self._job)
+                else:
+                    self._job = executor.submit(_worker_process, self.lane_id, self.detector.config(),
+                                                samples, sample_rate, channels)
+                    detections, timings = await asyncio.wrap_future(self._job)
+                    if self.detector.timings is not None:
+                        for stage, seconds in timings:
+                            self.detector.timings.observe(stage, seconds)
+                    for chord, confidence, volume in detections:
+                        if self.detector.on_chord_detected:
+                            self.detector.on_chord_detected(chord, confidence, volume)
+            except asyncio.CancelledError:
+                raise
+            except BrokenProcessPool:
+                # The shard's worker process died (and this chunk with it)
+                print(f"❌ Analysis worker for lane {self.lane_id} died; restarting shard {self.shard}")
+                self.pool._restart_shard(self.shard, executor)
+            except Exception as e:
+                print(f"❌ Analysis error in lane {self.lane_id}: {e}")
+            # Age of the newest audio just analysed, smoothed over recent chunks
+            self.last_analysed = time.perf_counter()
+            self.latency += 0.3 * (self.last_analysed - submitted - self.latency)
+
+    async def close(self):
+        """Stop the lane, discarding audio that has not been analysed yet
+
+        A chunk already running on the executor can't be cancelled, so it is
+        waited for: once this returns the detector is no longer in use.
+        """
+        self.pool.lanes.discard(self)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if self._job is not None and not self._job.done():
+            try:
+                await asyncio.wrap_future(self._job)
+            except Exception:
+                pass  # Its failure was the session's last chunk; nothing to report to
+        if self.shard is not None:
+            self.pool._release_shard(self.shard)
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.executor, _worker_release, self.lane_id)
+            except Exception as e:
+                print(f"❌ Error releasing lane {self.lane_id}: {e}")
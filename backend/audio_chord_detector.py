@@ -0,0 +1,241 @@
+import logging
+import time
+
+import numpy as np
+import librosa
+import soxr
+from enhanced_chord_detector import TEMPLATE_MATCHER
+from feature_extractors import create_extractor, DEFAULT_EXTRACTOR, FEATURE_EXTRACTORS
+from ring_buffer import AudioRingBuffer
+from audio_frames import to_mono_float32
+
+# Per-hop detail runs on the analysis workers for every session, so it goes to
+# the debug log rather than stdout
+logger = logging.getLogger(__name__)
+
+# Client sample rates analysed as-is (CQT kernels are built per rate); anything
+# outside this range is stream-resampled to DEFAULT_ANALYSIS_RATE first
+NATIVE_RATE_RANGE = (16000, 22050)
+DEFAULT_ANALYSIS_RATE = 16000
+
+# Chord matching runs once per hop of new audio, whatever the client packet size
+DEFAULT_ANALYSIS_HOP = 0.25  # seconds
+MIN_ANALYSIS_HOP = 0.05
+MAX_ANALYSIS_HOP = 2.0
+
+
+# Analysis quality levels, cheapest last; the server steps through them under load
+# (coarse_cqt starts at C3, which halves the CQT frame and drops a third of the bins).
+# "extractor": None keeps the session's own extractor; CQT settings apply to CQT sessions.
+QUALITY_LEVELS = (
+    {"name": "full", "hop_scale": 1, "extractor": None, "fmin": "C2", "bins_per_octave": 36, "n_octaves": 7},
+    {"name": "reduced_rate", "hop_scale": 2, "extractor": None, "fmin": "C2", "bins_per_octave": 36, "n_octaves": 7},
+    {"name": "coarse_cqt", "hop_scale": 2, "extractor": None, "fmin": "C3", "bins_per_octave": 24, "n_octaves": 5},
+    {"name": "stft", "hop_scale": 4, "extractor": "stft"},
+)
+
+
+def analysis_rate_for(sample_rate):
+    """Rate the chroma pipeline runs at for a given client sample rate"""
+    low, high = NATIVE_RATE_RANGE
+    return sample_rate if low <= sample_rate <= high else DEFAULT_ANALYSIS_RATE
+
+
+class AudioChordDetector:
+    """Chord detector that processes audio data from WebSocket clients
+
+    Only per-session state lives here; templates (TEMPLATE_MATCHER) and chroma
+    kernels are shared per process, and buffers are allocated on first audio,
+    so constructing one is cheap.
+    """
+
+    __slots__ = ("feature_extractor", "confidence_threshold", "sample_rate", "audio_buffer", "on_chord_detected",
+                 "analysis_hop", "samples_since_analysis", "analyses_skipped", "analysis_rate", "resampler",
+                 "chroma_stream", "quality_level", "_stream_quality", "timings")
+
+    def __init__(self, confidence_threshold=0.6, analysis_hop=DEFAULT_ANALYSIS_HOP,
+                 feature_extractor=DEFAULT_EXTRACTOR):
+        if feature_extractor not in FEATURE_EXTRACTORS:
+            raise ValueError(f"Unknown feature extractor: {feature_extractor}")
+        self.feature_extractor = feature_extractor
+        self.confidence_threshold = confidence_threshold
+        self.sample_rate = 16000  # Flutter app sample rate
+        self.audio_buffer = None  # Last second of incoming audio, allocated on first use
+        self.on_chord_detected = None
+
+        # Hop scheduler: samples received since the last chord match
+        self.analysis_hop = DEFAULT_ANALYSIS_HOP
+        self.set_analysis_hop(analysis_hop)
+        self.samples_since_analysis = 0
+        self.analyses_skipped = 0  # hops coalesced into a later analysis
+
+        # Streaming chroma at the client's rate; a stateful resampler only when the
+        # client rate can't be analysed natively. Each sample is handled once.
+        self.analysis_rate = analysis_rate_for(self.sample_rate)
+        self.resampler = None
+        self.chroma_stream = None
+
+        # Requested quality level; applied by the analysing thread on its next chunk
+        self.quality_level = 0
+        self._stream_quality = 0
+
+        # Per-stage timing sink (metrics.StageTimings or StageLog), set by the server
+        self.timings = None
+
+    def _lap(self, stage, started):
+        """Record the time since `started` for a stage; returns the new start time"""
+        now = time.perf_counter()
+        if self.timings is not None:
+            self.timings.observe(stage, now - started)
+        return now
+
+    def set_analysis_hop(self, seconds):
+        """Set how much new audio triggers a chord match (clamped to a sane range)"""
+        self.analysis_hop = max(MIN_ANALYSIS_HOP, min(MAX_ANALYSIS_HOP, float(seconds)))
+
+    def set_quality(self, level):
+        """Request a QUALITY_LEVELS entry (0 = full); safe to call from another thread"""
+        self.quality_level = max(0, min(len(QUALITY_LEVELS) - 1, int(level)))
+
+    def effective_hop(self):
+        """Seconds of new audio per chord match at the current quality level"""
+        return self.analysis_hop * QUALITY_LEVELS[self.quality_level]["hop_scale"]
+
+    def config(self):
+        """Settings needed to rebuild this detector elsewhere (e.g. in a worker process)"""
+        return {
+            "confidence_threshold": self.confidence_threshold,
+            "analysis_hop": self.analysis_hop,
+            "quality_level": self.quality_level,
+            "feature_extractor": self.feature_extractor,
+        }
+
+    def configure(self, confidence_threshold=None, analysis_hop=None, quality_level=None, feature_extractor=None):
+        """Apply settings produced by config()"""
+        if feature_extractor is not None and feature_extractor != self.feature_extractor:
+            # Chroma history is extractor-specific, so the stream is rebuilt
+            self.feature_extractor = feature_extractor
+            self.chroma_stream = None
+        if confidence_threshold is not None:
+            self.confidence_threshold = confidence_threshold
+        if analysis_hop is not None:
+            self.set_analysis_hop(analysis_hop)
+        if quality_level is not None:
+            self.set_quality(quality_level)
+
+    def _make_chroma_stream(self):
+        quality = QUALITY_LEVELS[self._stream_quality]
+        extractor = quality["extractor"] or self.feature_extractor
+        if extractor != "cqt":
+            return create_extractor(extractor, self.analysis_rate)
+        return create_extractor("cqt", self.analysis_rate, fmin=librosa.note_to_hz(quality["fmin"]),
+                                bins_per_octave=quality["bins_per_octave"], n_octaves=quality["n_octaves"])
+
+    def _switch_quality(self):
+        """Rebuild the chroma stream for a new quality level, primed with recent audio"""
+        self._stream_quality = self.quality_level
+        self.chroma_stream = self._make_chroma_stream()
+        if self.resampler is None:
+            # Native rate: the last second of input fills the new stream's history
+            self.chroma_stream.push(self.audio_buffer.latest(self.audio_buffer.capacity))
+        logger.info("🎚️  Analysis quality: %s", QUALITY_LEVELS[self._stream_quality]["name"])
+
+    def process_audio_data(self, audio_bytes):
+        """Process incoming audio data (raw 16-bit PCM bytes) and detect chords"""
+        self.process_samples(np.frombuffer(audio_bytes, dtype=np.int16))
+
+    def process_samples(self, samples, sample_rate=None, channels=1):
+        """Process decoded int16/float32 PCM samples and detect chords"""
+        try:
+            started = time.perf_counter()
+            if sample_rate and sample_rate != self.sample_rate:
+                # Client switched stream format; old samples are no longer comparable
+                self.sample_rate = sample_rate
+                self.reset()
+            if self.audio_buffer is None:
+                self.audio_buffer = AudioRingBuffer(self.sample_rate)
+
+            audio_data = to_mono_float32(samples, channels)
+            if len(audio_data) > 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🎵 Received audio data: %d samples, buffer size: %d, range: min=%.4f, max=%.4f, mean=%.4f",
+                             len(audio_data), len(self.audio_buffer),
+                             np.min(audio_data), np.max(audio_data), np.mean(audio_data))
+
+            # Quality changes take effect here, on the analysing thread
+            if self.chroma_stream is not None and self._stream_quality != self.quality_level:
+                self._switch_quality()
+                started = time.perf_counter()
+
+            # Add to buffer
+            self.audio_buffer.write(audio_data)
+            self.samples_since_analysis += len(audio_data)
+            started = self._lap("buffer", started)
+
+            # Extend the rolling chroma with only the new audio
+            if self.chroma_stream is None:
+                self.analysis_rate = analysis_rate_for(self.sample_rate)
+                if self.analysis_rate != self.sample_rate:
+                    self.resampler = soxr.ResampleStream(self.sample_rate, self.analysis_rate, 1, dtype='float32')
+                self._stream_quality = self.quality_level
+                self.chroma_stream = self._make_chroma_stream()
+                started = time.perf_counter()  # One-off setup is not a pipeline stage
+            if self.resampler is not None:
+                audio_data = self.resampler.resample_chunk(audio_data)
+                started = self._lap("resample", started)
+            self.chroma_stream.push(audio_data)
+            started = self._lap("chroma", started)
+
+            # Match once per hop of new audio. A backlog (big packet or coalesced
+            # chunks) collapses into a single match on the latest window.
+            hop = int(self.effective_hop() * self.sample_rate)
+            if self.samples_since_analysis < hop:
+                return
+            self.analyses_skipped += self.samples_since_analysis // hop - 1
+            self.samples_since_analysis = 0
+
+            # Process if we have enough data (about 0.5 seconds)
+            if len(self.audio_buffer) >= self.sample_rate // 2:
+                # Get the last 0.5 seconds of audio
+                chunk_size = self.sample_rate // 2
+                audio_chunk = self.audio_buffer.latest(chunk_size)
+
+                # Check if there's enough signal
+                volume = np.sqrt(np.mean(audio_chunk**2))
+                if volume < 0.01:  # Too quiet
+                    logger.debug("🔇 Audio too quiet (volume %.4f), skipping", volume)
+                    return
+
+                # Average chroma over the last 0.5 seconds of frames
+                chroma = self.chroma_stream.chroma(self.chroma_stream.frames_for(0.5))
+                if chroma.size == 0:
+                    logger.debug("❌ No chroma features extracted")
+                    return
+
+                # Detect chord
+                chord, confidence = self.match_chord(np.mean(chroma, axis=1))
+                self._lap("match", started)
+                logger.debug("🎵 Detected: %s (confidence: %.3f, volume: %.4f)", chord, confidence, volume)
+
+                # Call callback if set
+                if self.on_chord_detected and chord != "Unknown":
+                    self.on_chord_detected(chord, confidence, volume)
+
+        except Exception as e:
+            print(f"Error processing audio data: {e}")
+
+    def match_chord(self, chroma):
+        """Best template for a chroma vector, or "Unknown" below the confidence threshold"""
+        chord, confidence = TEMPLATE_MATCHER.match(chroma)
+        return (chord if confidence > self.confidence_threshold else "Unknown"), confidence
+
+    def reset(self):
+        """Drop buffered audio and streaming state"""
+        self.audio_buffer = None
+        self.resampler = None
+        self.chroma_stream = None
+        self.samples_since_analysis = 0
+
+    def stop(self):
+        """Stop the audio detector"""
+        self.reset()
+        self.on_chord_detected = None
@@ -0,0 +1,80 @@
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+# Binary audio frame layout (little endian):
+#   magic        2 bytes  b"HQ"
+#   format       uint8    FORMAT_INT16 or FORMAT_FLOAT32
+#   channels     uint8    interleaved channel count
+#   sample_rate  uint32   samples per second per channel
+#   sequence     uint32   client frame counter, wraps at 2**32
+# followed by raw interleaved PCM samples.
+FRAME_MAGIC = b"HQ"
+FRAME_HEADER = struct.Struct("<2sBBII")
+HEADER_SIZE = FRAME_HEADER.size
+
+FORMAT_INT16 = 1
+FORMAT_FLOAT32 = 2
+
+SAMPLE_DTYPES = {
+    FORMAT_INT16: np.dtype("<i2"),
+    FORMAT_FLOAT32: np.dtype("<f4"),
+}
+
+AudioFrame = namedtuple("AudioFrame", ["sequence", "sample_rate", "channels", "samples"])
+
+
+class FrameError(ValueError):
+    """Raised when a binary audio frame cannot be decoded"""
+
+
+def encode_audio_frame(samples, sequence, sample_rate=16000, channels=1):
+    """Pack PCM samples (int16 or float32 array) into a binary frame"""
+    samples = np.asarray(samples)
+    if samples.dtype == np.int16:
+        sample_format = FORMAT_INT16
+    else:
+        sample_format = FORMAT_FLOAT32
+    data = samples.astype(SAMPLE_DTYPES[sample_format], copy=False).tobytes()
+    header = FRAME_HEADER.pack(FRAME_MAGIC, sample_format, channels, sample_rate, sequence & 0xFFFFFFFF)
+    return header + data
+
+
+def decode_audio_frame(data):
+    """Unpack a binary frame; the returned samples are a read-only view into data"""
+    if len(data) < HEADER_SIZE:
+        raise FrameError(f"Frame too short: {len(data)} bytes")
+
+    magic, sample_format, channels, sample_rate, sequence = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise FrameError("Bad frame magic")
+
+    dtype = SAMPLE_DTYPES.get(sample_format)
+    if dtype is None:
+        raise FrameError(f"Unsupported sample format: {sample_format}")
+    if channels < 1 or sample_rate <= 0:
+        raise FrameError(f"Invalid stream layout: {channels} channel(s) at {sample_rate} Hz")
+
+    payload_size = len(data) - HEADER_SIZE
+    if payload_size % (dtype.itemsize * channels):
+        raise FrameError(f"Payload of {payload_size} bytes is not a whole number of samples")
+
+    samples = np.frombuffer(data, dtype=dtype, offset=HEADER_SIZE)
+    return AudioFrame(sequence, sample_rate, channels, samples)
+
+
+def to_mono_float32(samples, channels=1):
+    """Convert interleaved int16/float32 PCM to mono float32 in [-1, 1]"""
+    scale = 1.0 / 32768.0 if samples.dtype.kind == "i" else 1.0
+
+    if channels > 1:
+        mono = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+        if scale != 1.0:
+            mono *= scale
+        return mono
+
+    if scale != 1.0:
+        return samples.astype(np.float32) * np.float32(scale)
+    # float32 frames are used as-is (no copy)
+    return samples.astype(np.float32, copy=False)
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import get_context
+from pathlib import Path
+
+AUDIO_EXTENSIONS = {'.wav', '.flac', '.mp3', '.ogg', '.m4a', '.aif', '.aiff'}
+MANIFEST_NAME = "manifest.jsonl"
+
+# Thread pools that would otherwise start one thread per core in every worker
+BLAS_THREAD_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+)
+
+
+def pin_blas_threads(threads=1):
+    """Limit native thread pools so N worker processes don't oversubscribe N cores"""
+    for var in BLAS_THREAD_VARS:
+        os.environ[var] = str(threads)
+
+
+def _init_worker(blas_threads):
+    """Process pool initializer: pin threads and build the CQT kernel once per worker"""
+    pin_blas_threads(blas_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(blas_threads)
+    except ImportError:
+        pass
+
+    from streaming_chroma import cqt_kernel
+    from enhanced_chord_detector import SAMPLE_RATE
+    cqt_kernel(SAMPLE_RATE)
+
+
+def _analyze_one(input_path, output_path, confidence_threshold):
+    """Analyse one file in a worker and write its JSON result atomically"""
+    from offline_analysis import analyze_file
+
+    record = {"input": input_path, "output": output_path}
+    try:
+        result = analyze_file(input_path, confidence_threshold=confidence_threshold)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, output_path)
+        record.update(status="ok", duration=result["duration"], analysis_seconds=result["analysis_seconds"],
+                      key=result["summary"]["key"])
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    return record
+
+
+def find_audio_files(input_dir):
+    """All audio files under input_dir, in a stable order"""
+    return sorted(
+        path for path in Path(input_dir).rglob("*")
+        if path.is_file() and path.suffix.lower() in AUDIO_EXTENSIONS
+    )
+
+
+def load_manifest(manifest_path):
+    """Latest manifest record per input (relative path)"""
+    records = {}
+    if manifest_path.exists():
+        with open(manifest_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Truncated last line from an interrupted run
+                records[record["input"]] = record
+    return records
+
+
+def _is_done(record, path, output_path):
+    """A file is skipped on resume if it succeeded, is unchanged and its output exists"""
+    if not record or record.get("status") != "ok" or not output_path.exists():
+        return False
+    stat = path.stat()
+    return record.get("size") == stat.st_size and record.get("mtime") == stat.st_mtime
+
+
+def run_batch(input_dir, output_dir, workers=None, confidence_threshold=0.6, blas_threads=1):
+    """Analyse every audio file in input_dir with a process pool; resumable via the manifest"""
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    workers = workers or os.cpu_count() or 1
+
+    files = find_audio_files(input_dir)
+    previous = load_manifest(manifest_path)
+    todo = []
+    for path in files:
+        rel = path.relative_to(input_dir).as_posix()
+        output_path = output_dir / (rel + ".json")
+        if not _is_done(previous.get(rel), path, output_path):
+            todo.append((path, rel, output_path))
+
+    print(f"🎼 {len(files)} audio files, {len(files) - len(todo)} already done, {len(todo)} to analyse "
+          f"on {workers} worker(s)")
+    if not todo:
+        return {"total": len(files), "analysed": 0, "failed": 0}
+
+    # Children inherit the pinned environment before they import numpy
+    pin_blas_threads(blas_threads)
+    started = time.perf_counter()
+    done = failed = 0
+    audio_seconds = 0.0
+
+    with open(manifest_path, "a", encoding="utf-8") as manifest, ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context("spawn"),
+        initializer=_init_worker, initargs=(blas_threads,)
+    ) as pool:
+        pending = {}
+        queue = iter(todo)
+
+        def submit_next():
+            for path, rel, output_path in queue:
+                future = pool.submit(_analyze_one, str(path), str(output_path), confidence_threshold)
+                pending[future] = (path, rel)
+                return True
+            return False
+
+        # Keep a bounded number of files in flight
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, rel = pending.pop(future)
+                record = future.result()
+                stat = path.stat()
+                record.update(input=rel, output=Path(record["output"]).relative_to(output_dir).as_posix(),
+                              size=stat.st_size, mtime=stat.st_mtime)
+                manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+                manifest.flush()
+
+                done += 1
+                elapsed = time.perf_counter() - started
+                eta = elapsed / done * (len(todo) - done)
+                if record["status"] == "ok":
+                    audio_seconds += record["duration"]
+                    print(f"[{done}/{len(todo)}] ✅ {rel} ({record['duration']:.0f}s audio, "
+                          f"key: {record['key']}) | {audio_seconds / elapsed:.0f}x realtime, ETA {eta:.0f}s")
+                else:
+                    failed += 1
+                    print(f"[{done}/{len(todo)}] ❌ {rel}: {record['error']}")
+                submit_next()
+
+    elapsed = time.perf_counter() - started
+    print(f"🎵 Analysed {done - failed} file(s) ({audio_seconds / 60:.1f} min of audio) in {elapsed:.1f}s, "
+          f"{failed} failed. Manifest: {manifest_path}")
+    return {"total": len(files), "analysed": done - failed, "failed": failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse a directory of recordings in parallel")
+    parser.add_argument("input_dir", help="directory searched recursively for audio files")
+    parser.add_argument("output_dir", help="one <file>.json per input plus manifest.jsonl")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--confidence", type=float, default=0.6, help="chord match threshold (default 0.6)")
+    parser.add_argument("--blas-threads", type=int, default=1, help="BLAS/OpenMP threads per worker (default 1)")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(args.input_dir, args.output_dir, args.workers, args.confidence, args.blas_threads)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import librosa
+import soxr
+
+from enhanced_chord_detector import ChordDetector, CHORD_TEMPLATES, SAMPLE_RATE, FRAME_SIZE
+from streaming_chroma import StreamingChroma
+from key_estimator import KeyEstimator
+from harmony import chord_id
+from audio_chord_detector import AudioChordDetector, DEFAULT_ANALYSIS_RATE
+from progression_state import ProgressionState
+
+# Deterministic test material: a I-V-vi-IV / ii-V-I style mix of triads and sevenths
+BENCH_PROGRESSION = ['C', 'G', 'Am', 'F', 'Dm7', 'G7', 'Cmaj7', 'Em', 'A7', 'Dm', 'Bb', 'Fm']
+CLIENT_SAMPLE_RATE = 16000
+RESAMPLED_CLIENT_RATE = 48000  # Browser/desktop rate, stream-resampled to DEFAULT_ANALYSIS_RATE
+PACKET_SAMPLES = 4096  # ~256 ms packets, similar to the Flutter client
+
+
+def chord_pitch_classes(chord):
+    """Pitch classes (0 = C) present in a chord template"""
+    return [pc for pc, on in enumerate(CHORD_TEMPLATES[chord]) if on]
+
+
+def synthesize_chord(chord, sr, seconds, rng):
+    """Render one chord as decaying harmonic tones around C3-B4 plus a little noise"""
+    t = np.arange(int(sr * seconds)) / sr
+    envelope = np.minimum(1.0, t * 40) * np.exp(-t * 0.6)
+    y = np.zeros_like(t)
+    for i, pc in enumerate(chord_pitch_classes(chord)):
+        # Root in octave 3, upper voices in octave 4
+        midi = 48 + pc if i == 0 else 60 + pc
+        freq = librosa.midi_to_hz(midi)
+        for harmonic, gain in ((1, 1.0), (2, 0.4), (3, 0.2)):
+            if freq * harmonic < sr / 2:
+                y += gain * np.sin(2 * np.pi * freq * harmonic * t + rng.uniform(0, 2 * np.pi))
+    y *= envelope / 6
+    y += rng.normal(0, 0.005, len(y))
+    return y.astype(np.float32)
+
+
+def synthesize_progression(chords=BENCH_PROGRESSION, sr=SAMPLE_RATE, seconds_per_chord=2.0, seed=0):
+    """Deterministic chord audio; returns (audio, [(chord, start_s, end_s), ...])"""
+    rng = np.random.default_rng(seed)
+    parts, labels = [], []
+    for i, chord in enumerate(chords):
+        parts.append(synthesize_chord(chord, sr, seconds_per_chord, rng))
+        labels.append((chord, i * seconds_per_chord, (i + 1) * seconds_per_chord))
+    return np.concatenate(parts), labels
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Swallow any detector prints while timing"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def time_stage(fn, inputs, audio_seconds_per_call=None, warmup=2):
+    """Time fn over every input; returns latency percentiles and throughput"""
+    first_started = time.perf_counter()
+    fn(inputs[0])
+    first_call = time.perf_counter() - first_started
+    for item in inputs[1:1 + warmup]:
+        fn(item)
+
+    latencies = []
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    for item in inputs:
+        started = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - started)
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+
+    # Python-side allocations (numpy buffers included) for one more pass
+    tracemalloc.start()
+    for item in inputs[:min(len(inputs), 20)]:
+        fn(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000
+    result = {
+        "calls": len(inputs),
+        "first_call_ms": first_call * 1000,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+        "cpu_seconds": cpu,
+        "wall_seconds": wall,
+        "calls_per_cpu_second": len(inputs) / cpu if cpu > 0 else None,
+        "peak_alloc_kb": peak / 1024,
+    }
+    if audio_seconds_per_call:
+        audio = audio_seconds_per_call * len(inputs)
+        result["audio_seconds_per_cpu_second"] = audio / cpu if cpu > 0 else None
+    return result
+
+
+def bench_match_chord(audio, labels):
+    detector = ChordDetector()
+    stream = StreamingChroma(SAMPLE_RATE)
+    chroma, _ = stream.process(audio)
+    vectors = list(chroma.T)
+    return time_stage(detector.match_chord, vectors)
+
+
+def _windows(audio, size, step):
+    return [audio[i:i + size] for i in range(0, len(audio) - size + 1, step)]
+
+
+def bench_chroma_cqt(audio, labels):
+    # The pre-streaming detector path: full chroma_cqt over every 1.5 s window
+    fmin = librosa.note_to_hz('C2')
+    windows = _windows(audio, FRAME_SIZE, FRAME_SIZE // 2)
+    fn = lambda y: librosa.feature.chroma_cqt(y=y, sr=SAMPLE_RATE, hop_length=512, fmin=fmin)
+    return time_stage(fn, windows, audio_seconds_per_call=FRAME_SIZE / 2 / SAMPLE_RATE)
+
+
+def bench_streaming_chroma(audio, labels):
+    # The current detector path: only the new half frame goes through the CQT
+    stream = StreamingChroma(SAMPLE_RATE)
+    chunks = _windows(audio, FRAME_SIZE // 2, FRAME_SIZE // 2)
+    return time_stage(stream.push, chunks, audio_seconds_per_call=FRAME_SIZE / 2 / SAMPLE_RATE)
+
+
+def bench_resample(audio, labels):
+    # The live path for clients outside NATIVE_RATE_RANGE: each packet goes once
+    # through a stateful soxr stream (16 kHz clients skip this stage entirely)
+    client_audio = librosa.resample(audio, orig_sr=SAMPLE_RATE, target_sr=RESAMPLED_CLIENT_RATE).astype(np.float32)
+    packets = _windows(client_audio, PACKET_SAMPLES, PACKET_SAMPLES)
+    stream = soxr.ResampleStream(RESAMPLED_CLIENT_RATE, DEFAULT_ANALYSIS_RATE, 1, dtype='float32')
+    return time_stage(stream.resample_chunk, packets, audio_seconds_per_call=PACKET_SAMPLES / RESAMPLED_CLIENT_RATE)
+
+
+def bench_detect_key(audio, labels):
+    # The live path: one streaming key update per chord change
+    estimator = KeyEstimator()
+    chords = [chord_id(label[0]) for label in labels] * 4
+    return time_stage(estimator.update, chords)
+
+
+def bench_end_to_end(audio, labels):
+    audio_16k = librosa.resample(audio, orig_sr=SAMPLE_RATE, target_sr=CLIENT_SAMPLE_RATE)
+    pcm = (np.clip(audio_16k, -1, 1) * 32767).astype(np.int16)
+    packets = [pcm[i:i + PACKET_SAMPLES].tobytes() for i in range(0, len(pcm), PACKET_SAMPLES)]
+    detector = AudioChordDetector(confidence_threshold=0.5)
+    detector.on_chord_detected = lambda chord, confidence, volume: None
+    with _quiet():
+        return time_stage(detector.process_audio_data, packets,
+                          audio_seconds_per_call=PACKET_SAMPLES / CLIENT_SAMPLE_RATE)
+
+
+def bench_session_setup(audio, labels):
+    # What start_session builds per connection (the shared tables are already loaded)
+    fn = lambda _: (ProgressionState(), AudioChordDetector(confidence_threshold=0.56))
+    return time_stage(fn, list(range(500)))
+
+
+STAGES = {
+    "match_chord": bench_match_chord,
+    "chroma_cqt": bench_chroma_cqt,
+    "streaming_chroma": bench_streaming_chroma,
+    "resample": bench_resample,
+    "detect_key": bench_detect_key,
+    "end_to_end": bench_end_to_end,
+    "session_setup": bench_session_setup,
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(stages=None, seconds_per_chord=2.0, seed=0):
+    """Run the selected stages on synthetic audio and return a JSON-serializable report"""
+    audio, labels = synthesize_progression(seconds_per_chord=seconds_per_chord, seed=seed)
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "librosa": librosa.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "audio_seconds": len(audio) / SAMPLE_RATE,
+        "seed": seed,
+        "stages": {},
+    }
+    for name in stages or STAGES:
+        print(f"⏱️  {name}...")
+        report["stages"][name] = STAGES[name](audio, labels)
+    report["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"\n🎼 Detection benchmark @ {report['git_commit']} ({report['audio_seconds']:.0f}s synthetic audio)")
+    print(f"{'stage':18} {'p50 ms':>9} {'p99 ms':>9} {'audio s/CPU s':>14} {'peak KB':>9}")
+    for name, stage in report["stages"].items():
+        throughput = stage.get("audio_seconds_per_cpu_second")
+        throughput = f"{throughput:14.1f}" if throughput else f"{'-':>14}"
+        line = (f"{name:18} {stage['p50_ms']:9.3f} {stage['p99_ms']:9.3f} "
+                f"{throughput} {stage['peak_alloc_kb']:9.0f}")
+        old = baseline and baseline["stages"].get(name)
+        if old:
+            line += f"   p50 x{old['p50_ms'] / stage['p50_ms']:.2f} vs {baseline['git_commit']}"
+        print(line)
+    print(f"Max RSS: {report['max_rss_mb']:.0f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chord detection hot path on synthetic audio")
+    parser.add_argument("--stages", help=f"comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--seconds-per-chord", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="save the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    stages = args.stages.split(",") if args.stages else None
+    report = run_benchmarks(stages, args.seconds_per_chord, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import librosa
+
+from enhanced_chord_detector import CHORD_TEMPLATES, TEMPLATE_MATCHER
+from feature_extractors import FEATURE_EXTRACTORS, create_extractor
+from benchmark_detection import synthesize_progression
+
+# Same windowing as the live WebSocket path: 0.5 s windows every 0.25 s
+WINDOW_SECONDS = 0.5
+HOP_SECONDS = 0.25
+
+
+def chord_root(chord):
+    """Pitch class (0 = C) of a chord name's root"""
+    root = chord[:2] if chord[1:2] in ('#', 'b') else chord[:1]
+    return librosa.note_to_midi(root + '4') % 12
+
+
+def labelled_set(n_clips, chords_per_clip, sr, seconds_per_chord, seed=0):
+    """Deterministic clips of random chords from every template family"""
+    rng = np.random.default_rng(seed)
+    names = list(CHORD_TEMPLATES)
+    clips = []
+    for clip in range(n_clips):
+        chords = [names[i] for i in rng.integers(0, len(names), chords_per_clip)]
+        clips.append(synthesize_progression(chords, sr=sr, seconds_per_chord=seconds_per_chord, seed=seed + clip))
+    return clips
+
+
+def evaluate(name, clips, sr):
+    """Accuracy and throughput of one extractor over the labelled clips"""
+    correct = root_correct = windows = 0
+    cpu = 0.0
+    audio_seconds = 0.0
+    for audio, labels in clips:
+        extractor = create_extractor(name, sr)
+        started = time.process_time()
+        chroma, _ = extractor.process(audio)
+        cpu += time.process_time() - started
+        audio_seconds += len(audio) / sr
+
+        frame_seconds = extractor.hop_length / sr
+        window = extractor.frames_for(WINDOW_SECONDS)
+        step = extractor.frames_for(HOP_SECONDS)
+        for end in range(window, chroma.shape[1] + 1, step):
+            start_time, end_time = (end - window) * frame_seconds, end * frame_seconds
+            # Score only windows that sit entirely inside one labelled chord
+            label = next((chord for chord, a, b in labels if a <= start_time and end_time <= b), None)
+            if label is None:
+                continue
+            predicted, _ = TEMPLATE_MATCHER.match(chroma[:, end - window:end].mean(axis=1))
+            windows += 1
+            # Enharmonic names share a template, so compare pitch-class sets
+            correct += CHORD_TEMPLATES[predicted] == CHORD_TEMPLATES[label]
+            root_correct += chord_root(predicted) == chord_root(label)
+
+    return {
+        "windows": windows,
+        "accuracy": correct / windows if windows else None,
+        "root_accuracy": root_correct / windows if windows else None,
+        "cpu_seconds": cpu,
+        "audio_seconds_per_cpu_second": audio_seconds / cpu if cpu > 0 else None,
+    }
+
+
+def compare(sr=16000, n_clips=20, chords_per_clip=8, seconds_per_chord=1.5, seed=0):
+    clips = labelled_set(n_clips, chords_per_clip, sr, seconds_per_chord, seed)
+    # Build kernels up front so one-off setup isn't charged to the first clip
+    for name in FEATURE_EXTRACTORS:
+        create_extractor(name, sr)
+    return {name: evaluate(name, clips, sr) for name in FEATURE_EXTRACTORS}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare chroma extractors on labelled synthetic chords")
+    parser.add_argument("--sr", type=int, default=16000)
+    parser.add_argument("--clips", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="save results as JSON")
+    args = parser.parse_args(argv)
+
+    results = compare(args.sr, args.clips, seed=args.seed)
+    baseline = results.get("cqt", {}).get("audio_seconds_per_cpu_second")
+    print(f"{'extractor':10} {'accuracy':>9} {'root acc':>9} {'audio s/CPU s':>14} {'speedup':>8}")
+    for name, result in results.items():
+        speed = result["audio_seconds_per_cpu_second"]
+        print(f"{name:10} {result['accuracy']:9.1%} {result['root_accuracy']:9.1%} {speed:14.0f} "
+              f"{speed / baseline:7.1f}x")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# Pluggable streaming chroma extractors. Every extractor follows the
+# StreamingChroma interface, so detectors can swap them freely:
+#   push(samples) / process(samples)   feed new mono float32 audio
+#   chroma(n) / mean_chroma(n)         most recent chroma frames
+#   volume(n), frames_for(seconds)     window helpers
+#   reset()                            forget all history
+from streaming_chroma import StreamingChroma, StreamingStftChroma
+
+DEFAULT_EXTRACTOR = "cqt"
+
+# name -> (factory(sr, **params), description)
+FEATURE_EXTRACTORS = {
+    "cqt": (StreamingChroma, "Constant-Q chroma (36 bins/octave, C2-B8); most accurate"),
+    "stft": (StreamingStftChroma, "Short-STFT chroma with a fixed pitch-class filter bank; several times cheaper"),
+}
+
+
+def create_extractor(name, sr, **params):
+    """Build a streaming chroma extractor by name"""
+    try:
+        factory, _ = FEATURE_EXTRACTORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown feature extractor: {name} (choose from {', '.join(FEATURE_EXTRACTORS)})")
+    return factory(sr, **params)
@@ -0,0 +1,174 @@
+# Compiled harmony tables: chords and keys are small integer ids, and every
+# (key id, chord id) pair has its Roman numeral, harmonic function and diatonic
+# flag precomputed at import, so labelling a chord is a table lookup.
+import numpy as np
+
+PITCH_CLASSES = {
+    'C': 0, 'C#': 1, 'Db': 1, 'D': 2, 'D#': 3, 'Eb': 3, 'E': 4, 'F': 5,
+    'F#': 6, 'Gb': 6, 'G': 7, 'G#': 8, 'Ab': 8, 'A': 9, 'A#': 10, 'Bb': 10, 'B': 11,
+}
+
+# Chord name suffix -> (triad quality, Roman numeral extension)
+CHORD_QUALITIES = {
+    '': ('major', ''),
+    'm': ('minor', ''),
+    'maj7': ('major', 'M7'),
+    'm7': ('minor', '7'),
+    '7': ('major', '7'),
+    'dim': ('dim', ''),
+}
+
+# Scale degrees: (semitones above the tonic, triad quality, numeral, function)
+MAJOR_DEGREES = (
+    (0, 'major', 'I', 'Tonic (home)'),
+    (2, 'minor', 'ii', 'Subdominant'),
+    (4, 'minor', 'iii', 'Mediant'),
+    (5, 'major', 'IV', 'Subdominant'),
+    (7, 'major', 'V', 'Dominant'),
+    (9, 'minor', 'vi', 'Relative minor'),
+    (11, 'dim', 'vii°', 'Leading tone'),
+)
+MINOR_DEGREES = (
+    (0, 'minor', 'i', 'Tonic (home)'),
+    (2, 'dim', 'ii°', 'Subdominant'),
+    (3, 'major', 'III', 'Relative major'),
+    (5, 'minor', 'iv', 'Subdominant'),
+    (7, 'minor', 'v', 'Dominant'),
+    (8, 'major', 'VI', 'Submediant'),
+    (10, 'major', 'VII', 'Subtonic'),
+)
+NON_DIATONIC = 'Non-diatonic'
+
+# Spelling of diatonic chord names: flat keys use flats, the rest sharps
+SHARP_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+FLAT_NAMES = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+FLAT_KEYS = {'F major', 'Bb major', 'Eb major', 'Ab major', 'Db major',
+             'D minor', 'G minor', 'C minor', 'F minor', 'Bb minor', 'Eb minor'}
+TRIAD_SUFFIXES = {'major': '', 'minor': 'm', 'dim': 'dim'}
+
+# Key ids 0-11 are C..B major, 12-23 C..B minor (tonic spelled as usually written)
+MAJOR_TONICS = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B']
+MINOR_TONICS = ['C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'G#', 'A', 'Bb', 'B']
+KEY_NAMES = [f"{tonic} major" for tonic in MAJOR_TONICS] + [f"{tonic} minor" for tonic in MINOR_TONICS]
+KEY_IDS = {name: key_id for key_id, name in enumerate(KEY_NAMES)}
+# Enharmonic spellings of the same key ("C# major", "A# minor", ...) share an id
+for _tonic, _pc in PITCH_CLASSES.items():
+    KEY_IDS.setdefault(f"{_tonic} major", _pc)
+    KEY_IDS.setdefault(f"{_tonic} minor", 12 + _pc)
+
+# Chord id 0 is "Unknown"; the rest cover every spelling the detectors emit
+UNKNOWN_CHORD = 0
+CHORD_NAMES = ['Unknown'] + [root + suffix for suffix in CHORD_QUALITIES for root in PITCH_CLASSES]
+CHORD_IDS = {name: chord_id for chord_id, name in enumerate(CHORD_NAMES)}
+
+
+def parse_chord(name):
+    """(root pitch class, triad quality, numeral extension) of a chord name, or None"""
+    root = name[:2] if name[1:2] in ('#', 'b') else name[:1]
+    if root not in PITCH_CLASSES or name[len(root):] not in CHORD_QUALITIES:
+        return None
+    quality, extension = CHORD_QUALITIES[name[len(root):]]
+    return PITCH_CLASSES[root], quality, extension
+
+
+def _compile():
+    n_keys, n_chords = len(KEY_NAMES), len(CHORD_NAMES)
+    roman = [[None] * n_chords for _ in range(n_keys)]
+    function = [[NON_DIATONIC] * n_chords for _ in range(n_keys)]
+    degree = np.full((n_keys, n_chords), -1, dtype=np.int8)
+    for key_id in range(n_keys):
+        tonic, degrees = key_id % 12, MAJOR_DEGREES if key_id < 12 else MINOR_DEGREES
+        by_interval = {interval: (index, quality, numeral, role)
+                       for index, (interval, quality, numeral, role) in enumerate(degrees)}
+        for chord_id, name in enumerate(CHORD_NAMES):
+            parsed = parse_chord(name)
+            roman[key_id][chord_id] = f"({name})"
+            if parsed is None:
+                continue
+            root, quality, extension = parsed
+            match = by_interval.get((root - tonic) % 12)
+            if match and match[1] == quality:
+                index, _, numeral, role = match
+                roman[key_id][chord_id] = numeral + extension
+                function[key_id][chord_id] = role
+                degree[key_id, chord_id] = index
+    degree.setflags(write=False)
+    return tuple(map(tuple, roman)), tuple(map(tuple, function)), degree
+
+
+def _spell_diatonic(key):
+    names = FLAT_NAMES if KEY_NAMES[key] in FLAT_KEYS else SHARP_NAMES
+    tonic, degrees = key % 12, MAJOR_DEGREES if key < 12 else MINOR_DEGREES
+    return tuple(names[(tonic + interval) % 12] + TRIAD_SUFFIXES[quality]
+                 for interval, quality, _, _ in degrees)
+
+
+# ROMAN[key_id][chord_id], FUNCTION[key_id][chord_id], DEGREE[key_id, chord_id] (-1 = non-diatonic)
+ROMAN, FUNCTION, DEGREE = _compile()
+DIATONIC = DEGREE >= 0
+DIATONIC.setflags(write=False)
+DIATONIC_CHORDS = tuple(_spell_diatonic(key) for key in range(len(KEY_NAMES)))
+
+
+# Key-fit weight of each chord (rows) for each key (columns): tonic and dominant
+# count about double, other diatonic chords once. The dominant sits just under
+# the tonic so keys sharing a dominant go to the one whose tonic was actually
+# played. Minor keys are fitted on harmonic minor: their dominant is the major
+# V (E in A minor) and vii° counts too, while the natural-minor v gets no
+# bonus, or i-iv-V-i would read as the key of iv (Am being v of D minor).
+TONIC_WEIGHT = 2.0
+DOMINANT_WEIGHT = 1.75
+HARMONIC_MINOR_WEIGHTS = {(7, 'major'): DOMINANT_WEIGHT, (7, 'minor'): 1.0, (11, 'dim'): 1.0}
+
+
+def _key_weights():
+    weights = np.select([DEGREE == 0, DEGREE == 4, DIATONIC], [TONIC_WEIGHT, DOMINANT_WEIGHT, 1.0], 0.0)
+    for chord_id, name in enumerate(CHORD_NAMES):
+        parsed = parse_chord(name)
+        if parsed is None:
+            continue
+        root, quality, _ = parsed
+        for key in range(12, len(KEY_NAMES)):
+            weight = HARMONIC_MINOR_WEIGHTS.get(((root - key) % 12, quality))
+            if weight is not None:
+                weights[key, chord_id] = weight
+    return weights.T.copy()
+
+
+KEY_WEIGHTS = _key_weights()
+KEY_WEIGHTS.setflags(write=False)
+SCALE_NUMERALS = ([numeral for _, _, numeral, _ in MAJOR_DEGREES], [numeral for _, _, numeral, _ in MINOR_DEGREES])
+
+
+def key_id(name):
+    """Id of a key name such as 'C major' (None if unknown)"""
+    return KEY_IDS.get(name)
+
+
+def chord_id(name):
+    """Id of a chord name such as 'Am7' (names outside the vocabulary count as Unknown)"""
+    return CHORD_IDS.get(name, UNKNOWN_CHORD)
+
+
+def chord_to_roman(chord, key_info):
+    """Convert chord to Roman numeral in given key (handles both major and minor)"""
+    if not key_info:
+        return chord
+    key = KEY_IDS.get(key_info)
+    if key is None:
+        return chord
+    index = CHORD_IDS.get(chord)
+    return ROMAN[key][index] if index is not None else f"({chord})"
+
+
+def is_major(key):
+    return key < 12
+
+
+def diatonic_chords(key):
+    """Chord names of a key's seven degrees, in scale order"""
+    return list(DIATONIC_CHORDS[key])
+
+
+def scale_numerals(key):
+    return SCALE_NUMERALS[0] if is_major(key) else SCALE_NUMERALS[1]
@@ -0,0 +1,68 @@
+import numpy as np
+
+from harmony import KEY_NAMES, KEY_WEIGHTS
+
+KEY_DECAY = 0.85  # per chord change: a chord 8 changes ago counts about a quarter
+MIN_CHORDS = 3  # chord changes before any key is reported
+KEY_THRESHOLD = 0.5  # key fit needed to report (or switch to) a key
+SWITCH_MARGIN = 1.1  # a new key must fit this much better than the current one
+
+
+class KeyEstimator:
+    """Streaming key estimate over all 24 keys from a sequence of chord ids
+
+    Each chord change decays every key's score and adds the chord's KEY_WEIGHTS
+    row: O(24) work, no history kept. Fit is the decayed mean weight per chord,
+    on the same 0-2 scale as ProgressionDetector.detect_key (2 = every chord a
+    tonic or dominant). decay=1.0 gives the plain whole-session average.
+    """
+
+    __slots__ = ("decay", "threshold", "switch_margin", "scores", "total", "chords", "key", "confidence")
+
+    def __init__(self, decay=KEY_DECAY, threshold=KEY_THRESHOLD, switch_margin=SWITCH_MARGIN):
+        self.decay = decay
+        self.threshold = threshold
+        self.switch_margin = switch_margin
+        self.scores = np.zeros(len(KEY_NAMES))
+        self.total = 0.0
+        self.chords = 0
+        self.key = None  # current key id, with hysteresis
+        self.confidence = 0.0
+
+    def reset(self):
+        self.scores[:] = 0.0
+        self.total = 0.0
+        self.chords = 0
+        self.key = None
+        self.confidence = 0.0
+
+    def update(self, chord_id, weight=1.0):
+        """Fold in one chord change; returns True if the reported key changed"""
+        self.scores *= self.decay
+        self.scores += KEY_WEIGHTS[chord_id] * weight
+        self.total = self.total * self.decay + weight
+        self.chords += 1
+        if self.chords < MIN_CHORDS:
+            return False
+
+        best = int(np.argmax(self.scores))
+        fit = self.scores / self.total
+        if self.key is not None and best != self.key and fit[best] < fit[self.key] * self.switch_margin:
+            best = self.key  # Not convincingly better; stay put
+        changed = False
+        if fit[best] > self.threshold and best != self.key:
+            self.key = best
+            changed = True
+        self.confidence = float(fit[self.key]) if self.key is not None else 0.0
+        return changed
+
+    def estimate(self):
+        """(key id, fit) of the best-fitting key right now, without hysteresis"""
+        if self.chords < MIN_CHORDS or not self.total:
+            return None, 0.0
+        best = int(np.argmax(self.scores))
+        return best, float(self.scores[best] / self.total)
+
+    @property
+    def key_name(self):
+        return KEY_NAMES[self.key] if self.key is not None else None
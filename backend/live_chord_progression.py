@@ -3,31 +3,11 @@ import time
 from collections import deque, Counter
 from datetime import datetime, timedelta
 from live_chord_recognizer import ChordDetector, SAMPLE_RATE
-
-# Key signatures with diminished chords
-MAJOR_KEYS = {
-    'C': ['C', 'Dm', 'Em', 'F', 'G', 'Am', 'Bdim'],
-    'G': ['G', 'Am', 'Bm', 'C', 'D', 'Em', 'F#dim'],
-    'D': ['D', 'Em', 'F#m', 'G', 'A', 'Bm', 'C#dim'],
-    'A': ['A', 'Bm', 'C#m', 'D', 'E', 'F#m', 'G#dim'],
-    'E': ['E', 'F#m', 'G#m', 'A', 'B', 'C#m', 'D#dim'],
-    'F': ['F', 'Gm', 'Am', 'Bb', 'C', 'Dm', 'Edim'],
-    'Bb': ['Bb', 'Cm', 'Dm', 'Eb', 'F', 'Gm', 'Adim'],
-    'Eb': ['Eb', 'Fm', 'Gm', 'Ab', 'Bb', 'Cm', 'Ddim'],
-}
-MINOR_KEYS = {
-    'A': ['Am', 'Bdim', 'C', 'Dm', 'Em', 'F', 'G'],
-    'E': ['Em', 'F#dim', 'G', 'Am', 'Bm', 'C', 'D'],
-    'B': ['Bm', 'C#dim', 'D', 'Em', 'F#m', 'G', 'A'],
-    'F#': ['F#m', 'G#dim', 'A', 'Bm', 'C#m', 'D', 'E'],
-    'C#': ['C#m', 'D#dim', 'E', 'F#m', 'G#m', 'A', 'B'],
-    'D': ['Dm', 'Edim', 'F', 'Gm', 'Am', 'Bb', 'C'],
-    'G': ['Gm', 'Adim', 'Bb', 'Cm', 'Dm', 'Eb', 'F'],
-    'C': ['Cm', 'Ddim', 'Eb', 'Fm', 'Gm', 'Ab', 'Bb'],
-}
-
-# Roman numeral notation
-ROMAN_NUMERALS = ['I', 'ii', 'iii', 'IV', 'V', 'vi', 'vii°']
+from progression_matcher import ProgressionMatcher
+from progression_state import ProgressionState
+from key_estimator import KeyEstimator
+from harmony import (KEY_NAMES, KEY_IDS, CHORD_NAMES, ROMAN, FUNCTION, KEY_WEIGHTS, UNKNOWN_CHORD,
+                     chord_id, chord_to_roman, diatonic_chords, scale_numerals)
 
 # Common progressions
 COMMON_PROGRESSIONS = {
@@ -42,125 +22,140 @@ COMMON_PROGRESSIONS = {
     'IV-V-I': 'Plagal cadence',
     'vii°-I': 'Leading tone resolution',
 }
+PATTERN_MATCHER = ProgressionMatcher(COMMON_PROGRESSIONS)
 
-class ProgressionDetector:
-    def __init__(self):
+class ProgressionDetector(ProgressionState):
+    """Desktop progression analyzer: live microphone input, full chord timeline and summary"""
+
+    def __init__(self, history_size=50):
+        super().__init__()  # Key and chord-change tracking
+        self.session_keys = KeyEstimator(decay=1.0)  # Whole-session key for the summary
+        self.pattern_state = 0  # PATTERN_MATCHER state over the live Roman numerals
         self.chord_detector = ChordDetector()
         self.is_running = False
+        self.verbose = True  # Print live chord/key updates
         
         # Progression tracking
-        self.chord_history = deque(maxlen=50)  # Store last 50 chord changes
-        self.current_key = None
-        self.key_confidence = 0
-        self.last_chord = None
-        self.chord_start_time = None
+        self.chord_history = deque(maxlen=history_size)  # Store last N chord changes (None = all)
         self.session_start_time = None
         
         # Audio configuration
         self.channels = self.chord_detector.channels  # Get channels from ChordDetector
 
-
-
     def detect_key(self, recent_chords):
         """Smart key detection between major and minor scales with weighted scores"""
         if len(recent_chords) < 3:
             return None, 0
 
-        def score_key(key_chords):
-            score = 0
-            for chord in recent_chords:
-                base_chord = chord.replace('7', '').replace('maj', '')
-                if base_chord in key_chords:
-                    # Tonic & dominant chords are more significant
-                    index = key_chords.index(base_chord)
-                    weight = 2 if index in [0, 4] else 1
-                    score += weight
-            return score / len(recent_chords)
-
-        key_scores = {}
+        # Tonic & dominant chords are more significant (see harmony.KEY_WEIGHTS)
+        ids = [chord if isinstance(chord, int) else chord_id(chord) for chord in recent_chords]
+        key_scores = KEY_WEIGHTS[ids].sum(axis=0) / len(ids)
+        best_key = int(np.argmax(key_scores))
+        best_score = float(key_scores[best_key])
 
-        # Score all major keys
-        for key, chords in MAJOR_KEYS.items():
-            key_scores[f"{key} major"] = score_key(chords)
+        return (KEY_NAMES[best_key], best_score) if best_score > 0.35 else (None, 0)
 
-        # Score all minor keys
-        for key, chords in MINOR_KEYS.items():
-            key_scores[f"{key} minor"] = score_key(chords)
-
-        best_key = max(key_scores, key=key_scores.get)
-        best_score = key_scores[best_key]
-
-        return (best_key, best_score) if best_score > 0.35 else (None, 0)
+    def get_diatonic_chords(self, key):
+        """Diatonic triads of a key name, in scale order"""
+        key = KEY_IDS.get(key)
+        return diatonic_chords(key) if key is not None else []
     
     def chord_to_roman(self, chord, key_info):
         """Convert chord to Roman numeral in given key (handles both major and minor)"""
-        if not key_info:
-            return chord
-            
-        # Parse key info (e.g., "C major" or "A minor")
-        key_parts = key_info.split()
-        if len(key_parts) != 2:
-            return chord
-            
-        key_root = key_parts[0]
-        key_type = key_parts[1]
-        
-        # Get the appropriate scale
-        if key_type == "major":
-            key_chords = MAJOR_KEYS.get(key_root, [])
-        elif key_type == "minor":
-            key_chords = MINOR_KEYS.get(key_root, [])
-            # For minor keys, use different Roman numerals
-            minor_romans = ['i', 'ii°', 'III', 'iv', 'v', 'VI', 'VII']
-        else:
-            return chord
-        
-        # Handle different chord types
-        if 'dim' in chord:
-            base_chord = chord
-        else:
-            base_chord = chord.replace('7', '').replace('maj', '')
-        
-        try:
-            index = key_chords.index(base_chord)
-            
-            # Use appropriate Roman numerals for major vs minor
-            if key_type == "major":
-                roman = ROMAN_NUMERALS[index]
-            else:  # minor key
-                roman = minor_romans[index]
-            
-            # Add extensions back
-            if 'dim' in chord:
-                pass  # Already has ° symbol or handled in minor romans
-            elif '7' in chord and 'maj7' not in chord:
-                roman += '7'
-            elif 'maj7' in chord:
-                roman += 'M7'
-                
-            return roman
-        except ValueError:
-            # Non-diatonic chord
-            return f"({chord})"
+        return chord_to_roman(chord, key_info)
     
     def detect_progression_pattern(self, recent_romans):
         """Identify common progression patterns"""
         if len(recent_romans) < 2:
             return None
-            
-        # Check various lengths of patterns
-        for length in range(4, 1, -1):  # Check 4, 3, 2 chord patterns
-            if len(recent_romans) >= length:
-                pattern = '-'.join(recent_romans[-length:])
-                for prog_pattern, name in COMMON_PROGRESSIONS.items():
-                    if pattern == prog_pattern:
-                        return name
-                    # Check if it's part of a longer pattern
-                    if pattern in prog_pattern or prog_pattern in pattern:
-                        return f"Part of {name}"
-                        
-        return None
+        return PATTERN_MATCHER.describe(PATTERN_MATCHER.feed(recent_romans))
     
+    def update_key(self, chord_index):
+        """Also feed the whole-session key; restarts pattern matching when the live key changes"""
+        self.session_keys.update(chord_index)
+        changed = super().update_key(chord_index)
+        if changed:
+            self.pattern_state = 0  # Numerals so far were in another key
+        return changed
+
+    def session_summary(self, end_time=None):
+        """Structured session summary: key, timeline, patterns and chord statistics"""
+        all_chords = [entry['chord_id'] for entry in self.chord_history if entry['chord_id'] != UNKNOWN_CHORD]
+
+        # Key of the entire session (every chord change, not just the retained history)
+        session_key, confidence = self.session_keys.estimate()
+        if session_key is not None and confidence > 0.5:
+            self.key_id = session_key
+            self.key_confidence = confidence
+
+        key = self.key_id
+        end_time = end_time or datetime.now()
+        summary = {
+            "session_duration": (end_time - self.session_start_time).total_seconds() if self.session_start_time else 0,
+            "total_chords": len(self.chord_history),
+            "unique_chords": len(set(all_chords)),
+            "key": self.current_key,
+            "key_confidence": self.key_confidence if key is not None else 0,
+            "diatonic_chords": diatonic_chords(key) if key is not None else [],
+            "roman_scale": scale_numerals(key) if key is not None else [],
+            "timeline": [],
+            "pattern": None,
+            "patterns": [],
+            "roman_breakdown": [],
+            "chord_usage": [],
+            "total_playing_time": sum(entry.get('duration', 0) for entry in self.chord_history),
+        }
+
+        # Timeline with Roman numerals (table lookups by key id and chord id)
+        romans = ROMAN[key] if key is not None else None
+        roman_numerals = []
+        for entry in self.chord_history:
+            roman = romans[entry['chord_id']] if romans else entry['chord']
+            roman_numerals.append(roman)
+            start = (entry['time'] - self.session_start_time).total_seconds() if self.session_start_time else None
+            summary["timeline"].append({
+                "chord": entry['chord'],
+                "roman": roman,
+                "start": start,
+                "duration": entry.get('duration', 2.0),
+                "confidence": float(entry['confidence']),
+            })
+
+        if len(roman_numerals) >= 3:
+            summary["pattern"] = self.detect_progression_pattern(roman_numerals)
+        for pattern_id, count in PATTERN_MATCHER.scan(roman_numerals).most_common():
+            summary["patterns"].append({
+                "pattern": PATTERN_MATCHER.patterns[pattern_id],
+                "name": PATTERN_MATCHER.names[pattern_id],
+                "count": count,
+            })
+
+        # Roman numeral breakdown with functional analysis
+        if romans and roman_numerals:
+            breakdown = {}  # roman -> (function, chords), in order of first use
+            for entry in self.chord_history:
+                function, chords = breakdown.setdefault(romans[entry['chord_id']],
+                                                        (FUNCTION[key][entry['chord_id']], []))
+                if entry['chord'] not in chords:
+                    chords.append(entry['chord'])
+            for roman, (function, chords) in breakdown.items():
+                summary["roman_breakdown"].append({
+                    "roman": roman,
+                    "chords": chords,
+                    "function": function,
+                })
+
+        # Chord statistics with Roman numerals
+        for chord, count in Counter(all_chords).most_common():
+            summary["chord_usage"].append({
+                "chord": CHORD_NAMES[chord],
+                "roman": romans[chord] if romans else "?",
+                "count": count,
+                "percentage": (count / len(all_chords)) * 100,
+            })
+
+        return summary
+
     def print_session_summary(self):
         """Print final session summary with full timeline"""
         if len(self.chord_history) < 2:
@@ -171,52 +166,25 @@ class ProgressionDetector:
         print("🎼 HARMONIC PROGRESSION SESSION SUMMARY")
         print("="*80)
         
-        # Get all unique chords from session
-        all_chords = []
-        for entry in self.chord_history:
-            chord = entry['chord']
-            if chord != "Unknown":
-                all_chords.append(chord)
-        
-        if not all_chords:
+        if not any(entry['chord'] != "Unknown" for entry in self.chord_history):
             print("🎵 No valid chords detected in this session.")
             return
             
-            
-        # Detect key from entire session
-        detected_key, confidence = self.detect_key(all_chords)
-        
-        if detected_key and confidence > 0.5:
-            self.current_key = detected_key            
-            self.key_confidence = confidence
+        summary = self.session_summary()
         
         # Display session info
-        session_duration = (datetime.now() - self.session_start_time).total_seconds() if self.session_start_time else 0
-        print(f"⏰ Session Duration: {session_duration:.1f} seconds")
-        print(f"🎹 Total Chords Detected: {len(self.chord_history)}")
-        print(f"🎵 Unique Chords: {len(set(all_chords))}")
-
+        print(f"⏰ Session Duration: {summary['session_duration']:.1f} seconds")
+        print(f"🎹 Total Chords Detected: {summary['total_chords']}")
+        print(f"🎵 Unique Chords: {summary['unique_chords']}")
 
-        if self.current_key:
-            print(f"🗝️  Detected Key: {self.current_key} (confidence: {self.key_confidence:.0%})")
-            
-            if "major" in self.current_key:
-                key_root = self.current_key.replace(" major", "")
-                scale = MAJOR_KEYS.get(key_root, [])
-                roman_scale = ROMAN_NUMERALS
-            elif "minor" in self.current_key:
-                key_root = self.current_key.replace(" minor", "")
-                scale = MINOR_KEYS.get(key_root, [])
-                roman_scale = ['i', 'ii°', 'III', 'iv', 'v', 'VI', 'VII']
-            else:
-                scale = []
-                roman_scale = []
 
-            print(f"📋 Diatonic chords: {' - '.join(scale)}")
+        if summary['key']:
+            print(f"🗝️  Detected Key: {summary['key']} (confidence: {summary['key_confidence']:.0%})")
+            print(f"📋 Diatonic chords: {' - '.join(summary['diatonic_chords'])}")
             
             # Show Roman numeral mapping
-            if scale and roman_scale:
-                print(f"🎼 Roman numerals: {' - '.join(roman_scale)}")
+            if summary['diatonic_chords'] and summary['roman_scale']:
+                print(f"🎼 Roman numerals: {' - '.join(summary['roman_scale'])}")
         else:
             print("🗝️  Key: Could not determine")
         
@@ -228,19 +196,11 @@ class ProgressionDetector:
         chord_line = ""
         roman_line = ""
         duration_line = ""
-        roman_numerals = []
         
-        for entry in list(self.chord_history):
+        for entry in summary['timeline']:
             chord = entry['chord']
-            duration = entry.get('duration', 2.0)
-            
-            # Convert to Roman numeral
-            if self.current_key:
-                roman = self.chord_to_roman(chord, self.current_key)
-                roman_numerals.append(roman)
-            else:
-                roman = chord
-                roman_numerals.append(chord)
+            roman = entry['roman']
+            duration = entry['duration']
             
             # Create visual blocks (limit width for readability)
             block_size = max(3, min(8, int(duration * 2)))
@@ -272,9 +232,8 @@ class ProgressionDetector:
         # Visual representation
         print("\n📊 Visual Timeline:")
         visual_line = ""
-        for entry in list(self.chord_history):
-            duration = entry.get('duration', 2.0)
-            block_size = max(1, min(6, int(duration)))
+        for entry in summary['timeline']:
+            block_size = max(1, min(6, int(entry['duration'])))
             visual_line += "█" * block_size + " "
             
             # Line break for long timelines
@@ -288,73 +247,45 @@ class ProgressionDetector:
         print("\n🎵 PROGRESSION ANALYSIS:")
         print("-" * 40)
 
-        if len(roman_numerals) >= 3:
-            pattern = self.detect_progression_pattern(roman_numerals)
-            if pattern:
-                print(f"🎼 Identified Pattern: {pattern}")
+        if summary['pattern']:
+            print(f"🎼 Identified Pattern: {summary['pattern']}")
 
         # Show full sequence with both chord names and Roman numerals
-        if len(roman_numerals) >= 2:
-            chord_sequence = ' → '.join([entry['chord'] for entry in list(self.chord_history)])
-            roman_sequence = ' → '.join(roman_numerals)
+        if len(summary['timeline']) >= 2:
+            chord_sequence = ' → '.join([entry['chord'] for entry in summary['timeline']])
+            roman_sequence = ' → '.join([entry['roman'] for entry in summary['timeline']])
             print(f"📝 Chord Progression: {chord_sequence}")
             print(f"🎼 Roman Numeral Analysis: {roman_sequence}")
 
         # Roman numeral breakdown
-        if self.current_key and roman_numerals:
+        if summary['roman_breakdown']:
             print(f"\n🎼 ROMAN NUMERAL BREAKDOWN:")
             print("-" * 40)
-            unique_romans = list(dict.fromkeys(roman_numerals))  # Preserve order, remove duplicates
-            
-            for roman in unique_romans:
-                # Find corresponding chord
-                matching_chords = []
-                for entry in self.chord_history:
-                    chord = entry['chord']
-                    if self.chord_to_roman(chord, self.current_key) == roman:
-                        if chord not in matching_chords:
-                            matching_chords.append(chord)
-                
-                chord_list = ", ".join(matching_chords)
-                
-                # Add functional analysis
-                if "major" in self.current_key:
-                    functions = {
-                        'I': 'Tonic (home)', 'ii': 'Subdominant', 'iii': 'Mediant', 
-                        'IV': 'Subdominant', 'V': 'Dominant', 'vi': 'Relative minor', 'vii°': 'Leading tone'
-                    }
-                else:  # minor key
-                    functions = {
-                        'i': 'Tonic (home)', 'ii°': 'Subdominant', 'III': 'Relative major', 
-                        'iv': 'Subdominant', 'v': 'Dominant', 'VI': 'Submediant', 'VII': 'Subtonic'
-                    }
-                
-                base_roman = roman.replace('7', '').replace('M7', '')
-                function = functions.get(base_roman, 'Non-diatonic')
-                print(f"   {roman:4} = {chord_list:8} ({function})")
+            for item in summary['roman_breakdown']:
+                chord_list = ", ".join(item['chords'])
+                print(f"   {item['roman']:4} = {chord_list:8} ({item['function']})")
 
         # Chord statistics with Roman numerals
-        chord_counts = Counter(all_chords)
         print(f"\n📈 CHORD USAGE STATISTICS:")
         print("-" * 40)
-        for chord, count in chord_counts.most_common(5):
-            roman = self.chord_to_roman(chord, self.current_key) if self.current_key else "?"
-            percentage = (count / len(all_chords)) * 100
-            print(f"   {chord:6} ({roman:4}): {count} times ({percentage:.1f}%)")
+        for item in summary['chord_usage'][:5]:
+            print(f"   {item['chord']:6} ({item['roman']:4}): {item['count']} times ({item['percentage']:.1f}%)")
 
         
         # Total playing time
-        total_duration = sum([entry.get('duration', 0) for entry in self.chord_history])
-        print(f"\n⏱️  Total Playing Time: {total_duration:.1f} seconds")
+        print(f"\n⏱️  Total Playing Time: {summary['total_playing_time']:.1f} seconds")
         
         print("="*80)
     
-    def on_chord_detected(self, chord, confidence, volume):
-        """Callback for chord detection - minimal real-time output"""
-        current_time = datetime.now()
+    def on_chord_detected(self, chord, confidence, volume, timestamp=None):
+        """Callback for chord detection - minimal real-time output
+
+        timestamp defaults to now; offline analysis passes the position in the file.
+        """
+        current_time = timestamp or datetime.now()
         
         # Simple real-time feedback (no timeline spam)
-        if chord != "Unknown":
+        if chord != "Unknown" and self.verbose:
             print(f"🎵 {chord:8} | Conf: {confidence:.2f} | Vol: {volume:.3f}")
         
         # Track chord changes for progression (only high confidence chords)
@@ -370,8 +301,10 @@ class ProgressionDetector:
                     self.chord_history[-1]['duration'] = duration
             
             # Add new chord to history
+            chord_index = chord_id(chord)
             self.chord_history.append({
                 'chord': chord,
+                'chord_id': chord_index,
                 'time': current_time,
                 'confidence': confidence,
                 'duration': 0
@@ -379,16 +312,17 @@ class ProgressionDetector:
             
             self.last_chord = chord
             self.chord_start_time = current_time
-            
-            # Update key detection periodically (not every chord)
-            if len(self.chord_history) % 3 == 0:  # Every 3 chords
-                recent_chords = [entry['chord'] for entry in list(self.chord_history)[-8:]]
-                detected_key, confidence = self.detect_key(recent_chords)
-                if detected_key and confidence > 0.5:
-                    if self.current_key != detected_key:
-                        self.current_key = detected_key
-                        self.key_confidence = confidence
-                        print(f"🗝️  Key detected: {self.current_key}")
+
+            # Streaming key estimate, updated on every chord change
+            if self.update_key(chord_index) and self.verbose:
+                print(f"🗝️  Key detected: {self.current_key}")
+
+            # Stream the numeral through the pattern automaton
+            if self.key_id is not None:
+                self.pattern_state = PATTERN_MATCHER.step(self.pattern_state, ROMAN[self.key_id][chord_index])
+                for pattern_id in PATTERN_MATCHER.matches(self.pattern_state):
+                    if self.verbose:
+                        print(f"🎼 {PATTERN_MATCHER.names[pattern_id]}: {PATTERN_MATCHER.patterns[pattern_id]}")
     
     def run(self):
         """Start the progression detector"""
@@ -445,8 +379,9 @@ class ProgressionDetector:
             
             if all_chords:
                 # Convert to Roman numerals if we have a key
-                if self.current_key:
-                    roman_numerals = [self.chord_to_roman(chord, self.current_key) for chord in all_chords]
+                if self.key_id is not None:
+                    roman_numerals = [ROMAN[self.key_id][entry['chord_id']] for entry in self.chord_history
+                                      if entry['chord_id'] != UNKNOWN_CHORD]
                     print(f"\n📝 Full Progression in {self.current_key}:")
                     print("   " + " → ".join(roman_numerals))
                     
@@ -455,16 +390,15 @@ class ProgressionDetector:
                     for i in range(len(roman_numerals) - 1):
                         print(f"   {roman_numerals[i]} → {roman_numerals[i+1]}")
                     
-                    # Identify common patterns
+                    # Identify common patterns anywhere in the session, plus one still in progress
                     print("\n🎼 Common Patterns Found:")
-                    for length in range(4, 1, -1):
-                        if len(roman_numerals) >= length:
-                            pattern = "-".join(roman_numerals[-length:])
-                            for prog_pattern, name in COMMON_PROGRESSIONS.items():
-                                if pattern == prog_pattern:
-                                    print(f"   • {name}: {pattern}")
-                                elif pattern in prog_pattern:
-                                    print(f"   • Part of {name}: {pattern}")
+                    for pattern_id, count in PATTERN_MATCHER.scan(roman_numerals).most_common():
+                        times = f" (x{count})" if count > 1 else ""
+                        print(f"   • {PATTERN_MATCHER.names[pattern_id]}: {PATTERN_MATCHER.patterns[pattern_id]}{times}")
+                    state = PATTERN_MATCHER.feed(roman_numerals)
+                    for pattern_id in PATTERN_MATCHER.partial(state):
+                        print(f"   • Part of {PATTERN_MATCHER.names[pattern_id]}: "
+                              f"{'-'.join(roman_numerals[-PATTERN_MATCHER.depth[state]:])}")
                 
                 # Show chord frequency
                 chord_counts = Counter(all_chords)
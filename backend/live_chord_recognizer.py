@@ -1,9 +1,8 @@
 import numpy as np
-import sounddevice as sd
-import librosa
 import threading
-import time
-from collections import deque
+from template_matcher import TemplateMatcher
+from feature_extractors import create_extractor, DEFAULT_EXTRACTOR
+from ring_buffer import AudioRingBuffer
 
 # Audio settings
 SAMPLE_RATE = 22050
@@ -122,72 +121,70 @@ CHORD_TEMPLATES = {
     'Bdim':  [0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 1],
 }
 
+# Templates are normalized once; match_chord is a single matrix product
+TEMPLATE_MATCHER = TemplateMatcher(CHORD_TEMPLATES)
+
 class ChordDetector:
     def __init__(self):
-        self.audio_buffer = deque()
-        self.lock = threading.Lock()
+        # Preallocated ring written in place by the audio callback (bounded to prevent memory issues)
+        self.audio_buffer = AudioRingBuffer(FRAME_SIZE * 2)
+        self.lock = self.audio_buffer.lock
+        # Analysis runs once per hop of new audio; the callback wakes the loop
+        self.analysis_hop = FRAME_SIZE // 2
+        self.audio_ready = threading.Event()
         self.is_running = False
         self.on_chord_detected = None  # Callback for chord detection
         self.channels = 1  # Default to mono
+        self.feature_extractor = DEFAULT_EXTRACTOR  # "cqt" or "stft", see feature_extractors.py
+        self.chroma_stream = None  # Incremental chroma, created on first use
         
     def match_chord(self, chroma):
-        # Normalize chroma vector
-        chroma_norm = chroma / (np.linalg.norm(chroma) + 1e-8)
-        
-        max_score = -1
-        matched_chord = "Unknown"
-        confidence = 0
-        
-        for chord, template in CHORD_TEMPLATES.items():
-            template_norm = np.array(template) / (np.linalg.norm(template) + 1e-8)
-            score = np.dot(chroma_norm, template_norm)
-            
-            if score > max_score:
-                max_score = score
-                matched_chord = chord
-                confidence = score
-                
+        """Match chroma features to chord templates"""
+        matched_chord, confidence = TEMPLATE_MATCHER.match(chroma)
+
         # Only return chord if confidence is high enough
         if confidence > 0.6:  # Threshold for chord detection
             return matched_chord, confidence
         else:
             return "Unknown", confidence
+
+    def match_chords(self, chromas, top_k=1):
+        """Match a batch of (n_frames, 12) chroma frames; returns top_k (chord, score) lists"""
+        return TEMPLATE_MATCHER.top_k(chromas, top_k)
     
     def process_audio(self):
-        with self.lock:
-            if len(self.audio_buffer) < FRAME_SIZE:
-                return
-            
-            # Get audio data
-            audio_data = list(self.audio_buffer)[:FRAME_SIZE]
-            # Clear processed data
-            for _ in range(min(FRAME_SIZE // 2, len(self.audio_buffer))):
-                self.audio_buffer.popleft()
+        # Analyse every half frame of new audio, once a full frame has been heard
+        pending = self.audio_buffer.pending()
+        if pending < self.analysis_hop:
+            return
+        if self.chroma_stream is None:
+            self.chroma_stream = create_extractor(self.feature_extractor, SAMPLE_RATE)
+        if self.chroma_stream.samples_seen + pending < FRAME_SIZE:
+            return
+        
+        # Take only the audio the chroma stream has not seen yet (copied so the
+        # callback can keep writing while we analyse)
+        new_audio = self.audio_buffer.consume(copy=True)
         
         try:
-            y = np.array(audio_data, dtype=np.float32)
+            # Extract chroma features for the new hops only
+            self.chroma_stream.push(new_audio)
+            window = self.chroma_stream.frames_for(FRAME_DURATION)
             
-            # Check if there's enough signal
-            if np.max(np.abs(y)) < 0.01:  # Very quiet signal
+            # Check if there's enough signal in the window being matched, not
+            # just the new hop (a decaying chord is still worth labelling)
+            if self.audio_buffer.peak(FRAME_SIZE) < 0.01:  # Very quiet signal
                 print("Signal too quiet - play louder!")
                 return
                 
-            # Extract chroma features
-            chroma = librosa.feature.chroma_cqt(y=y, sr=SAMPLE_RATE, 
-                                               hop_length=512, 
-                                               fmin=librosa.note_to_hz('C2'))
-            
-            if chroma.size == 0:
-                return
-                
-            # Average chroma over time
-            avg_chroma = np.mean(chroma, axis=1)
+            # Average chroma over the last frame
+            avg_chroma = self.chroma_stream.mean_chroma(window)
             
             # Detect chord
             chord, confidence = self.match_chord(avg_chroma)
             
             # Calculate volume
-            volume = np.sqrt(np.mean(y**2))  # RMS volume
+            volume = self.chroma_stream.volume(window)  # RMS volume
             
             # Call the callback if set
             if self.on_chord_detected:
@@ -203,19 +200,16 @@ class ChordDetector:
         if status:
             print(f"Audio status: {status}")
             
-        with self.lock:
-            # Handle both mono and stereo inputs
-            if indata.shape[1] > 1:
-                audio_data = np.mean(indata, axis=1)  # Average both channels for stereo
-            else:
-                audio_data = indata[:, 0]  # Use single channel for mono
-                
-            # Add new audio data
-            self.audio_buffer.extend(audio_data)
+        # Handle both mono and stereo inputs
+        if indata.shape[1] > 1:
+            audio_data = np.mean(indata, axis=1)  # Average both channels for stereo
+        else:
+            audio_data = indata[:, 0]  # Use single channel for mono
             
-            # Limit buffer size to prevent memory issues
-            while len(self.audio_buffer) > FRAME_SIZE * 2:
-                self.audio_buffer.popleft()
+        # Add new audio data (oldest samples are overwritten when full)
+        self.audio_buffer.write(audio_data)
+        if self.audio_buffer.pending() >= self.analysis_hop:
+            self.audio_ready.set()
     
     def start(self, on_chord_detected=None):
         """Start the chord detector with an optional callback"""
@@ -223,6 +217,9 @@ class ChordDetector:
         self.is_running = True
         
         try:
+            # Desktop audio only; importing this module must not require PortAudio
+            import sounddevice as sd
+
             # List available audio devices
             print("Available audio devices:")
             devices = sd.query_devices()
@@ -239,8 +236,10 @@ class ChordDetector:
                               samplerate=SAMPLE_RATE,
                               blocksize=1024):
                 while self.is_running:
-                    time.sleep(0.1)  # More frequent processing
-                    self.process_audio()
+                    # Woken by the audio callback once a hop of new audio is buffered
+                    if self.audio_ready.wait(timeout=1.0):
+                        self.audio_ready.clear()
+                        self.process_audio()
                     
         except KeyboardInterrupt:
             self.is_running = False
@@ -253,6 +252,7 @@ class ChordDetector:
     def stop(self):
         """Stop the chord detector"""
         self.is_running = False
+        self.audio_ready.set()  # Wake the processing loop so it can exit
 
 if __name__ == "__main__":
     detector = ChordDetector()
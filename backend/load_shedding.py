@@ -0,0 +1,91 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+
+# Load shedding, configurable per deployment:
+#   HARMONIQ_TARGET_LATENCY_MS  analysis latency (submit → result) we try to stay under
+#   HARMONIQ_MAX_SESSIONS       hard cap on concurrent sessions (0 = no cap)
+TARGET_LATENCY = float(os.environ.get("HARMONIQ_TARGET_LATENCY_MS", 400)) / 1000
+MAX_SESSIONS = int(os.environ.get("HARMONIQ_MAX_SESSIONS", 0))
+
+CHECK_INTERVAL = 1.0  # seconds between load checks
+DEGRADE_AFTER = 2  # consecutive overloaded checks before lowering quality
+RESTORE_AFTER = 5  # consecutive relaxed checks before raising it again
+QUEUE_HIGH = 0.5  # lane queue fill fraction that counts as overloaded
+RELAXED = 0.5  # pressure below which quality may be restored
+REJECT_PRESSURE = 2.0  # at the lowest quality, refuse new sessions above this
+IDLE_AFTER = 5.0  # lanes with no audio for this long don't count
+
+
+class DegradationController:
+    """Global admission and quality controller for the analysis pool
+
+    Pressure is the worst of (lane latency / target) and (queue fill / QUEUE_HIGH)
+    over the active lanes, each taken at the 90th percentile across sessions so
+    one slow client can't degrade everyone. Sustained pressure above 1 steps the
+    quality level down, sustained pressure below RELAXED steps it back up.
+    """
+
+    def __init__(self, pool, max_level, target_latency=TARGET_LATENCY, max_sessions=MAX_SESSIONS):
+        self.pool = pool
+        self.max_level = max_level
+        self.target_latency = target_latency
+        self.max_sessions = max_sessions
+        self.level = 0
+        self.pressure = 0.0
+        self._overloaded = 0
+        self._relaxed = 0
+
+    def measure(self):
+        """Current pressure from the open lanes (0 when idle)"""
+        now = time.perf_counter()
+        lanes = [lane for lane in self.pool.lanes
+                 if lane.queue.qsize() or now - lane.last_analysed < IDLE_AFTER]
+        if not lanes:
+            return 0.0
+        latency = float(np.percentile([lane.latency for lane in lanes], 90))
+        fill = float(np.percentile([lane.queue.qsize() for lane in lanes], 90)) / max(1, self.pool.queue_size)
+        return max(latency / self.target_latency, fill / QUEUE_HIGH)
+
+    def update(self):
+        """Take one measurement; returns the new level if it changed, else None"""
+        self.pressure = self.measure()
+        if self.pressure > 1.0:
+            self._overloaded += 1
+            self._relaxed = 0
+            if self._overloaded >= DEGRADE_AFTER and self.level < self.max_level:
+                self._overloaded = 0
+                self.level += 1
+                return self.level
+        elif self.pressure < RELAXED:
+            self._relaxed += 1
+            self._overloaded = 0
+            if self._relaxed >= RESTORE_AFTER and self.level > 0:
+                self._relaxed = 0
+                self.level -= 1
+                return self.level
+        else:
+            self._overloaded = self._relaxed = 0
+        return None
+
+    def admit(self, active_sessions):
+        """Whether a new session may start"""
+        if self.max_sessions and active_sessions >= self.max_sessions:
+            return False
+        return not (self.level == self.max_level and self.pressure > REJECT_PRESSURE)
+
+    async def run(self, on_change):
+        """Check load every CHECK_INTERVAL and await on_change(level, reason) on changes"""
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            previous = self.level
+            level = self.update()
+            if level is not None:
+                reason = "overload" if level > previous else "recovered"
+                print(f"🎚️  Load pressure {self.pressure:.2f}: quality level {previous} → {level} ({reason})")
+                try:
+                    await on_change(level, reason)
+                except Exception as e:
+                    print(f"❌ Error applying quality level: {e}")
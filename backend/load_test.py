@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+import numpy as np
+import websockets
+
+from audio_frames import encode_audio_frame
+from outbound import ENCODINGS, decode_messages
+from benchmark_detection import synthesize_progression, BENCH_PROGRESSION
+
+CLIENT_SAMPLE_RATE = 16000
+PACKET_SAMPLES = 4096  # ~256 ms per frame, like the Flutter client
+
+
+def session_audio(seconds, seed, seconds_per_chord=2.0):
+    """Deterministic int16 PCM at 16 kHz plus its (chord, start, end) labels"""
+    n_chords = max(1, int(np.ceil(seconds / seconds_per_chord)))
+    chords = [BENCH_PROGRESSION[(seed + i) % len(BENCH_PROGRESSION)] for i in range(n_chords)]
+    audio, labels = synthesize_progression(chords, sr=CLIENT_SAMPLE_RATE,
+                                           seconds_per_chord=seconds_per_chord, seed=seed)
+    pcm = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+    return pcm[:int(seconds * CLIENT_SAMPLE_RATE)], labels
+
+
+class ServerMonitor:
+    """Samples CPU% and RSS of the server process from /proc (Linux only)"""
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15; the split starts at field 3
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def _rss_mb(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return None
+
+    async def run(self):
+        try:
+            last_cpu, last_time = self._cpu_seconds(), time.perf_counter()
+            while True:
+                await asyncio.sleep(self.interval)
+                cpu, now = self._cpu_seconds(), time.perf_counter()
+                self.samples.append({
+                    "cpu_percent": 100 * (cpu - last_cpu) / (now - last_time),
+                    "rss_mb": self._rss_mb(),
+                })
+                last_cpu, last_time = cpu, now
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Server monitoring stopped: {e}")
+
+    def report(self):
+        if not self.samples:
+            return None
+        cpu = [s["cpu_percent"] for s in self.samples]
+        rss = [s["rss_mb"] for s in self.samples if s["rss_mb"] is not None]
+        return {
+            "cpu_percent_mean": float(np.mean(cpu)),
+            "cpu_percent_max": float(np.max(cpu)),
+            "rss_mb_max": float(np.max(rss)) if rss else None,
+            "samples": self.samples,
+        }
+
+
+class LoadSession:
+    """One simulated player: start_session, real-time PCM stream, stop_session"""
+
+    def __init__(self, index, uri, seconds, confidence_threshold, packet_samples, legacy_json):
+        self.index = index
+        self.uri = uri
+        self.confidence_threshold = confidence_threshold
+        self.packet_samples = packet_samples
+        self.legacy_json = legacy_json
+        self.pcm, self.labels = session_audio(seconds, seed=index)
+
+        self.started_at = None
+        self.last_send = None
+        self.frames_sent = 0
+        self.late_frames = 0  # frames sent more than one packet behind schedule
+        self.messages = Counter()
+        self.frames_received = 0  # server frames; fewer than messages when batching
+        self.lag_ms = []  # chord_detected arrival minus the newest audio sent
+        self.change_latency_ms = []  # label start to first matching chord_detected
+        self._pending_changes = {}
+        self.summary = None
+        self.error = None
+
+    async def run(self):
+        try:
+            async with websockets.connect(self.uri, max_size=None) as websocket:
+                await websocket.send(json.dumps({
+                    "type": "start_session",
+                    "confidence_threshold": self.confidence_threshold
+                }))
+                receiver = asyncio.create_task(self._receive(websocket))
+                await self._stream(websocket)
+                await websocket.send(json.dumps({"type": "stop_session"}))
+                try:
+                    await asyncio.wait_for(receiver, timeout=15.0)
+                except asyncio.TimeoutError:
+                    receiver.cancel()
+                    self.error = "no session_summary within 15s"
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    async def _stream(self, websocket):
+        packet_seconds = self.packet_samples / CLIENT_SAMPLE_RATE
+        self.started_at = time.perf_counter()
+        label_iter = iter(self.labels)
+        next_label = next(label_iter, None)
+
+        for sequence, start in enumerate(range(0, len(self.pcm), self.packet_samples)):
+            # Absolute schedule so pacing doesn't drift with send jitter
+            due = self.started_at + sequence * packet_seconds
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > packet_seconds:
+                self.late_frames += 1
+
+            chunk = self.pcm[start:start + self.packet_samples]
+            if self.legacy_json:
+                await websocket.send(json.dumps({"type": "audio_data", "data": list(chunk.tobytes())}))
+            else:
+                await websocket.send(encode_audio_frame(chunk, sequence=sequence))
+            self.last_send = time.perf_counter()
+            self.frames_sent += 1
+
+            # A chord "starts" when the first frame containing it goes out
+            audio_time = start / CLIENT_SAMPLE_RATE
+            while next_label and next_label[1] <= audio_time + packet_seconds:
+                self._pending_changes[next_label[0]] = self.last_send
+                next_label = next(label_iter, None)
+
+    async def _receive(self, websocket):
+        async for raw in websocket:
+            self.frames_received += 1
+            now = time.perf_counter()
+            for message in decode_messages(raw):
+                if self._handle(message, now):
+                    return
+
+    def _handle(self, message, now):
+        """Record one server message; True once the session summary is in"""
+        message_type = message.get("type")
+        self.messages[message_type] += 1
+
+        if message_type == "chord_detected" and self.last_send:
+            self.lag_ms.append((now - self.last_send) * 1000)
+            sent = self._pending_changes.pop(message.get("chord"), None)
+            if sent:
+                self.change_latency_ms.append((now - sent) * 1000)
+        elif message_type == "session_summary":
+            self.summary = message
+            return True
+        return False
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    return {
+        "count": int(len(values)),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+async def run_load(uri, sessions, seconds, ramp=0.0, confidence_threshold=0.6,
+                   packet_samples=PACKET_SAMPLES, server_pid=None, legacy_json=False, encoding="json", batch_ms=0):
+    """Run N concurrent sessions and return an aggregate report"""
+    if encoding != "json" or batch_ms:
+        uri += ("&" if "?" in uri else "?") + urlencode({"encoding": encoding, "batch_ms": batch_ms})
+    players = [LoadSession(i, uri, seconds, confidence_threshold, packet_samples, legacy_json)
+               for i in range(sessions)]
+    monitor = ServerMonitor(server_pid) if server_pid else None
+    monitor_task = asyncio.create_task(monitor.run()) if monitor else None
+
+    async def start(player):
+        # Spread connections over the ramp so the server isn't hit all at once
+        if ramp and sessions > 1:
+            await asyncio.sleep(ramp * player.index / (sessions - 1))
+        await player.run()
+
+    print(f"🎸 {sessions} session(s) × {seconds:.0f}s of audio → {uri}")
+    started = time.perf_counter()
+    await asyncio.gather(*(start(player) for player in players))
+    elapsed = time.perf_counter() - started
+    if monitor_task:
+        monitor_task.cancel()
+
+    messages = Counter()
+    for player in players:
+        messages.update(player.messages)
+    summaries = [player.summary for player in players if player.summary]
+
+    return {
+        "uri": uri,
+        "sessions": sessions,
+        "audio_seconds_per_session": seconds,
+        "packet_samples": packet_samples,
+        "transport": "json" if legacy_json else "binary",
+        "wall_seconds": elapsed,
+        "failed_sessions": sum(1 for player in players if player.error),
+        "errors": [player.error for player in players if player.error][:10],
+        "frames_sent": sum(player.frames_sent for player in players),
+        "late_frames": sum(player.late_frames for player in players),
+        "frames_missed": sum(s.get("frames_missed", 0) for s in summaries),
+        "chunks_dropped": sum(s.get("chunks_dropped", 0) for s in summaries),
+        "outbound_dropped": sum((s.get("outbound") or {}).get("dropped", 0) for s in summaries),
+        "encoding": encoding,
+        "batch_ms": batch_ms,
+        "messages": dict(messages),
+        "frames_received": sum(player.frames_received for player in players),
+        "messages_per_second": {k: v / elapsed for k, v in messages.items()},
+        "detection_lag_ms": _percentiles([x for p in players for x in p.lag_ms]),
+        "chord_change_latency_ms": _percentiles([x for p in players for x in p.change_latency_ms]),
+        "server": monitor.report() if monitor else None,
+    }
+
+
+def print_report(report):
+    print(f"\n📊 {report['sessions']} session(s), {report['wall_seconds']:.1f}s wall, "
+          f"{report['failed_sessions']} failed")
+    print(f"   Frames sent: {report['frames_sent']} (late: {report['late_frames']}, "
+          f"missed by server: {report['frames_missed']}, dropped by analysis: {report['chunks_dropped']}, "
+          f"messages dropped by server: {report['outbound_dropped']})")
+    print(f"   Server frames: {report['frames_received']} ({report['encoding']}, "
+          f"batch {report['batch_ms']:g} ms) for {sum(report['messages'].values())} messages")
+    for message_type, rate in sorted(report["messages_per_second"].items()):
+        print(f"   {message_type}: {report['messages'][message_type]} ({rate:.1f}/s)")
+    for name in ("detection_lag_ms", "chord_change_latency_ms"):
+        stats = report[name]
+        if stats:
+            print(f"   {name}: p50 {stats['p50']:.0f} | p90 {stats['p90']:.0f} | "
+                  f"p99 {stats['p99']:.0f} | max {stats['max']:.0f} (n={stats['count']})")
+    server = report["server"]
+    if server:
+        print(f"   Server CPU: {server['cpu_percent_mean']:.0f}% mean, {server['cpu_percent_max']:.0f}% max | "
+              f"RSS max: {server['rss_mb_max']:.0f} MB")
+    for error in report["errors"]:
+        print(f"   ❌ {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Harmoniq WebSocket server")
+    parser.add_argument("--uri", default="ws://localhost:8000/ws")
+    parser.add_argument("-n", "--sessions", type=int, default=10, help="concurrent sessions")
+    parser.add_argument("-d", "--duration", type=float, default=30.0, help="seconds of audio per session")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which sessions connect")
+    parser.add_argument("--confidence", type=float, default=0.6)
+    parser.add_argument("--packet-samples", type=int, default=PACKET_SAMPLES)
+    parser.add_argument("--server-pid", type=int, help="sample this process's CPU and RSS from /proc")
+    parser.add_argument("--json-audio", action="store_true", help="use the legacy JSON audio_data messages")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json", help="server message encoding")
+    parser.add_argument("--batch-ms", type=float, default=0, help="ask the server to batch messages over this window")
+    parser.add_argument("-o", "--output", help="save the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.uri, args.sessions, args.duration, args.ramp, args.confidence,
+                                  args.packet_samples, args.server_pid, args.json_audio,
+                                  args.encoding, args.batch_ms))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
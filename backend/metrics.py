@@ -0,0 +1,188 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Pipeline stages timed for every audio chunk / detection
+STAGES = ("decode", "buffer", "resample", "chroma", "match", "progression", "send")
+
+# Histogram bucket upper bounds in seconds (100 µs .. 1 s)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+            if seconds > self.max:
+                self.max = seconds
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs, ending with +Inf"""
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def snapshot(self):
+        """JSON-serializable copy of the counts (for aggregating across processes)"""
+        with self._lock:
+            return {"counts": list(self.counts), "sum": self.sum, "count": self.count, "max": self.max}
+
+    def merge(self, snapshot):
+        """Add another histogram's snapshot (same buckets) into this one"""
+        with self._lock:
+            for i, count in enumerate(snapshot["counts"]):
+                self.counts[i] += count
+            self.sum += snapshot["sum"]
+            self.count += snapshot["count"]
+            self.max = max(self.max, snapshot["max"])
+
+    def quantile(self, q):
+        """Approximate quantile: upper bound of the bucket holding the q-th observation"""
+        pairs = self.cumulative()
+        if not pairs[-1][1]:
+            return None
+        target = q * pairs[-1][1]
+        for bound, total in pairs:
+            if total >= target:
+                # Observations past the last bucket report the largest value seen
+                return min(bound, self.max)
+        return self.max
+
+
+class StageTimings:
+    """One histogram per pipeline stage; observations also feed an optional parent"""
+
+    def __init__(self, parent=None, buckets=DEFAULT_BUCKETS):
+        self.parent = parent
+        self.histograms = {stage: Histogram(buckets) for stage in STAGES}
+
+    def observe(self, stage, seconds):
+        self.histograms[stage].observe(seconds)
+        if self.parent is not None:
+            self.parent.observe(stage, seconds)
+
+    def snapshot(self):
+        return {stage: histogram.snapshot() for stage, histogram in self.histograms.items()}
+
+    def merge(self, snapshot):
+        """Add a StageTimings snapshot (e.g. from another worker process); returns self"""
+        for stage, histogram_snapshot in snapshot.items():
+            if stage in self.histograms:
+                self.histograms[stage].merge(histogram_snapshot)
+        return self
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def summary(self):
+        """Per-stage count, mean and approximate p50/p99 in milliseconds"""
+        result = {}
+        for stage, histogram in self.histograms.items():
+            if histogram.count:
+                result[stage] = {
+                    "count": histogram.count,
+                    "mean_ms": histogram.sum / histogram.count * 1000,
+                    "p50_ms": histogram.quantile(0.5) * 1000,
+                    "p99_ms": histogram.quantile(0.99) * 1000,
+                }
+        return result
+
+
+class StageLog(list):
+    """Picklable stand-in for StageTimings inside worker processes
+
+    Collects (stage, seconds) pairs that the parent replays into the real
+    session histograms.
+    """
+
+    def observe(self, stage, seconds):
+        self.append((stage, seconds))
+
+
+# Process-wide histograms (all sessions, including finished ones)
+GLOBAL_TIMINGS = StageTimings()
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _format_labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _histogram_lines(name, histogram, labels):
+    lines = []
+    for bound, total in histogram.cumulative():
+        bucket_labels = _format_labels({**labels, "le": _format_bound(bound)})
+        lines.append(f"{name}_bucket{{{bucket_labels}}} {total}")
+    label_text = _format_labels(labels)
+    lines.append(f"{name}_sum{{{label_text}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{label_text}}} {histogram.count}")
+    return lines
+
+
+def render_prometheus(global_timings, session_timings=None, gauges=None, session_counters=None, session_gauges=None):
+    """Render histograms and gauges in the Prometheus text exposition format
+
+    session_timings: {session label: StageTimings} for active sessions
+    gauges: {metric name: (help text, value or {worker: value})}
+    session_counters: {metric name: (help text, {session label: value})}
+    session_gauges: the same, for values that go up and down
+    """
+    lines = [
+        "# HELP harmoniq_stage_seconds Time spent per pipeline stage, all sessions",
+        "# TYPE harmoniq_stage_seconds histogram",
+    ]
+    for stage, histogram in global_timings.histograms.items():
+        lines.extend(_histogram_lines("harmoniq_stage_seconds", histogram, {"stage": stage}))
+
+    if session_timings:
+        lines.append("# HELP harmoniq_session_stage_seconds Time spent per pipeline stage, per active session")
+        lines.append("# TYPE harmoniq_session_stage_seconds histogram")
+        for session, timings in session_timings.items():
+            for stage, histogram in timings.histograms.items():
+                lines.extend(_histogram_lines("harmoniq_session_stage_seconds", histogram,
+                                              {"session": session, "stage": stage}))
+
+    for name, (help_text, value) in (gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for worker, worker_value in value.items():
+                lines.append(f'{name}{{worker="{worker}"}} {worker_value}')
+        else:
+            lines.append(f"{name} {value}")
+
+    for metric_type, metrics in (("counter", session_counters), ("gauge", session_gauges)):
+        for name, (help_text, values) in (metrics or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for session, value in values.items():
+                lines.append(f'{name}{{session="{session}"}} {value}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,167 @@
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+from enhanced_chord_detector import TEMPLATE_MATCHER, SAMPLE_RATE, FRAME_DURATION
+from feature_extractors import create_extractor, DEFAULT_EXTRACTOR, FEATURE_EXTRACTORS
+from live_chord_progression import ProgressionDetector
+
+# Audio decoded per read, and hops analysed per vectorized CQT pass
+BLOCK_SECONDS = 30
+OFFLINE_BLOCK_HOPS = 128
+
+# Offline sessions start at a fixed origin so timestamps are file positions
+SESSION_ORIGIN = datetime(2000, 1, 1)
+
+
+def open_audio_blocks(path, block_seconds=BLOCK_SECONDS):
+    """Return (sample_rate, generator of mono float32 blocks) for an audio file"""
+    try:
+        info = sf.info(path)
+    except RuntimeError:
+        # Formats libsndfile cannot read go through librosa/audioread (whole file)
+        import librosa
+        y, sr = librosa.load(path, sr=None, mono=True)
+        block = int(block_seconds * sr)
+        return sr, (y[start:start + block] for start in range(0, len(y), block))
+
+    def blocks():
+        for block in sf.blocks(path, blocksize=int(block_seconds * info.samplerate),
+                               dtype='float32', always_2d=True):
+            yield block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+
+    return info.samplerate, blocks()
+
+
+def file_chroma(path, block_seconds=BLOCK_SECONDS, feature_extractor=DEFAULT_EXTRACTOR):
+    """Chroma (12, n_frames) and per-frame energy for a whole file, computed block by block"""
+    sr, blocks = open_audio_blocks(path, block_seconds)
+    resampler = None
+    if sr != SAMPLE_RATE:
+        resampler = soxr.ResampleStream(sr, SAMPLE_RATE, 1, dtype='float32')
+    stream = create_extractor(feature_extractor, SAMPLE_RATE, max_block_hops=OFFLINE_BLOCK_HOPS)
+
+    chroma_blocks = []
+    energy_blocks = []
+    for block in blocks:
+        if resampler:
+            block = resampler.resample_chunk(block)
+        chroma, energy = stream.process(block)
+        chroma_blocks.append(chroma)
+        energy_blocks.append(energy)
+    if resampler:
+        chroma, energy = stream.process(resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+        chroma_blocks.append(chroma)
+        energy_blocks.append(energy)
+
+    chroma = np.concatenate(chroma_blocks, axis=1) if chroma_blocks else np.zeros((12, 0), dtype=np.float32)
+    energy = np.concatenate(energy_blocks) if energy_blocks else np.zeros(0, dtype=np.float32)
+    return chroma, energy, stream.samples_seen / SAMPLE_RATE, stream.hop_length
+
+
+def window_chords(chroma, energy, window_frames, step_frames, confidence_threshold=0.6, volume_threshold=0.01):
+    """Batch-match every analysis window
+
+    Windows mirror the live detector: one full frame, then every half frame.
+    Returns (end_frames, chords, confidences, volumes) for windows loud enough to match.
+    """
+    n_frames = chroma.shape[1]
+    if n_frames < window_frames:
+        return np.zeros(0, dtype=int), [], np.zeros(0), np.zeros(0)
+
+    # Window means from running sums: one pass over the chroma, no per-window loop
+    ends = np.arange(window_frames, n_frames + 1, step_frames)
+    chroma_sum = np.vstack([np.zeros((1, 12)), np.cumsum(chroma.T, axis=0, dtype=np.float64)])
+    energy_sum = np.concatenate([[0.0], np.cumsum(energy, dtype=np.float64)])
+    means = (chroma_sum[ends] - chroma_sum[ends - window_frames]) / window_frames
+    volumes = np.sqrt(np.maximum(energy_sum[ends] - energy_sum[ends - window_frames], 0) / window_frames)
+
+    loud = volumes >= volume_threshold
+    ends, means, volumes = ends[loud], means[loud], volumes[loud]
+    best, scores = TEMPLATE_MATCHER.match_batch(means)
+    chords = [
+        TEMPLATE_MATCHER.names[i] if score > confidence_threshold else "Unknown"
+        for i, score in zip(best, scores)
+    ]
+    return ends, chords, scores, volumes
+
+
+def analyze_file(path, confidence_threshold=0.6, volume_threshold=0.01, include_detections=False,
+                 feature_extractor=DEFAULT_EXTRACTOR):
+    """Run a recorded file through chroma → template → progression and return the summary"""
+    started = time.perf_counter()
+    chroma, energy, duration, hop_length = file_chroma(path, feature_extractor=feature_extractor)
+
+    window_frames = max(1, int(round(FRAME_DURATION * SAMPLE_RATE / hop_length)))
+    step_frames = max(1, int(round(FRAME_DURATION / 2 * SAMPLE_RATE / hop_length)))
+    ends, chords, confidences, volumes = window_chords(
+        chroma, energy, window_frames, step_frames, confidence_threshold, volume_threshold
+    )
+
+    # Same progression/key tracking as a live session, driven by file time
+    progression = ProgressionDetector(history_size=None)
+    progression.verbose = False
+    progression.session_start_time = SESSION_ORIGIN
+    detections = []
+    for end_frame, chord, confidence, volume in zip(ends, chords, confidences, volumes):
+        seconds = float(end_frame * hop_length / SAMPLE_RATE)
+        progression.on_chord_detected(chord, float(confidence), float(volume),
+                                      timestamp=SESSION_ORIGIN + timedelta(seconds=seconds))
+        if include_detections:
+            detections.append({
+                "time": seconds,
+                "chord": chord,
+                "confidence": float(confidence),
+                "volume": float(volume),
+            })
+
+    # Finalize last chord duration, as ProgressionDetector.stop does
+    end_time = SESSION_ORIGIN + timedelta(seconds=duration)
+    if progression.chord_history and progression.chord_start_time:
+        progression.chord_history[-1]['duration'] = (end_time - progression.chord_start_time).total_seconds()
+
+    elapsed = time.perf_counter() - started
+    result = {
+        "file": str(path),
+        "duration": duration,
+        "sample_rate": SAMPLE_RATE,
+        "feature_extractor": feature_extractor,
+        "window_seconds": FRAME_DURATION,
+        "hop_seconds": step_frames * hop_length / SAMPLE_RATE,
+        "analysis_seconds": elapsed,
+        "realtime_factor": duration / elapsed if elapsed > 0 else None,
+        "summary": progression.session_summary(end_time),
+    }
+    if include_detections:
+        result["detections"] = detections
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse the chord progression of a recorded audio file")
+    parser.add_argument("input", help="audio file (WAV, FLAC, MP3, ...)")
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    parser.add_argument("--confidence", type=float, default=0.6, help="chord match threshold (default 0.6)")
+    parser.add_argument("--volume", type=float, default=0.01, help="RMS volume below which windows are skipped")
+    parser.add_argument("--detections", action="store_true", help="include every matched window in the output")
+    parser.add_argument("--extractor", choices=sorted(FEATURE_EXTRACTORS), default=DEFAULT_EXTRACTOR,
+                        help="chroma feature extractor (default cqt)")
+    args = parser.parse_args(argv)
+
+    result = analyze_file(args.input, args.confidence, args.volume, args.detections, args.extractor)
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"✅ {args.input}: {result['duration']:.1f}s analysed in {result['analysis_seconds']:.1f}s → {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter, deque
+
+import msgpack
+
+# Outbound message encoding, negotiated per connection:
+#   ?encoding=msgpack (or the "harmoniq.msgpack" WebSocket subprotocol)
+#       binary msgpack frames instead of JSON text frames
+#   ?batch_ms=20
+#       collect the messages of a short window into one
+#       {"type": "batch", "messages": [...]} frame (0 = one frame per message)
+# Defaults (JSON, no batching) are what existing clients expect.
+ENCODINGS = ("json", "msgpack")
+DEFAULT_ENCODING = "json"
+SUBPROTOCOL_PREFIX = "harmoniq."
+MAX_BATCH_MS = 250
+
+# Per-connection send queue, configurable per deployment:
+#   HARMONIQ_OUTBOUND_QUEUE_SIZE  messages waiting for a slow client before some are dropped
+OUTBOUND_QUEUE_SIZE = int(os.environ.get("HARMONIQ_OUTBOUND_QUEUE_SIZE", 64))
+
+# What happens to a message type when its connection can't keep up
+RELIABLE = "reliable"  # always delivered (may briefly exceed the queue size)
+DROP_OLDEST = "drop_oldest"  # a full queue evicts the oldest of these first
+LATEST = "latest"  # a newer one replaces any still waiting, so at most one is queued
+MESSAGE_POLICIES = {
+    "chord_detected": DROP_OLDEST,
+    "key_detected": LATEST,
+    "quality_changed": LATEST,
+}
+
+
+def negotiate(subprotocols, query_params):
+    """(encoding, accepted subprotocol or None, batch window in seconds) for a new connection"""
+    for subprotocol in subprotocols or ():
+        encoding = subprotocol[len(SUBPROTOCOL_PREFIX):] if subprotocol.startswith(SUBPROTOCOL_PREFIX) else None
+        if encoding in ENCODINGS:
+            break
+    else:
+        encoding, subprotocol = query_params.get("encoding", DEFAULT_ENCODING), None
+        if encoding not in ENCODINGS:
+            encoding = DEFAULT_ENCODING
+    try:
+        batch_ms = float(query_params.get("batch_ms", 0))
+    except ValueError:
+        batch_ms = 0.0
+    return encoding, subprotocol, max(0.0, min(MAX_BATCH_MS, batch_ms)) / 1000
+
+
+def encode_message(message, encoding=DEFAULT_ENCODING):
+    """One outbound frame: str (JSON text frame) or bytes (msgpack binary frame)"""
+    if encoding == "msgpack":
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message)
+
+
+def decode_messages(raw):
+    """Messages carried by one received frame (for clients; unwraps batches)"""
+    message = msgpack.unpackb(raw, raw=False) if isinstance(raw, (bytes, bytearray)) else json.loads(raw)
+    if message.get("type") == "batch":
+        return message["messages"]
+    return [message]
+
+
+class Outbox:
+    """Outbound side of one WebSocket: a bounded queue drained by its own writer task
+
+    put() never waits, so detection callbacks and room fan-out can't be held
+    up by a slow client; the writer sends in order, and when the client falls
+    behind the queue fills and MESSAGE_POLICIES decides what gives way. With a
+    batch window the writer waits that long after the first message and sends
+    everything queued as one batch frame.
+    """
+
+    def __init__(self, websocket, encoding=DEFAULT_ENCODING, batch_window=0.0, queue_size=OUTBOUND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.queue = deque()  # (type, policy, message, pre-encoded frame or None)
+        self.timings = None  # StageTimings for the "send" stage, set by the session
+        self.messages_sent = 0
+        self.frames_sent = 0
+        self.max_depth = 0
+        self.coalesced = 0
+        self.dropped = Counter()  # message type -> messages dropped
+        self._ready = asyncio.Event()
+        self._finishing = False
+        self.closed = False
+        self.task = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def put(self, message, frame=None):
+        """Queue a message (optionally already encoded); False if it was dropped"""
+        if self._finishing or self.closed:
+            return False
+        message_type = message.get("type")
+        policy = MESSAGE_POLICIES.get(message_type, RELIABLE)
+        if policy == LATEST:
+            for item in self.queue:
+                if item[0] == message_type:
+                    self.queue.remove(item)
+                    self.coalesced += 1
+                    break
+        if len(self.queue) >= self.queue_size:
+            victim = next((item for item in self.queue if item[1] == DROP_OLDEST), None)
+            if victim is not None:
+                self.queue.remove(victim)
+                self.dropped[victim[0]] += 1
+            elif policy == DROP_OLDEST:
+                self.dropped[message_type] += 1
+                return False
+        self.queue.append((message_type, policy, message, frame))
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._ready.set()
+        return True
+
+    async def send(self, message):
+        self.put(message)
+
+    async def _write_loop(self):
+        while not self.closed:
+            if not self.queue:
+                if self._finishing:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                if self.batch_window and not self._finishing:
+                    await asyncio.sleep(self.batch_window)
+                continue
+            if self.batch_window:
+                items, self.queue = list(self.queue), deque()
+            else:
+                items = [self.queue.popleft()]
+            await self._write(items)
+
+    async def _write(self, items):
+        batch = []
+        for _, _, message, frame in items:
+            if self.closed:
+                return
+            if frame is None and self.batch_window:
+                batch.append(message)
+                continue
+            if batch:
+                await self._send_batch(batch)
+                batch = []
+            await self._send_frame(frame if frame is not None else encode_message(message, self.encoding), 1)
+        if batch:
+            await self._send_batch(batch)
+
+    async def _send_batch(self, messages):
+        payload = messages[0] if len(messages) == 1 else {"type": "batch", "messages": messages}
+        await self._send_frame(encode_message(payload, self.encoding), len(messages))
+
+    async def _send_frame(self, frame, messages):
+        started = time.perf_counter()
+        try:
+            if isinstance(frame, bytes):
+                await self.websocket.send_bytes(frame)
+            else:
+                await self.websocket.send_text(frame)
+            self.messages_sent += messages
+            self.frames_sent += 1
+        except Exception as e:
+            # The socket is gone; stop writing and let the endpoint clean up
+            print(f"Error sending message: {e}")
+            self.closed = True
+            self.queue.clear()
+            return
+        if self.timings is not None:
+            self.timings.observe("send", time.perf_counter() - started)
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    def stats(self):
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "messages_sent": self.messages_sent,
+            "frames_sent": self.frames_sent,
+            "coalesced": self.coalesced,
+            "dropped": sum(self.dropped.values()),
+            "dropped_by_type": dict(self.dropped),
+        }
+
+    def finish(self):
+        """Send what's queued, then stop the writer"""
+        self._finishing = True
+        self._ready.set()
+
+    def close(self):
+        """Stop at once (the socket is going away)"""
+        self.closed = True
+        self.task.cancel()
+        self.queue.clear()
@@ -0,0 +1,248 @@
+import os
+import re
+from collections import Counter, defaultdict, deque
+
+from harmony import chord_to_roman
+
+# Longest n-gram kept in the index; longer queries are answered by intersecting
+# the postings of their MAX_NGRAM-grams and checking the candidates' sequences
+MAX_NGRAM = 4
+REFRESH_INTERVAL = 10.0  # seconds between picking up sessions and favorites stored by other workers
+REFRESH_OVERLAP = 60.0
+
+# Without persistence, live sessions are the only copy of their progressions:
+#   HARMONIQ_INDEX_UNSTORED_SESSIONS  how many of the newest this worker keeps searchable
+MAX_UNSTORED_SESSIONS = int(os.environ.get("HARMONIQ_INDEX_UNSTORED_SESSIONS", 1000))
+
+_SEPARATORS = re.compile(r"\s*(?:->|→|–|,|\s-\s|-|\s)\s*")
+_CHORD_NAME = re.compile(r"^[A-G][#b]?")
+
+
+def parse_progression(text):
+    """Split 'Imaj7 -> IVmaj7', 'ii-V-I' or 'ii V I' into tokens"""
+    if isinstance(text, (list, tuple)):
+        return [token for token in text if token]
+    return [token for token in _SEPARATORS.split(text.strip()) if token]
+
+
+def normalize_roman(token):
+    """Spell a Roman numeral the way chord_to_roman does (Imaj7 -> IM7)"""
+    return token.replace("maj7", "M7").replace("Maj7", "M7")
+
+
+def base_roman(token):
+    """Roman numeral without its seventh (IM7 -> I, ii7 -> ii)"""
+    if token.startswith("("):
+        return token
+    for suffix in ("M7", "7"):
+        if token.endswith(suffix):
+            return token[:-len(suffix)]
+    return token
+
+
+def to_romans(chords, key):
+    """Key-relative Roman numerals for a chord sequence, repeated chords collapsed"""
+    romans = []
+    spelled = {}  # Sessions reuse a handful of chords; convert each once
+    for chord in chords:
+        if chord == "Unknown":
+            continue
+        roman = spelled.get(chord)
+        if roman is None:
+            roman = spelled[chord] = chord_to_roman(chord, key) if key else chord
+        if not romans or romans[-1] != roman:
+            romans.append(roman)
+    return romans
+
+
+def favorite_romans(chord_sequence, key=None):
+    """Tokens of a stored favorite: Roman numerals as given, or chord names converted in its key"""
+    tokens = parse_progression(chord_sequence)
+    if key and tokens and all(_CHORD_NAME.match(token) for token in tokens):
+        if len(key.split()) == 1:
+            key = f"{key[:-1]} minor" if key.endswith("m") else f"{key} major"
+        return to_romans(tokens, key)
+    return [normalize_roman(token) for token in tokens]
+
+
+class NgramIndex:
+    """Inverted index from token n-grams (1..max_n) to the documents containing them"""
+
+    def __init__(self, max_n=MAX_NGRAM):
+        self.max_n = max_n
+        self.token_ids = {}
+        self.tokens = []
+        self.sequences = {}  # doc -> tuple of token ids
+        self.postings = defaultdict(dict)  # n-gram -> {doc: occurrences}
+        self.totals = [Counter() for _ in range(max_n + 1)]  # n -> n-gram -> occurrences
+
+    def _intern(self, token):
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = self.token_ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return token_id
+
+    def _ngrams(self, sequence):
+        """Occurrences of every 1..max_n-gram in a sequence"""
+        grams = Counter()
+        for n in range(1, self.max_n + 1):
+            grams.update(zip(*(sequence[i:] for i in range(n))))
+        return grams
+
+    def add(self, doc, tokens):
+        """Index (or re-index) one document"""
+        if doc in self.sequences:
+            self.remove(doc)
+        sequence = tuple(self._intern(token) for token in tokens)
+        self.sequences[doc] = sequence
+        for gram, count in self._ngrams(sequence).items():
+            self.postings[gram][doc] = count
+            self.totals[len(gram)][gram] += count
+
+    def remove(self, doc):
+        sequence = self.sequences.pop(doc, None)
+        if sequence is None:
+            return
+        for gram, count in self._ngrams(sequence).items():
+            docs = self.postings[gram]
+            del docs[doc]
+            if not docs:
+                del self.postings[gram]
+            totals = self.totals[len(gram)]
+            totals[gram] -= count
+            if not totals[gram]:
+                del totals[gram]
+
+    def find(self, tokens):
+        """{doc: occurrences} of a token sequence"""
+        ids = []
+        for token in tokens:
+            if token not in self.token_ids:
+                return {}
+            ids.append(self.token_ids[token])
+        query = tuple(ids)
+        if len(query) <= self.max_n:
+            return dict(self.postings.get(query, {}))
+
+        # Longer than any indexed n-gram: candidates must contain every window
+        windows = [query[start:start + self.max_n] for start in range(len(query) - self.max_n + 1)]
+        windows.sort(key=lambda gram: len(self.postings.get(gram, ())))
+        candidates = set(self.postings.get(windows[0], ()))
+        for gram in windows[1:]:
+            candidates &= self.postings.get(gram, {}).keys()
+            if not candidates:
+                return {}
+        matches = {}
+        for doc in candidates:
+            sequence = self.sequences[doc]
+            count = sum(1 for start in range(len(sequence) - len(query) + 1)
+                        if sequence[start:start + len(query)] == query)
+            if count:
+                matches[doc] = count
+        return matches
+
+    def most_common(self, n, limit):
+        """[(tokens, occurrences, documents)] of the most frequent n-grams"""
+        return [([self.tokens[token_id] for token_id in gram], count, len(self.postings[gram]))
+                for gram, count in self.totals[n].most_common(limit)]
+
+
+class ProgressionIndex:
+    """Roman-numeral progression search over stored sessions and favorites
+
+    Every document is indexed twice: exactly as spelled (IM7-IVM7) and with
+    sevenths stripped (I-IV), so 'ii-V-I' also finds 'ii7-V7-IM7' when loose.
+    """
+
+    def __init__(self, max_n=MAX_NGRAM, max_unstored=MAX_UNSTORED_SESSIONS):
+        self.exact = NgramIndex(max_n)
+        self.loose = NgramIndex(max_n)
+        self.documents = {}  # doc -> metadata shown in results
+        self.max_unstored = max_unstored
+        self._unstored = deque()  # sessions not in any store, oldest first
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, doc, romans, **metadata):
+        self.documents[doc] = {"id": doc, **metadata}
+        self.exact.add(doc, romans)
+        self.loose.add(doc, [base_roman(roman) for roman in romans])
+
+    def remove(self, doc):
+        self.documents.pop(doc, None)
+        self.exact.remove(doc)
+        self.loose.remove(doc)
+
+    def add_session(self, store_id, chords, key, stored=True, **metadata):
+        """Index a session; unstored ones (no session store) are capped at max_unstored, oldest dropped"""
+        doc = f"session:{store_id}"
+        self.add(doc, to_romans(chords, key), type="session", key=key, **metadata)
+        if not stored:
+            self._unstored.append(doc)
+            while len(self._unstored) > self.max_unstored:
+                self.remove(self._unstored.popleft())
+
+    def add_favorite(self, favorite):
+        self.add(f"favorite:{favorite['id']}", favorite_romans(favorite["chord_sequence"], favorite.get("key")),
+                 type="favorite", key=favorite.get("key"), name=favorite.get("name"), artist=favorite.get("artist"))
+
+    def search(self, progression, loose=False, limit=20, doc_type=None):
+        """Documents containing a progression, most occurrences first"""
+        tokens = [normalize_roman(token) for token in parse_progression(progression)]
+        index = self.exact
+        if loose:
+            tokens = [base_roman(token) for token in tokens]
+            index = self.loose
+        matches = [(doc, count) for doc, count in index.find(tokens).items()
+                   if doc_type is None or self.documents[doc]["type"] == doc_type]
+        matches.sort(key=lambda match: -match[1])
+        return {
+            "progression": "-".join(tokens),
+            "total": len(matches),
+            "matches": [{**self.documents[doc], "occurrences": count} for doc, count in matches[:limit]],
+        }
+
+    def top_progressions(self, n=4, limit=20, loose=False):
+        """Most frequent n-chord progressions across all documents"""
+        index = self.loose if loose else self.exact
+        n = max(1, min(index.max_n, int(n)))
+        return [{"progression": "-".join(tokens), "occurrences": count, "documents": documents}
+                for tokens, count, documents in index.most_common(n, limit)]
+
+
+def stored_sessions(store, ended_after=None):
+    """Finished sessions from a SessionStore (with some overlap before ended_after)"""
+    if ended_after is not None:
+        # Other workers' batched writes can land slightly out of end-time order
+        ended_after -= REFRESH_OVERLAP
+    return list(store.finished_sessions(ended_after))
+
+
+def index_sessions(index, sessions, cursor=None):
+    """Add sessions that aren't indexed yet; returns the latest end time seen"""
+    for session in sessions:
+        cursor = session["end_time"] if cursor is None else max(cursor, session["end_time"])
+        if f"session:{session['id']}" not in index.documents:
+            index.add_session(session["id"], session["chords"], session["detected_key"],
+                              session_id=session["session_id"], start_time=session["start_time"])
+    return cursor
+
+
+def sync_favorites(index, favorites):
+    """Make the indexed favorites match the store's (added or deleted on any worker)"""
+    stored = {f"favorite:{favorite['id']}": favorite for favorite in favorites}
+    for doc in [doc for doc, metadata in index.documents.items()
+                if metadata["type"] == "favorite" and doc not in stored]:
+        index.remove(doc)
+    for doc, favorite in stored.items():
+        if doc not in index.documents:
+            index.add_favorite(favorite)
+
+
+def build_index(store):
+    """Index every finished session and favorite in a SessionStore; returns (index, end time cursor)"""
+    index = ProgressionIndex()
+    sync_favorites(index, store.list_favorites())
+    return index, index_sessions(index, store.finished_sessions())
@@ -0,0 +1,112 @@
+from collections import Counter, deque
+
+
+class ProgressionMatcher:
+    """Aho–Corasick automaton over Roman-numeral tokens, compiled once from a pattern library
+
+    Numerals are fed one at a time with step(); each step costs O(1) amortized
+    plus the matches it reports, however many patterns there are. Tokens are
+    compared whole, so 'V-I' never matches inside 'IV-I'.
+    """
+
+    def __init__(self, patterns):
+        # patterns: {"ii-V-I": "Jazz turnaround", ...}
+        self.patterns = []  # pattern id -> "ii-V-I"
+        self.names = []  # pattern id -> "Jazz turnaround"
+        self.goto = [{}]  # state -> {token: state}
+        self.fail = [0]
+        self.depth = [0]
+        self.output = [None]  # state -> pattern id ending exactly here
+        self.output_link = [0]  # state -> nearest shorter suffix state with an output (0 = none)
+        self.prefix_of = [[]]  # state -> pattern ids it's a proper prefix of (partial matches)
+
+        for pattern, name in patterns.items():
+            self._insert(pattern, name)
+        self._link()
+
+    def _insert(self, pattern, name):
+        pattern_id = len(self.patterns)
+        self.patterns.append(pattern)
+        self.names.append(name)
+        tokens = pattern.split("-")
+        state = 0
+        for i, token in enumerate(tokens):
+            if token not in self.goto[state]:
+                self.goto[state][token] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.depth.append(self.depth[state] + 1)
+                self.output.append(None)
+                self.output_link.append(0)
+                self.prefix_of.append([])
+            state = self.goto[state][token]
+            if i < len(tokens) - 1:
+                self.prefix_of[state].append(pattern_id)
+        if self.output[state] is None:
+            self.output[state] = pattern_id
+
+    def _link(self):
+        # Breadth-first, so every shorter state's links are final before they're used
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(token, 0)
+                self.output_link[child] = (self.fail[child] if self.output[self.fail[child]] is not None
+                                           else self.output_link[self.fail[child]])
+                queue.append(child)
+
+    def step(self, state, token):
+        """State after consuming one numeral (start from state 0)"""
+        while state and token not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(token, 0)
+
+    def feed(self, tokens, state=0):
+        """State after consuming a sequence of numerals"""
+        for token in tokens:
+            state = self.step(state, token)
+        return state
+
+    def matches(self, state):
+        """Ids of the patterns ending at this state, longest first"""
+        found = [] if self.output[state] is None else [self.output[state]]
+        state = self.output_link[state]
+        while state:
+            found.append(self.output[state])
+            state = self.output_link[state]
+        return found
+
+    def partial(self, state, min_length=2):
+        """Ids of the patterns the latest numerals have started (at least min_length of them)
+
+        Walks the failure chain, so a pattern started by a shorter suffix of the
+        recent numerals counts too; patterns started by longer suffixes come first.
+        """
+        found = []
+        while self.depth[state] >= min_length:
+            found.extend(pattern_id for pattern_id in self.prefix_of[state] if pattern_id not in found)
+            state = self.fail[state]
+        return found
+
+    def scan(self, tokens):
+        """Counter of pattern id -> full matches anywhere in a sequence"""
+        found = Counter()
+        state = 0
+        for token in tokens:
+            state = self.step(state, token)
+            found.update(self.matches(state))
+        return found
+
+    def describe(self, state):
+        """Name of the longest pattern just completed, or 'Part of ...' the one in progress"""
+        full = self.matches(state)
+        if full:
+            return self.names[full[0]]
+        partial = self.partial(state)
+        if partial:
+            return f"Part of {self.names[partial[0]]}"
+        return None
@@ -0,0 +1,41 @@
+from harmony import KEY_NAMES, KEY_IDS, diatonic_chords
+from key_estimator import KeyEstimator
+
+
+class ProgressionState:
+    """Per-session chord-change and key state
+
+    Everything a session needs beyond this (chord templates, key weights,
+    Roman numeral maps, the pattern automaton, CQT kernels) is a shared,
+    read-only table built once per process, so this is a few hundred bytes.
+    """
+
+    __slots__ = ("last_chord", "chord_start_time", "key_estimator", "key_id", "key_confidence")
+
+    def __init__(self):
+        self.last_chord = None
+        self.chord_start_time = None
+        self.key_estimator = KeyEstimator()  # Live key, decayed over recent chord changes
+        self.key_id = None  # harmony key id; current_key is its name
+        self.key_confidence = 0
+
+    @property
+    def current_key(self):
+        return KEY_NAMES[self.key_id] if self.key_id is not None else None
+
+    @current_key.setter
+    def current_key(self, name):
+        self.key_id = KEY_IDS.get(name) if name else None
+
+    def update_key(self, chord_index):
+        """Fold a chord change into the key estimate; returns True if the key changed"""
+        changed = self.key_estimator.update(chord_index)
+        if self.key_estimator.key is not None:
+            self.key_confidence = self.key_estimator.confidence
+        if changed:
+            self.key_id = self.key_estimator.key
+        return changed
+
+    def diatonic_chords(self):
+        """Diatonic triads of the current key, in scale order"""
+        return diatonic_chords(self.key_id) if self.key_id is not None else []
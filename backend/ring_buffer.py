@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+
+
+class AudioRingBuffer:
+    """Preallocated float32 ring buffer for mono audio
+
+    Samples are stored twice (a mirrored buffer of 2 * capacity), so any window
+    of up to `capacity` recent samples is one contiguous slice and can be
+    returned as a view instead of a copy.
+
+    Views stay valid until the next write. A reader sharing the buffer with
+    another writer thread (e.g. an audio callback) must copy the view or hold
+    `lock` while using it.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.lock = threading.Lock()
+        self._data = np.zeros(2 * self.capacity, dtype=np.float32)
+        self._written = 0  # total samples ever written
+        self._read = 0  # position of the consume() cursor
+        self.overruns = 0  # samples overwritten before consume() saw them
+
+    def __len__(self):
+        """Number of valid samples available for windowed reads"""
+        return min(self._written, self.capacity)
+
+    @property
+    def total_written(self):
+        return self._written
+
+    def write(self, samples):
+        """Append samples (any float/int array; converted in place into the buffer)"""
+        samples = np.asarray(samples).reshape(-1)
+        with self.lock:
+            total = len(samples)
+            if total > self.capacity:
+                samples = samples[-self.capacity:]
+            n = len(samples)
+            cap = self.capacity
+
+            start = (self._written + total - n) % cap
+            first = min(n, cap - start)
+            self._data[start:start + first] = samples[:first]
+            self._data[start + cap:start + cap + first] = samples[:first]
+            rest = n - first
+            if rest:
+                self._data[:rest] = samples[first:]
+                self._data[cap:cap + rest] = samples[first:]
+
+            self._written += total
+
+    def _window(self, n):
+        end = self._written % self.capacity + self.capacity
+        return self._data[end - n:end]
+
+    def latest(self, n):
+        """Contiguous view of the most recent n samples (fewer if not yet written)"""
+        with self.lock:
+            return self._window(min(n, len(self)))
+
+    def peak(self, n):
+        """Largest absolute value among the most recent n samples (0.0 if none)"""
+        with self.lock:
+            window = self._window(min(n, len(self)))
+            return float(np.max(np.abs(window))) if len(window) else 0.0
+
+    def pending(self):
+        """Samples written since the last consume()"""
+        return self._written - self._read
+
+    def consume(self, copy=False):
+        """Return everything written since the last consume() and advance the cursor"""
+        with self.lock:
+            new = self._written - self._read
+            n = min(new, self.capacity)
+            self.overruns += new - n
+            self._read = self._written
+            window = self._window(n)
+            return window.copy() if copy else window
+
+    def clear(self):
+        """Forget all samples (storage is kept)"""
+        with self.lock:
+            self._written = 0
+            self._read = 0
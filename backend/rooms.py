@@ -0,0 +1,109 @@
+import os
+import secrets
+
+from outbound import Outbox, encode_message
+
+# Rooms (one performer streaming to many listeners), configurable per deployment:
+#   HARMONIQ_ROOM_QUEUE_SIZE     messages queued per listener before chord events are dropped
+#   HARMONIQ_ROOM_MAX_LISTENERS  listeners per room
+ROOM_QUEUE_SIZE = int(os.environ.get("HARMONIQ_ROOM_QUEUE_SIZE", 64))
+MAX_LISTENERS = int(os.environ.get("HARMONIQ_ROOM_MAX_LISTENERS", 500))
+
+# Latest message of these types is replayed to late joiners so they can make
+# sense of the stream (key_detected is only sent when the key changes)
+STICKY_TYPES = ("session_started", "key_detected", "quality_changed")
+
+
+class Room:
+    """A performer's live stream, fanned out to listeners
+
+    publish() never waits on a listener: each message is encoded once per
+    encoding in use and put on every listener's Outbox, whose own writer task
+    does the sending. A slow listener only ever delays (and eventually drops
+    chord events for) itself.
+    """
+
+    def __init__(self, room_id, max_listeners=MAX_LISTENERS):
+        self.room_id = room_id
+        self.max_listeners = max_listeners
+        self.listeners = {}  # websocket -> Outbox
+        self.sticky = {}  # message type -> latest message
+        self.messages_published = 0
+        self.closed = False
+
+    def join(self, websocket, encoding):
+        """Add a listener (None if the room is full) and catch it up on the sticky state"""
+        if self.closed or len(self.listeners) >= self.max_listeners:
+            return None
+        listener = Outbox(websocket, encoding, queue_size=ROOM_QUEUE_SIZE)
+        listener.put({"type": "room_joined", "room": self.room_id})
+        for message in self.sticky.values():
+            listener.put(message)
+        self.listeners[websocket] = listener
+        return listener
+
+    def leave(self, websocket):
+        listener = self.listeners.pop(websocket, None)
+        if listener:
+            listener.close()
+
+    def publish(self, message):
+        message_type = message.get("type")
+        if message_type == "session_started":
+            self.sticky.clear()
+        elif message_type == "session_ended":
+            self.sticky.pop("session_started", None)
+        if message_type in STICKY_TYPES:
+            self.sticky[message_type] = message
+
+        frames = {}
+        for listener in self.listeners.values():
+            frame = frames.get(listener.encoding)
+            if frame is None:
+                frame = frames[listener.encoding] = encode_message(message, listener.encoding)
+            listener.put(message, frame)
+        self.messages_published += 1
+
+    def close(self, reason="performer_left"):
+        """Tell listeners the room is over; their writers stop after the last frame"""
+        self.publish({"type": "room_closed", "room": self.room_id, "reason": reason})
+        self.closed = True
+        for listener in self.listeners.values():
+            listener.finish()
+
+    def stats(self):
+        return {
+            "room": self.room_id,
+            "listeners": len(self.listeners),
+            "messages_published": self.messages_published,
+            "messages_dropped": sum(sum(listener.dropped.values()) for listener in self.listeners.values()),
+        }
+
+
+class RoomRegistry:
+    """Open rooms on this worker process, by id"""
+
+    def __init__(self):
+        self.rooms = {}
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def open(self, room_id=None):
+        """New room (random id unless one is asked for); None if the id is taken"""
+        room_id = room_id or secrets.token_urlsafe(6)
+        if room_id in self.rooms:
+            return None
+        room = self.rooms[room_id] = Room(room_id)
+        return room
+
+    def get(self, room_id):
+        return self.rooms.get(room_id)
+
+    def close(self, room_id, reason="performer_left"):
+        room = self.rooms.pop(room_id, None)
+        if room:
+            room.close(reason)
+
+    def listener_count(self):
+        return sum(len(room.listeners) for room in self.rooms.values())
@@ -0,0 +1,261 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# Persistent session history, configurable per deployment:
+#   HARMONIQ_SESSION_DB  SQLite database path ("" disables persistence)
+SESSION_DB = os.environ.get("HARMONIQ_SESSION_DB",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), "harmoniq_sessions.db"))
+
+BATCH_SIZE = 256  # chord events per write transaction at most
+FLUSH_INTERVAL = 0.5  # seconds a queued write may wait for a batch to fill
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    session_id INTEGER,
+    start_time REAL NOT NULL,
+    end_time REAL,
+    confidence_threshold REAL,
+    feature_extractor TEXT,
+    detected_key TEXT,
+    duration REAL,
+    chord_count INTEGER DEFAULT 0,
+    unique_chords INTEGER DEFAULT 0,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS chord_events (
+    session TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    timestamp_ms INTEGER NOT NULL,
+    chord TEXT NOT NULL,
+    confidence REAL,
+    volume REAL,
+    roman TEXT,
+    key TEXT
+);
+CREATE TABLE IF NOT EXISTS favorites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    artist TEXT,
+    key TEXT,
+    chord_sequence TEXT NOT NULL,
+    tags TEXT
+);
+DROP INDEX IF EXISTS sessions_start_time;
+DROP INDEX IF EXISTS sessions_detected_key;
+CREATE INDEX IF NOT EXISTS sessions_start_time_id ON sessions(start_time, id);
+CREATE INDEX IF NOT EXISTS sessions_end_time ON sessions(end_time);
+CREATE INDEX IF NOT EXISTS sessions_key_start_time_id ON sessions(detected_key, start_time, id);
+CREATE INDEX IF NOT EXISTS chord_events_session_time ON chord_events(session, timestamp_ms);
+CREATE INDEX IF NOT EXISTS chord_events_key ON chord_events(key);
+"""
+
+SESSION_COLUMNS = ("id", "session_id", "start_time", "end_time", "confidence_threshold", "feature_extractor",
+                   "detected_key", "duration", "chord_count", "unique_chords")
+EVENT_COLUMNS = ("timestamp_ms", "chord", "confidence", "volume", "roman", "key")
+FAVORITE_COLUMNS = ("id", "name", "artist", "key", "chord_sequence", "tags")
+
+
+def connect(path):
+    """SQLite connection tuned for one writer and many readers (also across processes)"""
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+class SessionStore:
+    """SQLite store of finished and in-progress sessions
+
+    The live path only ever enqueues: a background writer thread drains the
+    queue and commits chord events in batches, so a slow disk never delays a
+    chord_detected message. Reads (and rare writes such as favorites) use their
+    own connection.
+    """
+
+    def __init__(self, path=SESSION_DB, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        with connect(path) as conn:
+            conn.executescript(SCHEMA)
+        self._conn = connect(path)
+        self._conn_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self.events_written = 0
+        self.write_errors = 0
+        self._writer = threading.Thread(target=self._write_loop, name="session-store-writer", daemon=True)
+        self._writer.start()
+
+    # --- Write path (non-blocking) ---
+
+    def start_session(self, session_id, confidence_threshold, feature_extractor):
+        """Record a new session; returns its store id"""
+        store_id = uuid.uuid4().hex
+        self._queue.put(("start", (store_id, session_id, time.time(), confidence_threshold, feature_extractor)))
+        return store_id
+
+    def record_chord(self, store_id, chord_data, key=None):
+        """Queue one chord_detected event"""
+        self._queue.put(("chord", (store_id, chord_data["timestamp_ms"], chord_data["chord"],
+                                   chord_data["confidence"], chord_data["volume"], chord_data["roman"], key)))
+
+    def finish_session(self, store_id, summary):
+        """Queue the session_summary payload; the chord history itself is stored as events"""
+        self._queue.put(("finish", (store_id, time.time(), summary)))
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is written"""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self):
+        """Write what's queued and stop the writer"""
+        self._queue.put(("close", None))
+        self._writer.join()
+        self._conn.close()
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        pending = []
+        while True:
+            try:
+                op, args = self._queue.get(timeout=self.flush_interval if pending else None)
+            except queue.Empty:
+                op, args = None, None
+
+            if op == "chord":
+                pending.append(args)
+                if len(pending) < self.batch_size:
+                    continue
+            # Anything but another chord (or a quiet queue) flushes the batch first,
+            # so events always land after their session row and before its summary
+            try:
+                with conn:
+                    if pending:
+                        conn.executemany(f"INSERT INTO chord_events (session, {', '.join(EVENT_COLUMNS)}) "
+                                         f"VALUES (?, ?, ?, ?, ?, ?, ?)", pending)
+                        self.events_written += len(pending)
+                    if op == "start":
+                        conn.execute("INSERT INTO sessions (id, session_id, start_time, confidence_threshold, "
+                                     "feature_extractor) VALUES (?, ?, ?, ?, ?)", args)
+                    elif op == "finish":
+                        self._write_summary(conn, *args)
+            except sqlite3.Error as e:
+                self.write_errors += 1
+                print(f"❌ Error writing session store: {e}")
+            pending = []
+
+            if op == "flush":
+                args.set()
+            elif op == "close":
+                conn.close()
+                return
+
+    @staticmethod
+    def _write_summary(conn, store_id, end_time, summary):
+        summary = {key: value for key, value in summary.items() if key not in ("type", "chord_history")}
+        conn.execute(
+            "UPDATE sessions SET end_time = ?, detected_key = ?, duration = ?, chord_count = ?, "
+            "unique_chords = ?, summary = ? WHERE id = ?",
+            (end_time, summary.get("detected_key"), summary.get("duration"), summary.get("chord_count", 0),
+             summary.get("unique_chords", 0), json.dumps(summary), store_id))
+
+    # --- Read path ---
+
+    def _query(self, sql, params=()):
+        with self._conn_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def list_sessions(self, limit=DEFAULT_PAGE_SIZE, before=None, key=None, before_id=None):
+        """Newest sessions first; page with before/before_id = start_time/id of the last session seen
+
+        Sessions can share a start_time, so the cursor is the (start_time, id)
+        pair; before alone still works but skips ties at the page boundary.
+        """
+        limit = max(1, min(MAX_PAGE_SIZE, int(limit)))
+        where, params = [], []
+        if before is not None and before_id is not None:
+            where.append("(start_time, id) < (?, ?)")
+            params += [float(before), before_id]
+        elif before is not None:
+            where.append("start_time < ?")
+            params.append(float(before))
+        if key:
+            where.append("detected_key = ?")
+            params.append(key)
+        sql = f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self._query(sql + " ORDER BY start_time DESC, id DESC LIMIT ?", params + [limit + 1])
+        sessions = [dict(row) for row in rows[:limit]]
+        more = len(rows) > limit
+        return {
+            "sessions": sessions,
+            "next_before": sessions[-1]["start_time"] if more else None,
+            "next_before_id": sessions[-1]["id"] if more else None,
+        }
+
+    def get_session(self, store_id):
+        """One session with its stored summary, or None"""
+        rows = self._query(f"SELECT {', '.join(SESSION_COLUMNS)}, summary FROM sessions WHERE id = ?", (store_id,))
+        if not rows:
+            return None
+        session = dict(rows[0])
+        session["summary"] = json.loads(session["summary"]) if session["summary"] else None
+        return session
+
+    def chord_events(self, store_id, after=0, limit=MAX_PAGE_SIZE):
+        """A session's chord events in time order; page with after=<seq of the last event seen>"""
+        limit = max(1, min(MAX_PAGE_SIZE, int(limit)))
+        rows = self._query(f"SELECT rowid AS seq, {', '.join(EVENT_COLUMNS)} FROM chord_events "
+                           f"WHERE session = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                           (store_id, int(after), limit + 1))
+        events = [dict(row) for row in rows[:limit]]
+        return {
+            "events": events,
+            "next_after": events[-1]["seq"] if len(rows) > limit else None,
+        }
+
+    def finished_sessions(self, ended_after=None):
+        """Finished sessions, oldest end first, each with its chord sequence"""
+        sql = "SELECT id, session_id, start_time, end_time, detected_key FROM sessions WHERE end_time IS NOT NULL"
+        params = ()
+        if ended_after is not None:
+            sql += " AND end_time > ?"
+            params = (ended_after,)
+        for row in self._query(sql + " ORDER BY end_time", params):
+            session = dict(row)
+            session["chords"] = [chord for (chord,) in self._query(
+                "SELECT chord FROM chord_events WHERE session = ? ORDER BY timestamp_ms, rowid", (row["id"],))]
+            yield session
+
+    # --- Favorites ---
+
+    def add_favorite(self, name, chord_sequence, artist=None, key=None, tags=None):
+        """Save a favorite progression (chord_sequence as text or a list of tokens); returns it with its id"""
+        if isinstance(chord_sequence, (list, tuple)):
+            chord_sequence = "-".join(chord_sequence)
+        with self._conn_lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO favorites (name, artist, key, chord_sequence, tags) VALUES (?, ?, ?, ?, ?)",
+                (name, artist, key, chord_sequence, tags))
+        return {"id": cursor.lastrowid, "name": name, "artist": artist, "key": key,
+                "chord_sequence": chord_sequence, "tags": tags}
+
+    def list_favorites(self):
+        return [dict(row) for row in self._query(f"SELECT {', '.join(FAVORITE_COLUMNS)} FROM favorites ORDER BY id")]
+
+    def delete_favorite(self, favorite_id):
+        """Returns whether the favorite existed"""
+        with self._conn_lock, self._conn:
+            return self._conn.execute("DELETE FROM favorites WHERE id = ?", (favorite_id,)).rowcount > 0
@@ -0,0 +1,205 @@
+import functools
+
+import numpy as np
+import librosa
+import scipy.fft
+
+from ring_buffer import AudioRingBuffer
+
+# Defaults match the librosa.feature.chroma_cqt calls used by the detectors
+DEFAULT_HOP_LENGTH = 512
+DEFAULT_FMIN = librosa.note_to_hz('C2')
+BINS_PER_OCTAVE = 36
+N_OCTAVES = 7
+# Largest block of new audio analysed in one pass (bounds the working set)
+MAX_BLOCK_HOPS = 32
+# Frame size of the cheaper STFT chroma (128 ms at 16 kHz; bins too wide below ~C4)
+STFT_N_FFT = 2048
+
+
+@functools.lru_cache(maxsize=16)
+def cqt_kernel(sr, fmin=DEFAULT_FMIN, bins_per_octave=BINS_PER_OCTAVE, n_octaves=N_OCTAVES):
+    """Build the sparse spectral CQT filter bank for one (sr, fmin, resolution)
+
+    Returns (fft_basis, n_fft, chroma_map). Filters are right-aligned in the
+    n_fft frame so every bin looks at the most recent audio, which keeps
+    streaming latency down to each filter's own length.
+    """
+    # Keep only bins safely below Nyquist (e.g. 16 kHz input loses the top octave)
+    freqs = librosa.cqt_frequencies(bins_per_octave * n_octaves, fmin=fmin, bins_per_octave=bins_per_octave)
+    freqs = freqs[freqs < 0.45 * sr]
+
+    basis, lengths = librosa.filters.wavelet(
+        freqs=freqs, sr=sr, filter_scale=1, norm=1, pad_fft=True, window='hann'
+    )
+    n_fft = basis.shape[1]
+
+    # The spectral inner product below correlates the frame with the time-reversed
+    # filter, so starting each filter at index 1 makes it cover the newest samples
+    for i in range(len(basis)):
+        first = np.flatnonzero(basis[i])[0]
+        basis[i] = np.roll(basis[i], 1 - first)
+
+    # Same normalization as librosa's CQT (including scale=True)
+    basis *= lengths[:, np.newaxis] / float(n_fft)
+    fft_basis = np.fft.fft(basis, n=n_fft, axis=1)[:, :n_fft // 2 + 1]
+    fft_basis /= np.sqrt(lengths)[:, np.newaxis]
+    fft_basis = librosa.util.sparsify_rows(fft_basis, quantile=0.01, dtype=np.complex64)
+
+    chroma_map = librosa.filters.cq_to_chroma(len(freqs), bins_per_octave=bins_per_octave, fmin=fmin)
+    return fft_basis, n_fft, chroma_map
+
+
+@functools.lru_cache(maxsize=16)
+def stft_chroma_filter(sr, n_fft=STFT_N_FFT):
+    """Analysis window and (12, n_fft // 2 + 1) chroma filter bank for STFT chroma"""
+    window = librosa.filters.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+    return window, librosa.filters.chroma(sr=sr, n_fft=n_fft).astype(np.float32)
+
+
+class StreamingChroma:
+    """Incremental CQT chroma: only new hops are analysed as audio arrives
+
+    Keeps a rolling (12, history_frames) chroma matrix plus per-hop energy so
+    callers can average the most recent window without recomputing it.
+    """
+
+    def __init__(self, sr, hop_length=DEFAULT_HOP_LENGTH, fmin=DEFAULT_FMIN,
+                 bins_per_octave=BINS_PER_OCTAVE, n_octaves=N_OCTAVES, history_frames=128,
+                 max_block_hops=MAX_BLOCK_HOPS):
+        self.fft_basis, n_fft, self.chroma_map = cqt_kernel(sr, fmin, bins_per_octave, n_octaves)
+        self._init_stream(sr, hop_length, n_fft, history_frames, max_block_hops)
+
+    def _init_stream(self, sr, hop_length, n_fft, history_frames, max_block_hops):
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+
+        # Sample history: one analysis frame plus a block of new hops, zero-primed
+        self._max_block = max_block_hops * hop_length
+        self._audio = AudioRingBuffer(self.n_fft + self._max_block)
+        self._audio.write(np.zeros(self.n_fft, dtype=np.float32))
+        self._unframed = 0  # samples received since the last completed frame
+
+        self.history_frames = history_frames
+        self._chroma = np.zeros((12, history_frames), dtype=np.float32)
+        self._energy = np.zeros(history_frames, dtype=np.float32)
+        self._write = 0
+        self.frames_computed = 0
+        self.samples_seen = 0
+
+    def frames_for(self, seconds):
+        """Number of chroma frames covering the given duration"""
+        return max(1, int(round(seconds * self.sr / self.hop_length)))
+
+    def push(self, samples):
+        """Feed new mono float32 samples; returns the number of new chroma frames"""
+        return self.process(samples)[0].shape[1]
+
+    def process(self, samples):
+        """Feed new samples and return (chroma (12, n), energy (n,)) for the new frames"""
+        samples = np.asarray(samples, dtype=np.float32)
+        self.samples_seen += len(samples)
+
+        chroma_blocks = []
+        energy_blocks = []
+        for start in range(0, len(samples), self._max_block):
+            block = samples[start:start + self._max_block]
+            self._audio.write(block)
+            self._unframed += len(block)
+            chroma, energy = self._analyse_ready_frames()
+            chroma_blocks.append(chroma)
+            energy_blocks.append(energy)
+
+        if not chroma_blocks:
+            return np.zeros((12, 0), dtype=np.float32), np.zeros(0, dtype=np.float32)
+        if len(chroma_blocks) == 1:
+            return chroma_blocks[0], energy_blocks[0]
+        return np.concatenate(chroma_blocks, axis=1), np.concatenate(energy_blocks)
+
+    def _analyse_ready_frames(self):
+        n_frames = self._unframed // self.hop_length
+        if n_frames <= 0:
+            return np.zeros((12, 0), dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+        # Frames end on hop boundaries; leftover samples wait for the next push
+        leftover = self._unframed - n_frames * self.hop_length
+        span = self.n_fft + (n_frames - 1) * self.hop_length
+        audio = self._audio.latest(span + leftover)[:span]
+
+        frames = np.lib.stride_tricks.sliding_window_view(audio, self.n_fft)[::self.hop_length]
+        chroma = librosa.util.normalize(self._frames_to_chroma(frames), norm=np.inf, axis=0)
+
+        # Energy of the hop that completed each frame (used for volume gating)
+        hops = audio[self.n_fft - self.hop_length:]
+        energy = np.mean(hops.reshape(n_frames, self.hop_length) ** 2, axis=1)
+
+        self._store(chroma, energy)
+        self._unframed = leftover
+        return chroma, energy
+
+    def _frames_to_chroma(self, frames):
+        """Unnormalized (12, n) chroma for (n, n_fft) frames"""
+        spectrum = scipy.fft.rfft(frames, axis=1).T
+        cqt = np.abs(self.fft_basis.dot(spectrum))
+        return self.chroma_map.dot(cqt)
+
+    def _store(self, chroma, energy):
+        n = chroma.shape[1]
+        if n >= self.history_frames:
+            chroma, energy, n = chroma[:, -self.history_frames:], energy[-self.history_frames:], self.history_frames
+        idx = (self._write + np.arange(n)) % self.history_frames
+        self._chroma[:, idx] = chroma
+        self._energy[idx] = energy
+        self._write = (self._write + n) % self.history_frames
+        self.frames_computed += n
+
+    def _recent(self, n_frames):
+        n_frames = min(n_frames, self.frames_computed, self.history_frames)
+        return (self._write - n_frames + np.arange(n_frames)) % self.history_frames
+
+    def chroma(self, n_frames):
+        """Most recent chroma frames as a (12, n) matrix, oldest first"""
+        return self._chroma[:, self._recent(n_frames)]
+
+    def mean_chroma(self, n_frames):
+        """Average chroma over the most recent n_frames"""
+        idx = self._recent(n_frames)
+        if len(idx) == 0:
+            return np.zeros(12, dtype=np.float32)
+        return self._chroma[:, idx].mean(axis=1)
+
+    def volume(self, n_frames):
+        """RMS volume of the audio behind the most recent n_frames"""
+        idx = self._recent(n_frames)
+        if len(idx) == 0:
+            return 0.0
+        return float(np.sqrt(self._energy[idx].mean()))
+
+    def reset(self):
+        """Forget all audio and chroma history"""
+        self._audio.clear()
+        self._audio.write(np.zeros(self.n_fft, dtype=np.float32))
+        self._unframed = 0
+        self._chroma[:] = 0
+        self._energy[:] = 0
+        self._write = 0
+        self.frames_computed = 0
+        self.samples_seen = 0
+
+
+class StreamingStftChroma(StreamingChroma):
+    """Cheaper streaming chroma from a short STFT instead of the CQT
+
+    Same interface and history as StreamingChroma; trades low-note resolution
+    for a much smaller transform per hop.
+    """
+
+    def __init__(self, sr, hop_length=DEFAULT_HOP_LENGTH, n_fft=STFT_N_FFT, history_frames=128,
+                 max_block_hops=MAX_BLOCK_HOPS):
+        self.window, self.chroma_filter = stft_chroma_filter(sr, n_fft)
+        self._init_stream(sr, hop_length, n_fft, history_frames, max_block_hops)
+
+    def _frames_to_chroma(self, frames):
+        power = np.abs(scipy.fft.rfft(frames * self.window, axis=1)) ** 2
+        return self.chroma_filter.dot(power.T)
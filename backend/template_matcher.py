@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class TemplateMatcher:
+    """Chord templates compiled once into a normalized (n_chords, 12) matrix"""
+
+    def __init__(self, templates):
+        # Identical templates (C#/Db, Bm/Bdim, ...) collapse to one row named after
+        # the first entry, which is the chord the old per-template loop reported
+        self.names = []
+        rows = {}
+        for name, template in templates.items():
+            key = tuple(template)
+            if key not in rows:
+                rows[key] = len(self.names)
+                self.names.append(name)
+        matrix = np.array(list(rows.keys()), dtype=np.float64)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8
+        self.matrix = matrix / norms
+        self.matrix.setflags(write=False)
+
+    def score(self, chroma):
+        """Cosine scores against every template; chroma is (12,) or (n_frames, 12)"""
+        chroma = np.asarray(chroma)
+        norms = np.linalg.norm(chroma, axis=-1, keepdims=True) + 1e-8
+        return (chroma / norms) @ self.matrix.T
+
+    def match(self, chroma):
+        """Best chord and its score for a single (12,) chroma vector"""
+        scores = self.score(chroma)
+        best = int(np.argmax(scores))
+        return self.names[best], float(scores[best])
+
+    def match_batch(self, chromas):
+        """Best template index and score for each row of an (n_frames, 12) matrix"""
+        scores = self.score(chromas)
+        best = np.argmax(scores, axis=1)
+        return best, scores[np.arange(len(best)), best]
+
+    def top_k(self, chroma, k=3):
+        """Top-k (chord, score) pairs for a (12,) vector, or a list of them per frame"""
+        scores = self.score(chroma)
+        single = scores.ndim == 1
+        scores = np.atleast_2d(scores)
+        k = min(k, scores.shape[1])
+
+        # argpartition then sort the k survivors; stable so ties keep template order
+        top = np.sort(np.argpartition(-scores, k - 1, axis=1)[:, :k], axis=1)
+        rows = np.arange(len(scores))[:, None]
+        order = np.argsort(-scores[rows, top], axis=1, kind="stable")
+        top = top[rows, order]
+
+        results = [
+            [(self.names[i], float(frame_scores[i])) for i in frame_top]
+            for frame_top, frame_scores in zip(top, scores)
+        ]
+        return results[0] if single else results
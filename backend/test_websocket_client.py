@@ -4,6 +4,8 @@ import asyncio
 import websockets
 import json
 import time
+import numpy as np
+from audio_frames import encode_audio_frame
 
 async def test_websocket_connection():
     uri = "ws://localhost:8000/ws"
@@ -34,6 +36,10 @@ async def test_websocket_connection():
             }
             await websocket.send(json.dumps(audio_message))
             
+            # Test 2b: Same audio as a binary frame (int16 PCM with header)
+            print("\n🧪 Test 2b: Sending binary audio frame...")
+            await websocket.send(encode_audio_frame(np.zeros(1024, dtype=np.int16), sequence=0))
+
             # Wait a bit to see if we get any chord detections
             print("⏳ Waiting for potential chord detections...")
             try:
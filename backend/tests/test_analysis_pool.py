@@ -0,0 +1,77 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+
+from analysis_pool import AnalysisPool
+from audio_chord_detector import AudioChordDetector
+
+
+class SlowDetector:
+    """Stands in for AudioChordDetector; notes whether it was stopped mid-chunk"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.processing = False
+        self.stopped_while_processing = False
+        self.on_chord_detected = None
+        self.timings = None
+
+    def process_samples(self, samples, sample_rate=None, channels=1):
+        self.processing = True
+        self.started.set()
+        time.sleep(0.2)
+        self.processing = False
+
+    def stop(self):
+        self.stopped_while_processing = self.processing
+
+
+def test_close_waits_for_the_running_chunk():
+    async def run():
+        pool = AnalysisPool("thread", workers=1)
+        detector = SlowDetector()
+        lane = pool.open_lane(detector)
+        lane.submit(np.zeros(1024, dtype=np.int16), 16000)
+        await asyncio.to_thread(detector.started.wait, 1)
+        await lane.close()
+        detector.stop()  # What stop_session does next
+        pool.shutdown()
+        return detector
+    detector = asyncio.run(run())
+    assert detector.started.is_set() and not detector.stopped_while_processing
+
+
+def test_process_shard_restarts_after_its_worker_dies():
+    t = np.arange(16000) / 16000
+    triad = (sum(np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.0)) * 5000).astype(np.int16)
+    detections = []
+
+    async def run():
+        pool = AnalysisPool("process", workers=1)
+        detector = AudioChordDetector()
+        detector.on_chord_detected = lambda chord, confidence, volume: detections.append(chord)
+        lane = pool.open_lane(detector)
+        pid = await asyncio.wrap_future(pool.shard_executor(0).submit(os.getpid))
+        os.kill(pid, signal.SIGKILL)
+        async def analyse():
+            analysed = lane.last_analysed
+            lane.submit(triad, 16000)
+            for _ in range(200):
+                await asyncio.sleep(0.05)
+                if lane.last_analysed != analysed:
+                    return True
+            return False
+
+        await analyse()  # Fails on the dead worker
+        await analyse()
+        new_pid = await asyncio.wrap_future(pool.shard_executor(0).submit(os.getpid))
+        await lane.close()
+        pool.shutdown()
+        return pid, new_pid
+    pid, new_pid = asyncio.run(run())
+    assert new_pid != pid
+    assert detections == ["C"]  # The replacement worker analyses the next chunk
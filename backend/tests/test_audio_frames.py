@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from audio_frames import (FORMAT_INT16, FRAME_HEADER, FRAME_MAGIC, FrameError, decode_audio_frame,
+                          encode_audio_frame, to_mono_float32)
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.float32])
+def test_round_trip(dtype):
+    samples = (np.arange(8) * 100).astype(dtype)
+    frame = decode_audio_frame(encode_audio_frame(samples, 2 ** 32 + 5, sample_rate=48000, channels=2))
+    assert (frame.sequence, frame.sample_rate, frame.channels) == (5, 48000, 2)
+    assert frame.samples.dtype == dtype
+    np.testing.assert_array_equal(frame.samples, samples)
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"HQ\x01", "too short"),
+    (FRAME_HEADER.pack(b"XX", FORMAT_INT16, 1, 16000, 0), "magic"),
+    (FRAME_HEADER.pack(FRAME_MAGIC, 9, 1, 16000, 0), "sample format"),
+    (FRAME_HEADER.pack(FRAME_MAGIC, FORMAT_INT16, 0, 16000, 0), "stream layout"),
+    (FRAME_HEADER.pack(FRAME_MAGIC, FORMAT_INT16, 1, 0, 0), "stream layout"),
+    (FRAME_HEADER.pack(FRAME_MAGIC, FORMAT_INT16, 2, 16000, 0) + b"\x00" * 6, "whole number"),
+])
+def test_decode_errors(data, message):
+    with pytest.raises(FrameError, match=message):
+        decode_audio_frame(data)
+
+
+def test_to_mono_float32():
+    stereo = np.array([32767, -32768, 16384, 16384], dtype=np.int16)
+    np.testing.assert_allclose(to_mono_float32(stereo, 2), [-0.5 / 32768, 0.5], atol=1e-6)
+    floats = np.array([0.25, -0.5], dtype=np.float32)
+    assert to_mono_float32(floats) is floats  # No copy
@@ -0,0 +1,49 @@
+import pytest
+
+from harmony import DIATONIC, KEY_IDS, chord_id, chord_to_roman, diatonic_chords, UNKNOWN_CHORD
+
+
+@pytest.mark.parametrize("chord, key, roman", [
+    ("C", "C major", "I"),
+    ("Dm7", "C major", "ii7"),
+    ("Cmaj7", "C major", "IM7"),
+    ("G7", "C major", "V7"),
+    ("Bdim", "C major", "vii°"),
+    ("Am", "A minor", "i"),
+    ("Em", "A minor", "v"),
+    ("G", "A minor", "VII"),
+    ("C#", "C major", "(C#)"),
+])
+def test_chord_to_roman(chord, key, roman):
+    assert chord_to_roman(chord, key) == roman
+
+
+@pytest.mark.parametrize("chord, key, roman", [
+    ("A#", "F major", "IV"),  # The detector spells Bb as A#
+    ("Bb", "F major", "IV"),
+    ("D#", "C minor", "III"),
+    ("G#m", "E major", "iii"),
+    ("Abm", "E major", "iii"),
+    ("Db", "C# major", "I"),  # Keys spelled either way share an id
+    ("F#m", "Gb major", "(F#m)"),
+])
+def test_chord_to_roman_enharmonic(chord, key, roman):
+    assert chord_to_roman(chord, key) == roman
+
+
+def test_chord_to_roman_passes_through_without_a_key():
+    assert chord_to_roman("C", None) == "C"
+    assert chord_to_roman("C", "H major") == "C"
+    assert chord_to_roman("Csus4", "C major") == "(Csus4)"
+
+
+def test_diatonic_chords_are_spelled_for_the_key():
+    assert diatonic_chords(KEY_IDS["C major"]) == ["C", "Dm", "Em", "F", "G", "Am", "Bdim"]
+    assert diatonic_chords(KEY_IDS["F major"]) == ["F", "Gm", "Am", "Bb", "C", "Dm", "Edim"]
+    assert diatonic_chords(KEY_IDS["E minor"]) == ["Em", "F#dim", "G", "Am", "Bm", "C", "D"]
+    assert DIATONIC[KEY_IDS["F major"], chord_id("A#")]
+
+
+def test_unknown_chord_names():
+    assert chord_id("Unknown") == UNKNOWN_CHORD
+    assert chord_id("Csus4") == UNKNOWN_CHORD
@@ -0,0 +1,57 @@
+import pytest
+
+from harmony import KEY_IDS, chord_id
+from key_estimator import KeyEstimator, MIN_CHORDS
+
+
+def estimate(chords, repeats=3, **kwargs):
+    estimator = KeyEstimator(**kwargs)
+    for _ in range(repeats):
+        for chord in chords.split():
+            estimator.update(chord_id(chord))
+    return estimator
+
+
+@pytest.mark.parametrize("chords, key", [
+    ("Fm Bbm C Fm", "F minor"),
+    ("Am Dm E Am", "A minor"),
+    ("Cm Fm G Cm", "C minor"),
+    ("Am Dm E7 Am", "A minor"),
+    ("Ab Db Eb Ab", "Ab major"),
+    ("C F G C", "C major"),
+])
+@pytest.mark.parametrize("decay", [0.85, 1.0])
+def test_cadences_find_their_key(chords, key, decay):
+    assert estimate(chords, decay=decay).key_name == key
+
+
+def test_no_key_before_min_chords():
+    estimator = KeyEstimator()
+    for chord in ["C", "F", "G", "C"][:MIN_CHORDS - 1]:
+        assert not estimator.update(chord_id(chord))
+    assert estimator.key is None
+    assert estimator.estimate() == (None, 0.0)
+
+
+def test_update_reports_key_changes_once():
+    estimator = KeyEstimator()
+    changes = [estimator.update(chord_id(chord)) for chord in "C F G C F G C".split()]
+    assert changes.count(True) == 1
+    assert estimator.key == KEY_IDS["C major"]
+    assert 0 < estimator.confidence <= 2
+
+
+def test_hysteresis_and_modulation():
+    estimator = estimate("C F G C")
+    estimator.update(chord_id("D"))  # One out-of-key chord doesn't move it
+    assert estimator.key_name == "C major"
+    for _ in range(4):
+        for chord in "D G A D".split():
+            estimator.update(chord_id(chord))
+    assert estimator.key_name == "D major"
+
+
+def test_reset():
+    estimator = estimate("C F G C")
+    estimator.reset()
+    assert estimator.key is None and estimator.chords == 0 and not estimator.scores.any()
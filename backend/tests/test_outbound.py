@@ -0,0 +1,84 @@
+import asyncio
+
+from outbound import Outbox, decode_messages, encode_message, negotiate
+
+
+class SlowSocket:
+    """Stands in for a WebSocket whose client reads slowly"""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.frames = []
+        self.received = []
+
+    async def send_text(self, frame):
+        await asyncio.sleep(self.delay)
+        self.frames.append(frame)
+        self.received.extend(decode_messages(frame))
+
+    async def send_bytes(self, frame):
+        await self.send_text(frame)
+
+
+def flood(encoding="json", batch_window=0.0):
+    """Overfill a small outbox, then let it drain"""
+    async def run():
+        socket = SlowSocket()
+        outbox = Outbox(socket, encoding, batch_window, queue_size=8)
+        outbox.put({"type": "session_started"})
+        for i in range(100):
+            outbox.put({"type": "chord_detected", "i": i})
+            if i % 10 == 0:
+                outbox.put({"type": "key_detected", "key": i})
+        outbox.put({"type": "session_summary"})
+        outbox.finish()
+        await outbox.task
+        return socket, outbox
+    return asyncio.run(run())
+
+
+def test_drop_policies_under_backpressure():
+    socket, outbox = flood()
+    types = [message["type"] for message in socket.received]
+    # Reliable messages always arrive, in order
+    assert types[0] == "session_started" and types[-1] == "session_summary"
+    # Chord events give way, oldest first, so the newest survive
+    chords = [message["i"] for message in socket.received if message["type"] == "chord_detected"]
+    assert 0 < len(chords) < 100
+    assert chords == sorted(chords) and chords[-1] == 99
+    assert outbox.dropped["chord_detected"] == 100 - len(chords)
+    # Only the latest key is kept waiting
+    keys = [message["key"] for message in socket.received if message["type"] == "key_detected"]
+    assert keys[-1] == 90 and len(keys) + outbox.coalesced == 10
+    assert outbox.max_depth <= 9  # One reliable message may exceed the bound
+    stats = outbox.stats()
+    assert stats["dropped"] == sum(outbox.dropped.values()) and stats["queue_depth"] == 0
+
+
+def test_batched_msgpack_frames():
+    socket, outbox = flood("msgpack", batch_window=0.02)
+    assert all(isinstance(frame, bytes) for frame in socket.frames)
+    assert outbox.frames_sent == len(socket.frames) < outbox.messages_sent == len(socket.received)
+    assert socket.received[-1]["type"] == "session_summary"
+
+
+def test_closed_outbox_refuses_messages():
+    async def run():
+        outbox = Outbox(SlowSocket())
+        outbox.close()
+        return outbox.put({"type": "session_started"})
+    assert asyncio.run(run()) is False
+
+
+def test_negotiate():
+    assert negotiate([], {}) == ("json", None, 0.0)
+    assert negotiate(["harmoniq.msgpack"], {"encoding": "json"}) == ("msgpack", "harmoniq.msgpack", 0.0)
+    assert negotiate(["other"], {"encoding": "msgpack", "batch_ms": "20"}) == ("msgpack", None, 0.02)
+    assert negotiate([], {"encoding": "xml", "batch_ms": "9999"}) == ("json", None, 0.25)
+    assert negotiate([], {"batch_ms": "soon"})[2] == 0.0
+
+
+def test_encode_decode():
+    message = {"type": "chord_detected", "chord": "Am"}
+    assert decode_messages(encode_message(message)) == [message]
+    assert decode_messages(encode_message({"type": "batch", "messages": [message] * 2}, "msgpack")) == [message] * 2
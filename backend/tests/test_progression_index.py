@@ -0,0 +1,31 @@
+from progression_index import ProgressionIndex, build_index, sync_favorites
+from session_store import SessionStore
+
+
+def test_favorites_follow_the_store(tmp_path):
+    # Two workers sharing a store: favorites saved or deleted on one reach the other
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    try:
+        other, _ = build_index(store)
+        kept = store.add_favorite("Turnaround", "ii-V-I")
+        gone = store.add_favorite("Plagal", "IV-I")
+        sync_favorites(other, store.list_favorites())
+        assert other.search("V-I")["total"] == 1 and other.search("IV-I")["total"] == 1
+
+        store.delete_favorite(gone["id"])
+        sync_favorites(other, store.list_favorites())
+        assert set(other.documents) == {f"favorite:{kept['id']}"}
+        assert other.search("IV-I")["total"] == 0
+    finally:
+        store.close()
+
+
+def test_unstored_sessions_are_capped():
+    index = ProgressionIndex(max_unstored=3)
+    index.add_favorite({"id": 1, "chord_sequence": "I-IV-V"})
+    index.add_session("stored", ["C", "F", "G"], "C major")
+    for n in range(5):
+        index.add_session(f"live{n}", ["C", "F", "G"], "C major", stored=False)
+    assert set(index.documents) == {"favorite:1", "session:stored", "session:live2", "session:live3", "session:live4"}
+    assert index.search("I-IV-V")["total"] == 5
+    assert len(index.exact.sequences) == len(index.loose.sequences) == 5
@@ -0,0 +1,72 @@
+from live_chord_progression import COMMON_PROGRESSIONS
+from progression_matcher import ProgressionMatcher
+
+PATTERNS = {"ii-V-I": "Jazz turnaround", "V-I": "Authentic cadence", "I-IV-V": "Basic Blues", "IV-I": "Plagal cadence"}
+
+
+def names(matcher, ids):
+    return [matcher.patterns[pattern_id] for pattern_id in ids]
+
+
+def test_matches_end_at_the_last_numeral_longest_first():
+    matcher = ProgressionMatcher(PATTERNS)
+    state = matcher.feed(["vi", "ii", "V", "I"])
+    assert names(matcher, matcher.matches(state)) == ["ii-V-I", "V-I"]
+    assert matcher.describe(state) == "Jazz turnaround"
+
+
+def test_tokens_are_compared_whole():
+    matcher = ProgressionMatcher(PATTERNS)
+    state = matcher.feed(["IV", "I"])
+    assert names(matcher, matcher.matches(state)) == ["IV-I"]  # Not V-I
+
+
+def test_partial_matches():
+    matcher = ProgressionMatcher(PATTERNS)
+    state = matcher.feed(["I", "IV"])
+    assert names(matcher, matcher.partial(state)) == ["I-IV-V"]
+    assert matcher.describe(state) == "Part of Basic Blues"
+    assert matcher.partial(matcher.feed(["I"])) == []  # Too short to count
+
+
+def test_scan_agrees_with_a_naive_search():
+    matcher = ProgressionMatcher(COMMON_PROGRESSIONS)
+    tokens = "I-V-vi-IV-I-vi-IV-V-I-ii-V-I-IV-V-vi-IV-I-V".split("-")
+    found = matcher.scan(tokens)
+    for pattern_id, pattern in enumerate(matcher.patterns):
+        needle = pattern.split("-")
+        expected = sum(tokens[i:i + len(needle)] == needle for i in range(len(tokens)))
+        assert found[pattern_id] == expected, pattern
+
+
+def test_state_survives_unknown_numerals():
+    matcher = ProgressionMatcher(PATTERNS)
+    state = matcher.feed(["ii", "(C#)", "V", "I"])
+    assert names(matcher, matcher.matches(state)) == ["V-I"]
+
+
+def naive_partial(patterns, tokens, min_length=2):
+    """Patterns some suffix (at least min_length long) of tokens is a proper prefix of"""
+    found = set()
+    for pattern_id, pattern in enumerate(patterns):
+        needle = pattern.split("-")
+        for length in range(min_length, min(len(tokens), len(needle) - 1) + 1):
+            if tokens[len(tokens) - length:] == needle[:length]:
+                found.add(pattern_id)
+    return found
+
+
+def test_partial_through_a_shorter_suffix():
+    matcher = ProgressionMatcher({"I-V-vi-IV": "Axis", "V-vi-IV-I": "Axis variant"})
+    state = matcher.feed(["I", "V", "vi"])
+    # "I-V-vi" starts Axis; its suffix "V-vi" starts the variant
+    assert names(matcher, matcher.partial(state)) == ["I-V-vi-IV", "V-vi-IV-I"]
+
+
+def test_partial_agrees_with_a_naive_search():
+    matcher = ProgressionMatcher(COMMON_PROGRESSIONS)
+    tokens = "I-V-vi-IV-I-vi-IV-V-I-ii-V-I-IV-V-vi-IV-I-V-vi-ii-V".split("-")
+    state = 0
+    for end, token in enumerate(tokens, 1):
+        state = matcher.step(state, token)
+        assert set(matcher.partial(state)) == naive_partial(matcher.patterns, tokens[:end]), tokens[:end]
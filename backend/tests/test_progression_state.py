@@ -0,0 +1,37 @@
+import pytest
+
+from harmony import chord_id
+from live_chord_progression import ProgressionDetector
+from progression_state import ProgressionState
+
+
+def test_update_key_and_diatonic_chords():
+    state = ProgressionState()
+    assert state.current_key is None and state.diatonic_chords() == []
+    changes = [state.update_key(chord_id(chord)) for chord in "Am Dm E Am".split()]
+    assert changes == [False, False, True, False]
+    assert state.current_key == "A minor"
+    assert state.diatonic_chords() == ["Am", "Bdim", "C", "Dm", "Em", "F", "G"]
+    assert state.key_confidence > 0
+
+
+def test_current_key_setter():
+    state = ProgressionState()
+    state.current_key = "Bb major"
+    assert state.current_key == "Bb major"
+    state.current_key = "A# major"  # Enharmonic spelling, same key
+    assert state.current_key == "Bb major"
+    state.current_key = None
+    assert state.key_id is None
+
+
+def test_state_is_slotted():
+    with pytest.raises(AttributeError):
+        ProgressionState().chord_history = []
+
+
+def test_detector_shares_the_key_logic():
+    detector = ProgressionDetector()
+    for chord in "C F G C".split():
+        detector.update_key(chord_id(chord))
+    assert detector.current_key == "C major"
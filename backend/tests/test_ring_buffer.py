@@ -0,0 +1,48 @@
+import numpy as np
+
+from ring_buffer import AudioRingBuffer
+
+
+def test_latest_is_contiguous_across_wraparound():
+    buffer = AudioRingBuffer(8)
+    buffer.write(np.arange(6))
+    buffer.write(np.arange(6, 11))  # Wraps: storage holds 3..10
+    assert len(buffer) == 8
+    window = buffer.latest(8)
+    assert window.base is not None  # A view, not a copy
+    np.testing.assert_array_equal(window, np.arange(3, 11))
+    np.testing.assert_array_equal(buffer.latest(3), [8, 9, 10])
+
+
+def test_write_larger_than_capacity_keeps_the_tail():
+    buffer = AudioRingBuffer(4)
+    buffer.write(np.arange(10))
+    np.testing.assert_array_equal(buffer.latest(4), [6, 7, 8, 9])
+    assert buffer.total_written == 10
+
+
+def test_latest_before_full():
+    buffer = AudioRingBuffer(8)
+    buffer.write([1.0, 2.0])
+    np.testing.assert_array_equal(buffer.latest(5), [1.0, 2.0])
+
+
+def test_consume_and_overruns():
+    buffer = AudioRingBuffer(4)
+    buffer.write(np.arange(3))
+    np.testing.assert_array_equal(buffer.consume(copy=True), [0, 1, 2])
+    assert buffer.pending() == 0
+    buffer.write(np.arange(3, 9))  # 6 new samples, only 4 fit
+    assert buffer.pending() == 6
+    np.testing.assert_array_equal(buffer.consume(), [5, 6, 7, 8])
+    assert buffer.overruns == 2
+
+
+def test_peak_and_clear():
+    buffer = AudioRingBuffer(4)
+    assert buffer.peak(4) == 0.0
+    buffer.write([0.5, -0.9, 0.1, 0.2, 0.3])
+    assert buffer.peak(4) == np.float32(0.9)
+    assert buffer.peak(2) == np.float32(0.3)
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.pending() == 0
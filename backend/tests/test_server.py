@@ -0,0 +1,180 @@
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import pytest
+
+# No database, and only the 16 kHz kernels warmed (by the client fixture); set
+# before the server module reads them
+os.environ["HARMONIQ_SESSION_DB"] = ""
+os.environ["HARMONIQ_WARMUP"] = "0"
+
+from fastapi import WebSocketDisconnect  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import warmup  # noqa: E402
+import websocket_server  # noqa: E402
+from audio_frames import encode_audio_frame  # noqa: E402
+from benchmark_detection import synthesize_progression  # noqa: E402
+from outbound import decode_messages  # noqa: E402
+from session_store import SessionStore  # noqa: E402
+
+CHUNK = 4096
+PROGRESSION = ["C", "G", "Am", "F"] * 2
+
+
+@pytest.fixture(scope="module")
+def client():
+    warmup.warm_up(rates=(16000,))  # A cold first chunk would stall the stream
+    with TestClient(websocket_server.app) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def pcm():
+    audio, _ = synthesize_progression(PROGRESSION, sr=16000, seconds_per_chord=1.0)
+    return (audio * 32767).astype(np.int16)
+
+
+def receive(websocket):
+    frame = websocket.receive()
+    return decode_messages(frame["bytes"] if frame.get("bytes") is not None else frame["text"])
+
+
+def receive_until(websocket, message_type):
+    """Counter of message types received, up to and including message_type; and that message"""
+    seen = Counter()
+    while True:
+        for message in receive(websocket):
+            seen[message["type"]] += 1
+            if message["type"] == message_type:
+                return seen, message
+
+
+def stream(websocket, pcm):
+    # Faster than real time; a warm analysis lane keeps up with this
+    for sequence, start in enumerate(range(0, len(pcm), CHUNK)):
+        websocket.send_bytes(encode_audio_frame(pcm[start:start + CHUNK], sequence))
+        time.sleep(0.1)
+    time.sleep(0.5)
+
+
+@pytest.mark.parametrize("query", ["", "?encoding=msgpack&batch_ms=50"])
+def test_session(client, pcm, query):
+    with client.websocket_connect("/ws" + query) as websocket:
+        websocket.send_json({"type": "start_session"})
+        started = receive(websocket)[0]
+        assert started["type"] == "session_started"
+        assert started["encoding"] == ("msgpack" if query else "json")
+
+        stream(websocket, pcm)
+        websocket.send_json({"type": "stop_session"})
+        seen, summary = receive_until(websocket, "session_summary")
+
+    assert seen["chord_detected"] >= len(PROGRESSION)
+    assert seen["key_detected"] == 1  # Only sent when the key changes
+    assert summary["detected_key"] == "C major"
+    assert set(PROGRESSION) <= set(summary["analysis"]["chord_frequency"])
+
+
+def test_room(client, pcm):
+    with client.websocket_connect("/ws") as performer:
+        performer.send_json({"type": "open_room", "room": "lesson"})
+        opened = performer.receive_json()
+        assert opened["listen_path"] == "/ws/rooms/lesson"
+
+        with client.websocket_connect("/ws/rooms/missing") as stray:
+            assert stray.receive_json()["type"] == "error"
+
+        with client.websocket_connect("/ws/rooms/lesson") as json_listener, \
+                client.websocket_connect("/ws/rooms/lesson?encoding=msgpack") as msgpack_listener:
+            assert client.get("/rooms").json()["rooms"][0]["listeners"] == 2
+            performer.send_json({"type": "start_session"})
+            performer.receive_json()
+            stream(performer, pcm)
+
+            # A late joiner is caught up on the session and key
+            with client.websocket_connect("/ws/rooms/lesson") as late:
+                caught_up = [receive(late)[0]["type"] for _ in range(3)]
+            assert caught_up == ["room_joined", "session_started", "key_detected"]
+
+            performer.send_json({"type": "stop_session"})
+            performer.send_json({"type": "close_room"})
+            counts = [receive_until(listener, "room_closed")[0] for listener in (json_listener, msgpack_listener)]
+
+    assert counts[0] == counts[1]
+    assert counts[0]["chord_detected"] >= len(PROGRESSION) and counts[0]["session_summary"] == 1
+    assert client.get("/rooms").json()["rooms"] == []
+
+
+def test_session_is_finished_after_a_connection_error(client, pcm, tmp_path, monkeypatch):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    monkeypatch.setattr(websocket_server, "session_store", store)
+    try:
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"type": "start_session"})
+            store_id = receive(websocket)[0]["store_id"]
+            stream(websocket, pcm[:len(pcm) // 2])
+            websocket.send_text("not json")  # Not a disconnect: the generic error path
+            with pytest.raises(WebSocketDisconnect) as closed:
+                while True:
+                    websocket.receive_text()
+            assert closed.value.code == 1011
+        assert store.flush(5)
+        session = store.get_session(store_id)
+        assert session["end_time"] is not None and session["summary"]["detected_key"] == "C major"
+        assert f"session:{store_id}" in websocket_server.progression_index.documents
+        assert not websocket_server.active_sessions
+    finally:
+        store.close()
+
+
+def test_favorite_validation(client, tmp_path, monkeypatch):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    monkeypatch.setattr(websocket_server, "session_store", store)
+    try:
+        for sequence in (42, ["ii", 5, "I"], {"ii": "V"}):
+            response = client.post("/favorites", json={"name": "Bad", "chord_sequence": sequence})
+            assert response.status_code == 400
+        assert client.post("/favorites", json={"name": "Bad", "chord_sequence": "I-V", "tags": ["x"]}).status_code == 400
+        saved = client.post("/favorites", json={"name": "Cadence", "chord_sequence": ["ii", "V", "I"]}).json()
+        assert saved["chord_sequence"] == "ii-V-I"
+        matches = client.get("/progressions/search", params={"q": "V-I", "type": "favorite"}).json()["matches"]
+        assert [match["id"] for match in matches] == [f"favorite:{saved['id']}"]
+        assert client.delete(f"/favorites/{saved['id']}").status_code == 200
+    finally:
+        store.close()
+
+
+def test_rooms_are_refused_with_multiple_workers(client, tmp_path, monkeypatch):
+    # HARMONIQ_STATE_DIR is set exactly when the server runs with -w N > 1
+    monkeypatch.setattr(websocket_server, "STATE_DIR", str(tmp_path))
+    with client.websocket_connect("/ws") as performer:
+        performer.send_json({"type": "open_room", "room": "shared"})
+        reply = performer.receive_json()
+    assert reply["type"] == "error" and "multiple workers" in reply["message"]
+    assert client.get("/rooms").json()["rooms"] == []
+
+
+def test_update_threshold_reaches_the_detector(client):
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "start_session"})
+        assert receive(websocket)[0]["type"] == "session_started"
+        session = next(session for session in websocket_server.active_sessions.values() if session.is_active)
+        timings = session.timings
+
+        websocket.send_json({"type": "update_threshold", "confidence_threshold": 0.9})
+        assert receive(websocket)[0] == {"type": "threshold_updated", "confidence_threshold": 0.9}
+        assert session.audio_detector.config()["confidence_threshold"] == pytest.approx(0.72)
+
+        websocket.send_json({"type": "stop_session"})
+        receive_until(websocket, "session_summary")
+        websocket.send_json({"type": "start_session"})
+        receive_until(websocket, "session_started")
+        assert session.timings is not timings  # Each session reports its own stage timings
+        websocket.send_json({"type": "stop_session"})
+        receive_until(websocket, "session_summary")
+
+    with pytest.raises(AttributeError):
+        session.detector = None
@@ -0,0 +1,37 @@
+import pytest
+
+from session_store import SessionStore, connect
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    yield store
+    store.close()
+
+
+def add_sessions(store, start_times):
+    with connect(store.path) as conn:
+        conn.executemany("INSERT INTO sessions (id, session_id, start_time) VALUES (?, ?, ?)",
+                         [(f"s{i:02d}", i, start_time) for i, start_time in enumerate(start_times)])
+
+
+def test_paging_keeps_sessions_sharing_a_start_time(store):
+    add_sessions(store, [100.0] * 5 + [50.0] * 3 + [10.0])
+    seen, before, before_id = [], None, None
+    while True:
+        page = store.list_sessions(limit=2, before=before, before_id=before_id)
+        seen += [session["id"] for session in page["sessions"]]
+        if page["next_before"] is None:
+            break
+        before, before_id = page["next_before"], page["next_before_id"]
+    assert sorted(seen) == [f"s{i:02d}" for i in range(9)] and len(seen) == 9
+    start_times = [session["start_time"] for session in store.list_sessions(limit=9)["sessions"]]
+    assert start_times == sorted(start_times, reverse=True)
+
+
+def test_favorite_sequences(store):
+    saved = store.add_favorite("Turnaround", ["ii", "V", "I"], key="C major")
+    assert saved["chord_sequence"] == "ii-V-I"
+    assert store.list_favorites()[0]["chord_sequence"] == "ii-V-I"
+    assert store.delete_favorite(saved["id"]) and not store.delete_favorite(saved["id"])
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from live_chord_recognizer import CHORD_TEMPLATES, TEMPLATE_MATCHER
+from template_matcher import TemplateMatcher
+
+
+def loop_match(chroma):
+    """The per-template loop TemplateMatcher replaced"""
+    chroma_norm = chroma / (np.linalg.norm(chroma) + 1e-8)
+    max_score, matched_chord = -1, "Unknown"
+    for chord, template in CHORD_TEMPLATES.items():
+        template_norm = np.array(template) / (np.linalg.norm(template) + 1e-8)
+        score = np.dot(chroma_norm, template_norm)
+        if score > max_score:
+            max_score, matched_chord = score, chord
+    return matched_chord, max_score
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_match_agrees_with_the_loop(seed):
+    rng = np.random.default_rng(seed)
+    for chroma in rng.random((200, 12)) ** 3:
+        chord, score = TEMPLATE_MATCHER.match(chroma)
+        expected_chord, expected_score = loop_match(chroma)
+        assert chord == expected_chord
+        assert score == pytest.approx(expected_score)
+
+
+def test_templates_match_themselves():
+    for chord, template in CHORD_TEMPLATES.items():
+        name, score = TEMPLATE_MATCHER.match(np.array(template, dtype=float))
+        assert score == pytest.approx(1.0)
+        assert CHORD_TEMPLATES[name] == template  # Duplicates report the first spelling
+
+
+def test_batch_and_top_k():
+    rng = np.random.default_rng(7)
+    chromas = rng.random((10, 12))
+    best, scores = TEMPLATE_MATCHER.match_batch(chromas)
+    for chroma, index, score in zip(chromas, best, scores):
+        assert (TEMPLATE_MATCHER.names[index], pytest.approx(score)) == TEMPLATE_MATCHER.match(chroma)
+
+    top = TEMPLATE_MATCHER.top_k(chromas[0], 3)
+    assert len(top) == 3 and top[0][0] == TEMPLATE_MATCHER.match(chromas[0])[0]
+    assert [score for _, score in top] == sorted((score for _, score in top), reverse=True)
+    assert len(TEMPLATE_MATCHER.top_k(chromas, 2)) == 10
+
+
+def test_identical_templates_collapse():
+    matcher = TemplateMatcher({"C#": [0, 1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0], "Db": [0, 1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0]})
+    assert matcher.names == ["C#"]
@@ -0,0 +1,54 @@
+import os
+import time
+
+# Cold start, configurable per deployment:
+#   HARMONIQ_WARMUP       "0" skips building and exercising the analysis kernels at startup
+#   HARMONIQ_NUMBA_CACHE  numba's compiled-function cache; keep it on a persistent volume
+#                         (or bake it into the image) so new pods skip JIT compilation
+NUMBA_CACHE = os.environ.get("HARMONIQ_NUMBA_CACHE",
+                             os.path.join(os.path.expanduser("~"), ".cache", "harmoniq", "numba"))
+
+# numba reads this once, when librosa first imports it, so this module must be
+# imported before anything that imports librosa. Worker processes inherit it.
+os.environ.setdefault("NUMBA_CACHE_DIR", NUMBA_CACHE)
+
+# Client sample rates prepared up front: analysed natively (16/22.05 kHz) or
+# stream-resampled (44.1/48 kHz, the usual phone and desktop rates)
+WARMUP_RATES = (16000, 22050, 44100, 48000)
+WARMUP_SECONDS = 1.0
+
+
+def warmup_enabled():
+    return os.environ.get("HARMONIQ_WARMUP", "1") != "0"
+
+
+def warm_up(rates=WARMUP_RATES):
+    """Import, build and run every analysis kernel a session can need; returns {step: seconds}
+
+    Covers the lazily imported librosa/scipy modules, each CQT and STFT filter
+    bank (one per analysis rate and quality level, cached for the process),
+    the soxr resamplers and any numba-compiled code, so the first chord of the
+    first session costs the same as any other.
+    """
+    timings = {}
+    started = time.perf_counter()
+    import numpy as np
+    from audio_chord_detector import AudioChordDetector, QUALITY_LEVELS
+    from feature_extractors import FEATURE_EXTRACTORS
+    timings["imports"] = time.perf_counter() - started
+
+    for rate in rates:
+        step = time.perf_counter()
+        t = np.arange(int(rate * WARMUP_SECONDS)) / rate
+        # A loud C major triad, so matching runs too (silence is skipped)
+        tone = sum(np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.0)) / 3
+        samples = (tone * 16000).astype(np.int16)
+        for extractor in FEATURE_EXTRACTORS:
+            for level in range(len(QUALITY_LEVELS)):
+                detector = AudioChordDetector(feature_extractor=extractor)
+                detector.set_quality(level)
+                detector.process_samples(samples, rate, 1)
+        timings[f"{rate} Hz"] = time.perf_counter() - step
+
+    timings["total"] = time.perf_counter() - started
+    return timings
@@ -1,16 +1,34 @@
+import argparse
 import asyncio
+import itertools
 import json
+import os
+import shutil
+import tempfile
 import time
 from datetime import datetime
 from typing import Dict, List, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import uvicorn
 import numpy as np
-import librosa
-from enhanced_chord_detector import ChordDetector
-from live_chord_progression import ProgressionDetector
-from collections import deque
+from warmup import warm_up, warmup_enabled  # Before librosa: sets the numba cache directory
+from audio_chord_detector import AudioChordDetector, DEFAULT_ANALYSIS_HOP, QUALITY_LEVELS
+from feature_extractors import FEATURE_EXTRACTORS, DEFAULT_EXTRACTOR
+from audio_frames import decode_audio_frame, FrameError
+from analysis_pool import AnalysisPool, ANALYSIS_BACKEND, ANALYSIS_WORKERS, ANALYSIS_QUEUE_SIZE
+from live_chord_progression import PATTERN_MATCHER
+from progression_state import ProgressionState
+from harmony import ROMAN, chord_id
+from metrics import StageTimings, GLOBAL_TIMINGS, render_prometheus
+from load_shedding import DegradationController
+from worker_state import STATE_DIR, read_states, publish_forever, remove_state
+from session_store import SessionStore, SESSION_DB, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from progression_index import (ProgressionIndex, to_romans, build_index, stored_sessions, index_sessions,
+                               sync_favorites, REFRESH_INTERVAL)
+from outbound import Outbox, negotiate, encode_message
+from rooms import RoomRegistry
 
 app = FastAPI(title="Harmoniq WebSocket Server")
 
@@ -27,117 +45,126 @@ class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
         self.session_data: Dict = {}
+        self.outboxes: Dict[WebSocket, Outbox] = {}
         
     async def connect(self, websocket: WebSocket):
-        await websocket.accept()
+        # Clients pick JSON or msgpack (and an optional batch window) when connecting
+        encoding, subprotocol, batch_window = negotiate(websocket.scope.get("subprotocols"),
+                                                        websocket.query_params)
+        await websocket.accept(subprotocol=subprotocol)
         self.active_connections.append(websocket)
+        self.outboxes[websocket] = Outbox(websocket, encoding, batch_window)
         
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox:
+            outbox.close()
             
     async def send_personal_message(self, message: dict, websocket: WebSocket):
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            print(f"Error sending message: {e}")
+        outbox = self.outboxes.get(websocket)
+        if outbox:
+            outbox.put(message)
             
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except Exception as e:
-                print(f"Error broadcasting message: {e}")
+        """Queue one message on every connection, encoded once per encoding"""
+        outboxes = list(self.outboxes.values())
+        frames = {encoding: encode_message(message, encoding) for encoding in {o.encoding for o in outboxes}}
+        for outbox in outboxes:
+            outbox.put(message, frames[outbox.encoding])
 
 manager = ConnectionManager()
-
-class AudioChordDetector:
-    """Chord detector that processes audio data from WebSocket clients"""
-
-    def __init__(self, confidence_threshold=0.6):
-        self.chord_detector = ChordDetector(confidence_threshold=confidence_threshold)
-        self.audio_buffer = deque(maxlen=8192)  # Buffer for incoming audio
-        self.sample_rate = 16000  # Flutter app sample rate
-        self.on_chord_detected = None
-
-    def process_audio_data(self, audio_bytes):
-        """Process incoming audio data and detect chords"""
-        try:
-            # Convert bytes to numpy array (assuming 16-bit PCM)
-            audio_data = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
-            print(f"🎵 Received audio data: {len(audio_data)} samples, buffer size: {len(self.audio_buffer)}")
-
-            # Check audio data range
-            if len(audio_data) > 0:
-                print(f"📊 Audio range: min={np.min(audio_data):.4f}, max={np.max(audio_data):.4f}, mean={np.mean(audio_data):.4f}")
-
-            # Add to buffer
-            self.audio_buffer.extend(audio_data)
-
-            # Process if we have enough data (about 0.5 seconds)
-            if len(self.audio_buffer) >= self.sample_rate // 2:
-                # Get the last 0.5 seconds of audio
-                chunk_size = self.sample_rate // 2
-                audio_chunk = np.array(list(self.audio_buffer)[-chunk_size:])
-
-                # Check if there's enough signal
-                volume = np.sqrt(np.mean(audio_chunk**2))
-                print(f"🔊 Audio volume: {volume:.4f}")
-
-                if volume < 0.01:  # Too quiet
-                    print("🔇 Audio too quiet, skipping...")
-                    return
-
-                # Resample audio to 22kHz to match ChordDetector expectations
-                audio_22k = librosa.resample(audio_chunk, orig_sr=self.sample_rate, target_sr=22050)
-
-                # Extract chroma features using the same method as ChordDetector
-                chroma = librosa.feature.chroma_cqt(
-                    y=audio_22k,
-                    sr=22050,
-                    hop_length=512,
-                    fmin=librosa.note_to_hz('C2')
-                )
-
-                if chroma.size == 0:
-                    print("❌ No chroma features extracted")
-                    return
-
-                # Average chroma over time
-                avg_chroma = np.mean(chroma, axis=1)
-                print(f"🎼 Chroma shape: {chroma.shape}, avg_chroma: {avg_chroma}")
-
-                # Detect chord
-                chord, confidence = self.chord_detector.match_chord(avg_chroma)
-                print(f"🎵 Detected: {chord} (confidence: {confidence:.3f})")
-
-                # Call callback if set
-                if self.on_chord_detected and chord != "Unknown":
-                    print(f"✅ Calling callback for chord: {chord}")
-                    self.on_chord_detected(chord, confidence, volume)
-                else:
-                    print(f"❌ No callback or unknown chord: {chord}")
-
-        except Exception as e:
-            print(f"Error processing audio data: {e}")
-
-    def stop(self):
-        """Stop the audio detector"""
-        self.audio_buffer.clear()
-        self.on_chord_detected = None
+analysis_pool = AnalysisPool(ANALYSIS_BACKEND, ANALYSIS_WORKERS, ANALYSIS_QUEUE_SIZE)
+connection_ids = itertools.count(1)
+degradation = DegradationController(analysis_pool, max_level=len(QUALITY_LEVELS) - 1)
+session_store = SessionStore(SESSION_DB) if SESSION_DB else None
+progression_index = ProgressionIndex()
+rooms = RoomRegistry()
 
 class HarmoniqSession:
+    __slots__ = ("websocket", "is_active", "session_id", "store_id", "start_time", "chord_history",
+                 "confidence_threshold", "event_loop", "analysis_lane", "last_sequence", "frames_received",
+                 "frames_missed", "connection_id", "timings", "room", "progression", "audio_detector")
+
     def __init__(self, websocket: WebSocket):
         self.websocket = websocket
-        self.detector = None
         self.is_active = False
         self.session_id = None
+        self.store_id = None
         self.start_time = None
         self.chord_history = []
         self.confidence_threshold = 0.7
         self.event_loop = None
+        self.analysis_lane = None
+        self.last_sequence = None
+        self.frames_received = 0
+        self.frames_missed = 0
+        self.connection_id = next(connection_ids)
+        self.timings = None  # StageTimings, one per started session
+        self.room = None
+        self.progression = None
+        self.audio_detector = None
+
+    @property
+    def metrics_label(self):
+        """Label for this session's series on /metrics (session ids are per-second)"""
+        return f"{os.getpid()}:{self.session_id}:{self.connection_id}"
         
-    async def start_session(self, confidence_threshold: float = 0.7):
+    def publish(self, message):
+        """Queue for this client and, if it's performing to a room, for every listener"""
+        if self.room:
+            self.room.publish(message)
+        outbox = manager.outboxes.get(self.websocket)
+        if outbox:
+            outbox.put(message)
+
+    def outbound_metrics(self):
+        outbox = manager.outboxes.get(self.websocket)
+        return {
+            "outbound_queue_depth": outbox.depth if outbox else 0,
+            "outbound_dropped": sum(outbox.dropped.values()) if outbox else 0,
+        }
+
+    async def open_room(self, room_id=None):
+        """Start streaming this connection's sessions to a room listeners can join"""
+        if self.room:
+            await manager.send_personal_message({
+                "type": "error",
+                "message": f"Already performing in room {self.room.room_id}"
+            }, self.websocket)
+            return
+        if STATE_DIR:
+            # Rooms live in the performer's worker process, and listeners' connections
+            # are spread across all workers, so most of them could never join
+            await manager.send_personal_message({
+                "type": "error",
+                "message": "Rooms are not available when the server runs multiple workers"
+            }, self.websocket)
+            return
+        self.room = rooms.open(room_id)
+        if self.room is None:
+            await manager.send_personal_message({
+                "type": "error",
+                "message": f"Room {room_id} already exists"
+            }, self.websocket)
+            return
+        print(f"🏫 Room {self.room.room_id} opened")
+        await manager.send_personal_message({
+            "type": "room_opened",
+            "room": self.room.room_id,
+            "listen_path": f"/ws/rooms/{self.room.room_id}"
+        }, self.websocket)
+
+    async def close_room(self, reason="performer_left"):
+        if not self.room:
+            return
+        print(f"🏫 Room {self.room.room_id} closed ({len(self.room.listeners)} listeners)")
+        rooms.close(self.room.room_id, reason)
+        self.room = None
+
+    async def start_session(self, confidence_threshold: float = 0.7, analysis_hop_ms: Optional[int] = None,
+                            feature_extractor: str = DEFAULT_EXTRACTOR):
         """Start a new chord detection session"""
         if self.is_active:
             await manager.send_personal_message({
@@ -145,21 +172,48 @@ class HarmoniqSession:
                 "message": "Session already active"
             }, self.websocket)
             return
+
+        if feature_extractor not in FEATURE_EXTRACTORS:
+            await manager.send_personal_message({
+                "type": "error",
+                "message": f"Unknown feature extractor: {feature_extractor} "
+                           f"(available: {', '.join(FEATURE_EXTRACTORS)})"
+            }, self.websocket)
+            return
+
+        # Admission control: refuse new sessions rather than stall existing ones
+        streaming = sum(1 for session in active_sessions.values() if session.is_active)
+        if not degradation.admit(streaming):
+            await manager.send_personal_message({
+                "type": "error",
+                "message": "Server is at capacity, please try again shortly"
+            }, self.websocket)
+            return
             
         self.confidence_threshold = confidence_threshold
         self.start_time = datetime.now()
         self.chord_history = []
         self.session_id = int(time.time())
+        self.last_sequence = None
+        self.frames_received = 0
+        self.frames_missed = 0
+        self.timings = StageTimings(parent=GLOBAL_TIMINGS)
+        # Persisted in the background; never waits on the database
+        self.store_id = (session_store.start_session(self.session_id, confidence_threshold, feature_extractor)
+                         if session_store else None)
 
         # Store the current event loop for use in callbacks
         self.event_loop = asyncio.get_event_loop()
         
-        # Create full progression detector for advanced analysis
-        self.progression_detector = ProgressionDetector()
-        # Override the confidence threshold for mobile audio
-        self.progression_detector.mobile_confidence_threshold = 0.55
+        # Chord-change and key tracking; templates, key tables and kernels are shared
+        self.progression = ProgressionState()
         # Use lower confidence threshold for WebSocket (mobile audio is often noisier)
-        self.audio_detector = AudioChordDetector(confidence_threshold=max(0.5, confidence_threshold * 0.8))
+        # Chords are matched once per hop of new audio (client-configurable)
+        analysis_hop = analysis_hop_ms / 1000 if analysis_hop_ms else DEFAULT_ANALYSIS_HOP
+        self.audio_detector = AudioChordDetector(confidence_threshold=max(0.5, confidence_threshold * 0.8),
+                                                 analysis_hop=analysis_hop, feature_extractor=feature_extractor)
+        self.audio_detector.timings = self.timings
+        self.audio_detector.set_quality(degradation.level)
 
         # Set up callback for chord detection
         def websocket_callback(chord, confidence, volume):
@@ -168,75 +222,82 @@ class HarmoniqSession:
 
 
         self.audio_detector.on_chord_detected = websocket_callback
+        # Analysis runs on the worker pool; the lane keeps this session's chunks in order
+        self.analysis_lane = analysis_pool.open_lane(self.audio_detector)
         self.is_active = True
 
-        # Initialize progression tracking variables
-        self.last_chord = None
-        self.chord_start_time = None
-        
-        await manager.send_personal_message({
+        outbox = manager.outboxes.get(self.websocket)
+        if outbox:
+            outbox.timings = self.timings
+        self.publish({
             "type": "session_started",
             "session_id": self.session_id,
-            "confidence_threshold": confidence_threshold
-        }, self.websocket)
+            "store_id": self.store_id,
+            "confidence_threshold": confidence_threshold,
+            "analysis_hop_ms": int(self.audio_detector.analysis_hop * 1000),
+            "feature_extractor": feature_extractor,
+            "encoding": outbox.encoding if outbox else "json",
+            "batch_ms": outbox.batch_window * 1000 if outbox else 0
+        })
+        if degradation.level:
+            await self.send_quality(degradation.level, "overload")
+
+    async def send_quality(self, level, reason):
+        """Apply a server-wide quality level and tell the client about it"""
+        if not self.is_active:
+            return
+        self.audio_detector.set_quality(level)
+        self.publish({
+            "type": "quality_changed",
+            "level": level,
+            "quality": QUALITY_LEVELS[level]["name"],
+            "max_level": len(QUALITY_LEVELS) - 1,
+            "analysis_hop_ms": int(self.audio_detector.effective_hop() * 1000),
+            "reason": reason
+        })
 
     def _track_chord_progression(self, chord, confidence, volume):
         """Custom chord progression tracking with lower confidence threshold"""
         from datetime import datetime
         current_time = datetime.now()
+        started = time.perf_counter()
+        key_changed = False
 
         # Track chord changes for progression (lower confidence threshold for mobile)
-        if (chord != self.last_chord and
+        progression = self.progression
+        if (chord != progression.last_chord and
             chord != "Unknown" and
             confidence > 0.55):  # Lower threshold for mobile audio
 
-            if self.last_chord and self.chord_start_time:
-                # Calculate duration of previous chord
-                duration = (current_time - self.chord_start_time).total_seconds()
-                # Update the last entry with duration
-                if self.progression_detector.chord_history:
-                    self.progression_detector.chord_history[-1]['duration'] = duration
-
-            # Add new chord to progression detector's history
-            self.progression_detector.chord_history.append({
-                'chord': chord,
-                'time': current_time,
-                'confidence': confidence,
-                'duration': 0
-            })
-
-            self.last_chord = chord
-            self.chord_start_time = current_time
+            chord_index = chord_id(chord)
+            progression.last_chord = chord
+            progression.chord_start_time = current_time
 
             print(f"🎼 Added to progression: {chord} (confidence: {confidence:.2f})")
 
-            # Update key detection periodically
-            if len(self.progression_detector.chord_history) % 3 == 0:
-                recent_chords = [entry['chord'] for entry in self.progression_detector.chord_history[-8:]]
-                detected_key, key_confidence = self.progression_detector.detect_key(recent_chords)
-                if detected_key and key_confidence > 0.5:
-                    if self.progression_detector.current_key != detected_key:
-                        self.progression_detector.current_key = detected_key
-                        self.progression_detector.key_confidence = key_confidence
-                        print(f"🗝️  Key detected: {detected_key}")
+            # Streaming key estimate, updated on every chord change
+            key_changed = self.progression.update_key(chord_index)
+            if key_changed:
+                print(f"🗝️  Key detected: {self.progression.current_key}")
+
+        self.timings.observe("progression", time.perf_counter() - started)
 
         # Always send to WebSocket regardless of progression tracking
         try:
             if self.event_loop and self.event_loop.is_running():
                 # Send chord detection
+                # Only a cheap enqueue runs on the loop; the outbox writer does the
+                # sending, so a slow client can't pile up pending sends here
                 print(f"📤 Sending chord to WebSocket: {chord} (confidence: {confidence:.2f})")
-                asyncio.run_coroutine_threadsafe(
-                    self._send_chord_detected(chord, confidence, volume), self.event_loop
-                )
-
-                # Send key detection if available
-                if self.progression_detector.current_key:
-                    print(f"📤 Sending key to WebSocket: {self.progression_detector.current_key}")
-                    asyncio.run_coroutine_threadsafe(
-                        self._send_key_detected(
-                            self.progression_detector.current_key,
-                            self.progression_detector.key_confidence
-                        ), self.event_loop
+                self.event_loop.call_soon_threadsafe(self._chord_detected, chord, confidence, volume)
+
+                # Key and diatonic chords only go out when the key changes
+                if key_changed:
+                    print(f"📤 Sending key to WebSocket: {self.progression.current_key}")
+                    self.event_loop.call_soon_threadsafe(
+                        self._key_detected,
+                        self.progression.current_key,
+                        self.progression.key_confidence
                     )
             else:
                 print(f"❌ Event loop not available, chord detected: {chord} (confidence: {confidence:.2f})")
@@ -254,8 +315,42 @@ class HarmoniqSession:
             return
 
         try:
-            # Process the audio data
-            self.audio_detector.process_audio_data(audio_data)
+            # Queue raw 16-bit PCM for analysis off the event loop
+            with self.timings.time("decode"):
+                samples = np.frombuffer(audio_data, dtype=np.int16)
+            self.analysis_lane.submit(samples)
+        except Exception as e:
+            print(f"Error processing audio data: {e}")
+            await manager.send_personal_message({
+                "type": "error",
+                "message": f"Audio processing error: {str(e)}"
+            }, self.websocket)
+
+    async def process_audio_frame(self, frame_bytes):
+        """Process a binary audio frame (see audio_frames.py) from client"""
+        if not self.is_active:
+            return
+
+        try:
+            with self.timings.time("decode"):
+                frame = decode_audio_frame(frame_bytes)
+        except FrameError as e:
+            await manager.send_personal_message({
+                "type": "error",
+                "message": f"Invalid audio frame: {str(e)}"
+            }, self.websocket)
+            return
+
+        # Track sequence gaps so clients/load tests can spot lost frames
+        if self.last_sequence is not None:
+            gap = (frame.sequence - self.last_sequence - 1) & 0xFFFFFFFF
+            if gap and gap < 0x80000000:
+                self.frames_missed += gap
+        self.last_sequence = frame.sequence
+        self.frames_received += 1
+
+        try:
+            self.analysis_lane.submit(frame.samples, frame.sample_rate, frame.channels)
         except Exception as e:
             print(f"Error processing audio data: {e}")
             await manager.send_personal_message({
@@ -263,8 +358,8 @@ class HarmoniqSession:
                 "message": f"Audio processing error: {str(e)}"
             }, self.websocket)
             
-    async def _send_chord_detected(self, chord, confidence, volume):
-        """Send chord detection message via WebSocket"""
+    def _chord_detected(self, chord, confidence, volume):
+        """Record a chord detection and queue its message (runs on the event loop)"""
         if not self.is_active:
             return
             
@@ -273,8 +368,8 @@ class HarmoniqSession:
         
         # Get Roman numeral if key is detected
         roman = None
-        if self.progression_detector.current_key:
-            roman = self.progression_detector.chord_to_roman(chord, self.progression_detector.current_key)
+        if self.progression.key_id is not None:
+            roman = ROMAN[self.progression.key_id][chord_id(chord)]
             
         # Store in history (convert numpy types to Python types for JSON serialization)
         chord_data = {
@@ -285,6 +380,8 @@ class HarmoniqSession:
             "roman": str(roman) if roman else None
         }
         self.chord_history.append(chord_data)
+        if self.store_id:
+            session_store.record_chord(self.store_id, chord_data, self.progression.current_key)
         
         # Send WebSocket message
         message = {
@@ -292,18 +389,18 @@ class HarmoniqSession:
             **chord_data
         }
         print(f"📤 Sending WebSocket message: {message}")
-        await manager.send_personal_message(message, self.websocket)
+        self.publish(message)
         
-    async def _send_key_detected(self, key, confidence):
-        """Send key detection message via WebSocket"""
+    def _key_detected(self, key, confidence):
+        """Queue a key change with its diatonic chords (runs on the event loop)"""
         message = {
             "type": "key_detected",
             "key": key,
             "confidence": confidence,
-            "diatonic_chords": self.progression_detector.get_diatonic_chords(key) if self.progression_detector else []
+            "diatonic_chords": self.progression.diatonic_chords() if self.progression else []
         }
         print(f"📤 Sending key detection: {message}")
-        await manager.send_personal_message(message, self.websocket)
+        self.publish(message)
         
     async def stop_session(self):
         """Stop the current session"""
@@ -316,10 +413,14 @@ class HarmoniqSession:
             
         self.is_active = False
 
+        dropped_chunks = coalesced_chunks = 0
+        if self.analysis_lane:
+            dropped_chunks = self.analysis_lane.dropped_chunks
+            coalesced_chunks = self.analysis_lane.coalesced_chunks
+            await self.analysis_lane.close()
+            self.analysis_lane = None
         if self.audio_detector:
             self.audio_detector.stop()
-        if self.progression_detector:
-            self.progression_detector.stop()
             
         # Calculate session summary
         end_time = datetime.now()
@@ -342,7 +443,7 @@ class HarmoniqSession:
                 analysis["chord_frequency"][chord] = analysis["chord_frequency"].get(chord, 0) + 1
                 
         # Roman numeral progression
-        if self.progression_detector and self.progression_detector.current_key:
+        if self.progression and self.progression.current_key:
             analysis["roman_progression"] = [
                 entry.get("roman", entry["chord"])
                 for entry in self.chord_history
@@ -355,39 +456,51 @@ class HarmoniqSession:
                 if entry["chord"] != "Unknown"
             ]
         
+        # Every library progression played anywhere in the session (chord changes in the final key)
+        if self.progression and self.progression.current_key:
+            chord_changes = to_romans([entry["chord"] for entry in self.chord_history],
+                                      self.progression.current_key)
+            for pattern_id, count in PATTERN_MATCHER.scan(chord_changes).most_common():
+                analysis["patterns"].append({
+                    "pattern": PATTERN_MATCHER.patterns[pattern_id],
+                    "name": PATTERN_MATCHER.names[pattern_id],
+                    "count": count,
+                })
+
         # Send session ended message
-        await manager.send_personal_message({
+        self.publish({
             "type": "session_ended",
             "session_id": self.session_id
-        }, self.websocket)
+        })
         
         # Send session summary
-        await manager.send_personal_message({
+        outbox = manager.outboxes.get(self.websocket)
+        summary = {
             "type": "session_summary",
             "session_id": self.session_id,
+            "store_id": self.store_id,
             "duration": duration,
             "chord_count": len(self.chord_history),
             "unique_chords": len(unique_chords),
-            "detected_key": self.progression_detector.current_key if self.progression_detector else None,
+            "detected_key": self.progression.current_key if self.progression else None,
+            "frames_received": self.frames_received,
+            "frames_missed": self.frames_missed,
+            "chunks_dropped": dropped_chunks,
+            "chunks_coalesced": coalesced_chunks,
+            "stage_timings": self.timings.summary(),
+            "outbound": outbox.stats() if outbox else None,
             "chord_history": self.chord_history,
             "analysis": analysis
-        }, self.websocket)
-        
-    async def update_confidence_threshold(self, threshold: float):
-        """Update the confidence threshold during session"""
-        self.confidence_threshold = threshold
+        }
+        self.publish(summary)
+        if self.store_id:
+            session_store.finish_session(self.store_id, summary)
+        # Searchable right away on this worker; others pick it up from the store
+        progression_index.add_session(self.store_id or self.metrics_label,
+                                      [entry["chord"] for entry in self.chord_history], summary["detected_key"],
+                                      stored=bool(self.store_id), session_id=self.session_id,
+                                      start_time=self.start_time.timestamp())
         
-        if self.detector:
-            # Update the detector's threshold if possible
-            # Note: The current detector doesn't support dynamic threshold updates
-            # This would require modifying the detector class
-            pass
-            
-        await manager.send_personal_message({
-            "type": "threshold_updated",
-            "confidence_threshold": threshold
-        }, self.websocket)
-
 # Store active sessions
 active_sessions: Dict[WebSocket, HarmoniqSession] = {}
 
@@ -399,24 +512,46 @@ async def websocket_endpoint(websocket: WebSocket):
     
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            packet = await websocket.receive()
+            if packet["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(packet.get("code", 1000))
+
+            # Binary frames carry raw PCM audio; text frames carry JSON control messages
+            if packet.get("bytes") is not None:
+                await session.process_audio_frame(packet["bytes"])
+                continue
+
+            message = json.loads(packet["text"])
             
             message_type = message.get("type")
             
             if message_type == "start_session":
                 confidence_threshold = message.get("confidence_threshold", 0.7)
-                await session.start_session(confidence_threshold)
+                await session.start_session(confidence_threshold, message.get("analysis_hop_ms"),
+                                            message.get("feature_extractor", DEFAULT_EXTRACTOR))
                 
             elif message_type == "stop_session":
                 await session.stop_session()
                 
             elif message_type == "update_threshold":
                 threshold = message.get("confidence_threshold", 0.7)
-                await session.update_confidence_threshold(threshold)
+                session.confidence_threshold = threshold
+                if session.is_active:
+                    # Same mobile scaling as start_session; pool workers get it with the next chunk
+                    session.audio_detector.configure(confidence_threshold=max(0.5, threshold * 0.8))
+                await manager.send_personal_message({
+                    "type": "threshold_updated",
+                    "confidence_threshold": threshold
+                }, websocket)
+
+            elif message_type == "open_room":
+                await session.open_room(message.get("room"))
+
+            elif message_type == "close_room":
+                await session.close_room("closed")
 
             elif message_type == "audio_data":
-                # Handle incoming audio data from client
+                # Legacy JSON audio path (list of byte values), kept for old clients
                 audio_data = message.get("data")
                 if audio_data and session.is_active:
                     # Convert list of integers back to bytes
@@ -429,18 +564,261 @@ async def websocket_endpoint(websocket: WebSocket):
                     "message": f"Unknown message type: {message_type}"
                 }, websocket)
                 
-    except WebSocketDisconnect:
+    except Exception as e:
+        if not isinstance(e, WebSocketDisconnect):
+            print(f"WebSocket error: {e}")
+        # Either way the session is finished properly: stored, indexed, room closed
         manager.disconnect(websocket)
-        if websocket in active_sessions:
-            session = active_sessions[websocket]
+        session = active_sessions.pop(websocket, None)
+        if session:
             if session.is_active:
                 await session.stop_session()
-            del active_sessions[websocket]
-    except Exception as e:
-        print(f"WebSocket error: {e}")
-        manager.disconnect(websocket)
-        if websocket in active_sessions:
-            del active_sessions[websocket]
+            await session.close_room()
+        if not isinstance(e, WebSocketDisconnect):
+            try:
+                await websocket.close(code=1011)  # Internal error
+            except Exception:
+                pass  # Already gone
+
+@app.websocket("/ws/rooms/{room_id}")
+async def room_listener_endpoint(websocket: WebSocket, room_id: str):
+    """Listen to a performer's live stream (receive-only; same encodings as /ws)"""
+    encoding, subprotocol, _ = negotiate(websocket.scope.get("subprotocols"), websocket.query_params)
+    await websocket.accept(subprotocol=subprotocol)
+    room = rooms.get(room_id)
+    listener = room.join(websocket, encoding) if room else None
+    if listener is None:
+        reason = "Room is full" if room else f"Room {room_id} not found"
+        frame = encode_message({"type": "error", "message": reason}, encoding)
+        await (websocket.send_bytes(frame) if isinstance(frame, bytes) else websocket.send_text(frame))
+        await websocket.close(code=1008)
+        return
+
+    async def receive_until_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass  # Listeners have nothing to say
+
+    receiver = asyncio.create_task(receive_until_disconnect())
+    try:
+        # Ends when the listener leaves or the room closes and its last frame is out
+        await asyncio.wait({receiver, listener.task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        room.leave(websocket)
+        if not receiver.done():
+            receiver.cancel()
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+
+async def apply_quality_level(level, reason):
+    """Push a new quality level from the degradation controller to every session"""
+    sessions = [session for session in active_sessions.values() if session.is_active]
+    await asyncio.gather(*(session.send_quality(level, reason) for session in sessions))
+
+def collect_state():
+    """This worker's health and metrics as a JSON-serializable snapshot"""
+    sessions = [session for session in active_sessions.values() if session.is_active]
+    return {
+        "pid": os.getpid(),
+        "time": time.time(),
+        "active_connections": len(manager.active_connections),
+        "active_sessions": len(active_sessions),
+        "streaming_sessions": len(sessions),
+        "analysis_backend": analysis_pool.backend,
+        "analysis_workers": analysis_pool.workers,
+        "quality_level": degradation.level,
+        "load_pressure": degradation.pressure,
+        "rooms": len(rooms),
+        "room_listeners": rooms.listener_count(),
+        "timings": GLOBAL_TIMINGS.snapshot(),
+        "sessions": {
+            session.metrics_label: {
+                "timings": session.timings.snapshot(),
+                "frames_received": session.frames_received,
+                "frames_missed": session.frames_missed,
+                "chunks_dropped": session.analysis_lane.dropped_chunks if session.analysis_lane else 0,
+                **session.outbound_metrics(),
+            }
+            for session in sessions
+        },
+    }
+
+def cluster_states():
+    """Snapshots of every worker process (just this one unless HARMONIQ_STATE_DIR is set)"""
+    local = collect_state()
+    if not STATE_DIR:
+        return [local]
+    return [local] + [state for state in read_states(STATE_DIR) if state["pid"] != local["pid"]]
+
+async def refresh_progression_index(cursor):
+    """Index sessions finished, and favorites added or deleted, on other workers as they reach the store"""
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        try:
+            # Read in a thread, index on the event loop where searches run
+            sessions = await asyncio.to_thread(stored_sessions, session_store, cursor)
+            favorites = await asyncio.to_thread(session_store.list_favorites)
+            cursor = index_sessions(progression_index, sessions, cursor)
+            sync_favorites(progression_index, favorites)
+        except Exception as e:
+            print(f"❌ Error refreshing progression index: {e}")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global progression_index
+    if warmup_enabled():
+        # Startup finishes before uvicorn accepts connections, so no session pays for this
+        timings = await asyncio.to_thread(warm_up)
+        await asyncio.to_thread(analysis_pool.warm_up, warm_up)
+        print(f"🔥 Analysis kernels warmed up in {timings['total']:.2f}s "
+              f"(imports {timings['imports']:.2f}s)")
+    app.state.index_task = None
+    if session_store:
+        started = time.perf_counter()
+        progression_index, cursor = await asyncio.to_thread(build_index, session_store)
+        print(f"🔎 Indexed {len(progression_index)} stored progressions in {time.perf_counter() - started:.2f}s")
+        app.state.index_task = asyncio.create_task(refresh_progression_index(cursor))
+    app.state.degradation_task = asyncio.create_task(degradation.run(apply_quality_level))
+    app.state.publish_task = None
+    if STATE_DIR:
+        # Multi-worker mode: share this worker's state so any worker can answer /health and /metrics
+        app.state.publish_task = asyncio.create_task(publish_forever(STATE_DIR, collect_state))
+
+@app.on_event("shutdown")
+async def shutdown_analysis_pool():
+    app.state.degradation_task.cancel()
+    if app.state.index_task:
+        app.state.index_task.cancel()
+    if app.state.publish_task:
+        app.state.publish_task.cancel()
+        remove_state(STATE_DIR, os.getpid())
+    analysis_pool.shutdown()
+    if session_store:
+        session_store.close()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage timing histograms (all workers and per active session) for Prometheus"""
+    states = cluster_states()
+    global_timings = StageTimings()
+    session_timings = {}
+    counters = {"frames_received": {}, "frames_missed": {}, "chunks_dropped": {},
+                "outbound_queue_depth": {}, "outbound_dropped": {}}
+    for state in states:
+        global_timings.merge(state["timings"])
+        for label, session in state["sessions"].items():
+            session_timings[label] = StageTimings().merge(session["timings"])
+            for name, values in counters.items():
+                values[label] = session[name]
+
+    return render_prometheus(
+        global_timings,
+        session_timings,
+        gauges={
+            "harmoniq_workers": ("Server worker processes reporting", len(states)),
+            "harmoniq_active_connections": (
+                "Open WebSocket connections", sum(state["active_connections"] for state in states)),
+            "harmoniq_active_sessions": (
+                "Sessions currently streaming audio", sum(state["streaming_sessions"] for state in states)),
+            "harmoniq_rooms": ("Open performer rooms", sum(state["rooms"] for state in states)),
+            "harmoniq_room_listeners": (
+                "WebSockets listening to a room", sum(state["room_listeners"] for state in states)),
+            "harmoniq_quality_level": (
+                "Analysis quality level (0 = full)", {state["pid"]: state["quality_level"] for state in states}),
+            "harmoniq_load_pressure": (
+                "Analysis load relative to the latency target",
+                {state["pid"]: state["load_pressure"] for state in states}),
+        },
+        session_counters={
+            "harmoniq_session_frames_received_total": ("Binary audio frames received", counters["frames_received"]),
+            "harmoniq_session_frames_missed_total": (
+                "Audio frames lost in transit (sequence gaps)", counters["frames_missed"]),
+            "harmoniq_session_chunks_dropped_total": (
+                "Audio chunks dropped by a full analysis queue", counters["chunks_dropped"]),
+            "harmoniq_session_outbound_dropped_total": (
+                "Messages dropped for a client that couldn't keep up", counters["outbound_dropped"]),
+        },
+        session_gauges={
+            "harmoniq_session_outbound_queue_depth": (
+                "Messages waiting to be sent to the client", counters["outbound_queue_depth"]),
+        },
+    )
+
+@app.get("/sessions")
+async def list_sessions(limit: int = DEFAULT_PAGE_SIZE, before: Optional[float] = None, key: Optional[str] = None,
+                        before_id: Optional[str] = None):
+    """Past sessions, newest first; pass next_before/next_before_id back as before/before_id for the next page"""
+    if not session_store:
+        raise HTTPException(status_code=404, detail="Session persistence is disabled")
+    return await asyncio.to_thread(session_store.list_sessions, limit, before, key, before_id)
+
+@app.get("/sessions/{store_id}")
+async def get_session(store_id: str):
+    """One past session with its summary"""
+    session = await asyncio.to_thread(session_store.get_session, store_id) if session_store else None
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@app.get("/sessions/{store_id}/chords")
+async def get_session_chords(store_id: str, after: int = 0, limit: int = MAX_PAGE_SIZE):
+    """A past session's chord events in order; pass next_after back as after for the next page"""
+    if not session_store:
+        raise HTTPException(status_code=404, detail="Session persistence is disabled")
+    return await asyncio.to_thread(session_store.chord_events, store_id, after, limit)
+
+@app.get("/progressions/search")
+async def search_progressions(q: str, loose: bool = False, limit: int = DEFAULT_PAGE_SIZE,
+                              type: Optional[str] = None):
+    """Sessions and favorites containing a Roman-numeral progression, e.g. q=ii-V-I"""
+    started = time.perf_counter()
+    result = progression_index.search(q, loose=loose, limit=max(1, min(MAX_PAGE_SIZE, limit)), doc_type=type)
+    result["took_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+@app.get("/progressions/top")
+async def top_progressions(n: int = 4, limit: int = DEFAULT_PAGE_SIZE, loose: bool = False):
+    """Most frequent n-chord progressions (key-relative) across everything indexed"""
+    return {"n": n, "progressions": progression_index.top_progressions(n, max(1, min(MAX_PAGE_SIZE, limit)), loose)}
+
+@app.get("/favorites")
+async def list_favorites():
+    if not session_store:
+        raise HTTPException(status_code=404, detail="Session persistence is disabled")
+    return {"favorites": await asyncio.to_thread(session_store.list_favorites)}
+
+@app.post("/favorites")
+async def add_favorite(favorite: dict):
+    """Save a favorite progression: name, chord_sequence (Roman numerals or chords in key), artist, key, tags"""
+    if not session_store:
+        raise HTTPException(status_code=404, detail="Session persistence is disabled")
+    if not favorite.get("name") or not favorite.get("chord_sequence"):
+        raise HTTPException(status_code=400, detail="name and chord_sequence are required")
+    sequence = favorite["chord_sequence"]
+    if not (isinstance(sequence, str) or
+            (isinstance(sequence, list) and all(isinstance(token, str) for token in sequence))):
+        raise HTTPException(status_code=400, detail="chord_sequence must be a string or a list of strings")
+    for field in ("name", "artist", "key", "tags"):
+        if favorite.get(field) is not None and not isinstance(favorite[field], str):
+            raise HTTPException(status_code=400, detail=f"{field} must be a string")
+    saved = await asyncio.to_thread(
+        session_store.add_favorite, favorite["name"], favorite["chord_sequence"],
+        favorite.get("artist"), favorite.get("key"), favorite.get("tags"))
+    progression_index.add_favorite(saved)
+    return saved
+
+@app.delete("/favorites/{favorite_id}")
+async def delete_favorite(favorite_id: int):
+    if not session_store or not await asyncio.to_thread(session_store.delete_favorite, favorite_id):
+        raise HTTPException(status_code=404, detail="Favorite not found")
+    progression_index.remove(f"favorite:{favorite_id}")
+    return {"deleted": favorite_id}
+
+@app.get("/rooms")
+async def list_rooms():
+    """Open rooms (only a single-worker server hosts rooms)"""
+    return {"rooms": [room.stats() for room in rooms.rooms.values()]}
 
 @app.get("/")
 async def root():
@@ -448,20 +826,60 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    states = cluster_states()
     return {
         "status": "healthy",
-        "active_connections": len(manager.active_connections),
-        "active_sessions": len(active_sessions)
+        "workers": len(states),
+        "active_connections": sum(state["active_connections"] for state in states),
+        "active_sessions": sum(state["active_sessions"] for state in states),
+        "rooms": sum(state["rooms"] for state in states),
+        "room_listeners": sum(state["room_listeners"] for state in states),
+        "analysis_backend": analysis_pool.backend,
+        "analysis_workers": sum(state["analysis_workers"] for state in states),
+        "quality_level": max(state["quality_level"] for state in states),
+        "quality": QUALITY_LEVELS[max(state["quality_level"] for state in states)]["name"],
+        "load_pressure": max(state["load_pressure"] for state in states),
+        "worker_details": [
+            {key: state[key] for key in ("pid", "active_connections", "active_sessions",
+                                         "quality_level", "load_pressure")}
+            for state in states
+        ]
     }
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Harmoniq WebSocket server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="server processes; each WebSocket session stays on the worker that accepted it "
+                             "(performer rooms need a single worker)")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="skip building the analysis kernels at startup (first sessions pay instead)")
+    args = parser.parse_args(argv)
+    if args.no_warmup:
+        os.environ["HARMONIQ_WARMUP"] = "0"
+
     print("🎼 Starting Harmoniq WebSocket Server...")
-    print("🔗 WebSocket endpoint: ws://localhost:8000/ws")
-    print("🌐 Health check: http://localhost:8000/health")
-    
-    uvicorn.run(
-        app, 
-        host="0.0.0.0", 
-        port=8000,
-        log_level="info"
-    )
+    print(f"🔗 WebSocket endpoint: ws://localhost:{args.port}/ws")
+    print(f"🌐 Health check: http://localhost:{args.port}/health")
+
+    if args.workers <= 1:
+        uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+        return
+
+    # The kernel spreads new connections across workers sharing the socket; a
+    # WebSocket (and so its session) lives on one worker for its whole life.
+    # Workers inherit this environment before importing the app.
+    state_dir = os.environ.get("HARMONIQ_STATE_DIR") or tempfile.mkdtemp(prefix="harmoniq-workers-")
+    os.environ["HARMONIQ_STATE_DIR"] = state_dir
+    # Split analysis threads/processes across workers instead of N x all cores
+    os.environ.setdefault("HARMONIQ_ANALYSIS_WORKERS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+    print(f"👷 {args.workers} workers, shared state in {state_dir}")
+    try:
+        uvicorn.run("websocket_server:app", host=args.host, port=args.port, workers=args.workers,
+                    log_level="info")
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
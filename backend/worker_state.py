@@ -0,0 +1,61 @@
+import asyncio
+import json
+import os
+import time
+
+# Multi-worker deployments share health/metrics through small JSON files:
+#   HARMONIQ_STATE_DIR  directory every worker publishes its state to (unset = single process)
+STATE_DIR = os.environ.get("HARMONIQ_STATE_DIR")
+PUBLISH_INTERVAL = 1.0  # seconds between state snapshots
+STALE_AFTER = 5.0  # snapshots older than this belong to dead or hung workers
+
+
+def _state_path(state_dir, pid):
+    return os.path.join(state_dir, f"worker-{pid}.json")
+
+
+def write_state(state_dir, state):
+    """Atomically publish one worker's state snapshot"""
+    path = _state_path(state_dir, state["pid"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def read_states(state_dir, stale_after=STALE_AFTER):
+    """Fresh state snapshots of every worker"""
+    states = []
+    now = time.time()
+    try:
+        names = os.listdir(state_dir)
+    except OSError:
+        return states
+    for name in names:
+        if not (name.startswith("worker-") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(state_dir, name), encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue  # Being replaced or removed right now
+        if now - state.get("time", 0) <= stale_after:
+            states.append(state)
+    return states
+
+
+def remove_state(state_dir, pid):
+    try:
+        os.remove(_state_path(state_dir, pid))
+    except OSError:
+        pass
+
+
+async def publish_forever(state_dir, collect, interval=PUBLISH_INTERVAL):
+    """Write collect()'s snapshot every interval until cancelled"""
+    while True:
+        try:
+            write_state(state_dir, collect())
+        except Exception as e:
+            print(f"❌ Error publishing worker state: {e}")
+        await asyncio.sleep(interval)